@@ -0,0 +1,220 @@
+"""Per-client admission control and fair queueing for TCP commands.
+
+Every connection gets a token bucket and a bounded queue. A command that
+finds the bucket empty or the queue full is answered straight away with an
+explicit rejection instead of being dropped or left to pile up::
+
+    {"error": "Rate limit exceeded", "rejected": "rate", "retry_after": 0.04}
+    {"error": "Command queue full", "rejected": "queue_full", "queue_depth": 32}
+
+Admitted commands are dispatched with start-time fair queueing: each client
+is charged for the time its commands actually kept a worker busy, divided by
+its weight, and the backlogged client with the smallest start tag goes
+next. A client streaming moves as fast as it can therefore gets its share
+of the arm, not all of it. Commands from one client still run one at a
+time and in order.
+
+:class:`FairScheduler` is not thread-safe; :class:`tcp_server.CommandServer`
+only touches it from its event loop.
+"""
+
+import time
+from collections import deque
+
+
+DEFAULT_RATE = 100.0      # commands/s refilled into each client's bucket
+DEFAULT_BURST = 50        # bucket size
+DEFAULT_QUEUE_DEPTH = 32  # admitted commands waiting per client
+DEFAULT_WEIGHT = 1.0
+MIN_COST = 0.001          # s charged for a command, however quick it was
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate, burst, now=None):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.stamp = time.monotonic() if now is None else now
+
+    def take(self, now=None, cost=1.0):
+        """Spend ``cost`` tokens if available; returns whether it could"""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+    def retry_after(self, cost=1.0):
+        """Seconds until ``cost`` tokens will be available"""
+        if self.rate <= 0:
+            return None
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+
+class AdmissionPolicy:
+    """Limits applied to every connection.
+
+    ``weights`` maps a client host to its share of the arm relative to
+    ``DEFAULT_WEIGHT``. ``exempt(msg)`` selects commands (reset, cancel,
+    status, ...) that bypass the bucket and the queue entirely.
+    ``ordered(msg)`` selects connection settings (select, coalesce): they
+    also bypass both, but first wait for the client's earlier commands to
+    finish, and run before any later frame (binary poses included) is read.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST,
+                 queue_depth=DEFAULT_QUEUE_DEPTH, weights=None, exempt=None, ordered=None):
+        self.rate = rate
+        self.burst = burst
+        self.queue_depth = queue_depth
+        self.weights = dict(weights or {})
+        self.exempt = exempt
+        self.ordered = ordered
+
+    def weight_for(self, host):
+        weight = float(self.weights.get(host, DEFAULT_WEIGHT))
+        return weight if weight > 0 else DEFAULT_WEIGHT
+
+    def is_exempt(self, msg):
+        return self.exempt is not None and bool(self.exempt(msg))
+
+    def is_ordered(self, msg):
+        return self.ordered is not None and bool(self.ordered(msg))
+
+
+class ClientLane:
+    """Queue, bucket and fairness tags for one connection"""
+
+    __slots__ = ("client", "host", "bucket", "weight", "queue", "busy", "closed",
+                 "start_tag", "finish_tag", "admitted", "completed",
+                 "rejected_rate", "rejected_full", "service_time")
+
+    def __init__(self, client, host, policy, vtime):
+        self.client = client
+        self.host = host
+        self.bucket = TokenBucket(policy.rate, policy.burst)
+        self.weight = policy.weight_for(host)
+        self.queue = deque()
+        self.busy = False
+        self.closed = False
+        self.start_tag = vtime
+        self.finish_tag = vtime
+        self.admitted = 0
+        self.completed = 0
+        self.rejected_rate = 0
+        self.rejected_full = 0
+        self.service_time = 0.0
+
+    @property
+    def backlogged(self):
+        return self.busy or bool(self.queue)
+
+    def stats(self):
+        return {
+            "client": str(self.host),
+            "weight": self.weight,
+            "queued": len(self.queue),
+            "busy": self.busy,
+            "admitted": self.admitted,
+            "completed": self.completed,
+            "rejected_rate": self.rejected_rate,
+            "rejected_full": self.rejected_full,
+            "service_s": round(self.service_time, 3),
+        }
+
+
+class FairScheduler:
+    """Start-time fair queueing over per-client lanes"""
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.vtime = 0.0
+        self._lanes = {}
+
+    def add(self, key, host):
+        lane = ClientLane(key, host, self.policy, self.vtime)
+        self._lanes[key] = lane
+        return lane
+
+    def remove(self, key):
+        """Forget a client; returns the commands it still had queued"""
+        lane = self._lanes.pop(key, None)
+        if lane is None:
+            return []
+        lane.closed = True
+        dropped = list(lane.queue)
+        lane.queue.clear()
+        return dropped
+
+    def admit(self, key, item, now=None):
+        """Queue ``item`` for ``key``; returns ``None`` or a rejection reply"""
+        lane = self._lanes[key]
+        if len(lane.queue) >= self.policy.queue_depth:
+            lane.rejected_full += 1
+            return {"error": "Command queue full", "rejected": "queue_full",
+                    "queue_depth": self.policy.queue_depth}
+        if not lane.bucket.take(now):
+            lane.rejected_rate += 1
+            retry = lane.bucket.retry_after()
+            return {"error": "Rate limit exceeded", "rejected": "rate",
+                    "retry_after": None if retry is None else round(retry, 3)}
+
+        if not lane.backlogged:
+            # An idle client rejoins at the current virtual time; it does not
+            # get to spend credit saved up while it was quiet
+            lane.start_tag = max(self.vtime, lane.finish_tag)
+        lane.queue.append(item)
+        lane.admitted += 1
+        return None
+
+    def next(self):
+        """Pop the next command to run as ``(lane, item)``, or ``None``"""
+        best = None
+        for lane in self._lanes.values():
+            if lane.busy or not lane.queue:
+                continue
+            if best is None or lane.start_tag < best.start_tag:
+                best = lane
+        if best is None:
+            return None
+        best.busy = True
+        self.vtime = max(self.vtime, best.start_tag)
+        return best, best.queue.popleft()
+
+    def done(self, lane, elapsed):
+        """Charge ``lane`` for a finished command that took ``elapsed`` seconds"""
+        lane.busy = False
+        lane.completed += 1
+        lane.service_time += elapsed
+        lane.finish_tag = lane.start_tag + max(elapsed, MIN_COST) / lane.weight
+        if lane.queue:
+            lane.start_tag = max(self.vtime, lane.finish_tag)
+
+    def flush(self, keep=None):
+        """Drop queued commands (all, or those ``keep(lane, item)`` rejects).
+
+        Returns ``[(lane, item), ...]`` for the dropped commands.
+        """
+        dropped = []
+        for lane in list(self._lanes.values()):
+            kept = deque()
+            while lane.queue:
+                item = lane.queue.popleft()
+                if keep is not None and keep(lane, item):
+                    kept.append(item)
+                else:
+                    dropped.append((lane, item))
+            lane.queue = kept
+        return dropped
+
+    def stats(self):
+        lanes = list(self._lanes.values())
+        return {
+            "clients": [lane.stats() for lane in lanes],
+            "queued": sum(len(lane.queue) for lane in lanes),
+            "rejected": sum(lane.rejected_rate + lane.rejected_full for lane in lanes),
+        }
@@ -0,0 +1,163 @@
+"""Several xArm controllers served from one process.
+
+An :class:`ArmPool` is built from a ``{name: ip}`` mapping. Commands choose
+an arm with an ``"arm"`` field; commands without one go to the arm their
+connection selected, else the default (the first configured arm); see
+:meth:`ArmPool.route`. Each :class:`ArmUnit` gets its own single-thread
+executor and state cache. A slow ``wait=True`` move on one arm therefore
+only queues later moves for that arm and never ties up another arm or the
+TCP workers.
+
+Moves also reach an arm from the motion queue worker and the latest-wins
+follower, which run on their own threads. Every motion call on the
+controller therefore holds the unit's ``motion_lock``, so one arm never
+runs two moves at once whichever thread sends them.
+
+The pool itself knows nothing about xArm; ``connect(unit)`` passed to
+:meth:`ArmPool.connect` opens the controller and sets up whatever the
+application hangs off the unit (target slot, motion queue, servo streamer,
+telemetry sampler).
+"""
+
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+class ArmUnit:
+    """One controller and everything that must not be shared between arms"""
+
+    def __init__(self, name, ip, log=print):
+        self.name = name
+        self.ip = ip
+        self.log = log
+        self.arm = None    # XArmAPI once connected
+        self.state = None  # ArmStateCache once connected
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"arm-{name}")
+        # Held around set_position / run_trajectory; reset does not take it
+        # so it can still interrupt a stuck move
+        self.motion_lock = threading.Lock()
+        # Per-arm services, created by the application
+        self.slot = None
+        self.queue = None
+        self.servo = None
+        self.telemetry = None
+        self.recorder = None
+        self.target = None  # last commanded (x, y, z, roll, pitch, yaw)
+
+    @property
+    def connected(self):
+        return self.arm is not None
+
+    def submit(self, fn, *args, **kwargs):
+        """Run ``fn`` on this arm's executor; returns a ``concurrent.futures.Future``.
+
+        ``fn`` runs in a copy of the caller's context, so a traced command
+        keeps its trace and the time spent waiting for the arm shows up as
+        its ``arm_queue`` stage.
+        """
+        context = contextvars.copy_context()
+        queued = time.perf_counter()
+
+        def run():
+            metrics.record("arm_queue", time.perf_counter() - queued)
+            return fn(*args, **kwargs)
+
+        return self.executor.submit(context.run, run)
+
+    def orientation(self):
+        """(roll, pitch, yaw) of the arm in [-180, 180]: the cached measured
+        pose, else the last target; ``None`` if neither is known.
+
+        Targets spelt relative to it stay within [-360, 360], however many
+        moves are chained.
+        """
+        angles = None
+        if self.state is not None:
+            pose = self.state.snapshot().pose
+            if pose:
+                angles = pose[3:6]
+        if angles is None and self.target is not None:
+            angles = self.target[3:]
+        if angles is None:
+            return None
+        return tuple((float(a) + 180.0) % 360.0 - 180.0 for a in angles)
+
+    def describe(self):
+        info = {"name": self.name, "ip": self.ip, "connected": self.connected}
+        if self.state is not None:
+            snap = self.state.snapshot()
+            info.update(state=snap.state, error=snap.error_code, warn=snap.warn_code,
+                        age_ms=round(self.state.age() * 1000, 1))
+        if self.queue is not None:
+            info["commands"] = self.queue.stats()
+        if self.servo is not None and self.servo.active:
+            info["servo"] = True
+        if self.recorder is not None and self.recorder.active:
+            info["recording"] = self.recorder.samples
+        return info
+
+
+class ArmPool:
+    def __init__(self, arms, default=None, log=print):
+        if not arms:
+            raise ValueError("At least one arm must be configured")
+        self.log = log
+        self.units = {name: ArmUnit(name, ip, log=log) for name, ip in arms.items()}
+        self.default = default if default is not None else next(iter(self.units))
+        if self.default not in self.units:
+            raise ValueError(f"Default arm {self.default} is not configured")
+
+    def __iter__(self):
+        return iter(self.units.values())
+
+    def __len__(self):
+        return len(self.units)
+
+    def names(self):
+        return list(self.units)
+
+    def get(self, name=None):
+        """The unit called ``name`` (default arm if ``None``); ``ValueError`` if unknown"""
+        if name is None or name == "":
+            name = self.default
+        unit = self.units.get(str(name))
+        if unit is None:
+            raise ValueError(f"Unknown arm: {name}")
+        return unit
+
+    def route(self, msg, client=None):
+        """The unit a command addresses: its ``"arm"`` field, else the arm the
+        client selected (``client.options["arm"]``), else the default"""
+        options = client.options if client is not None else {}
+        return self.get(msg.get("arm", options.get("arm")))
+
+    def connect(self, connect):
+        """Call ``connect(unit)`` for every arm; an arm that fails stays offline"""
+        for unit in self:
+            try:
+                connect(unit)
+                self.log(f"[ARMS] {unit.name} connected at {unit.ip}")
+            except Exception as e:
+                self.log(f"[ARMS] {unit.name} at {unit.ip} failed to connect: {e}")
+
+    def cancel(self, command_id):
+        """Cancel an async command on whichever arm owns it"""
+        result = "unknown"
+        for unit in self:
+            if unit.queue is None:
+                continue
+            result = unit.queue.cancel(command_id)
+            if result != "unknown":
+                return unit.name, result
+        return None, result
+
+    def status(self):
+        """Aggregate status: one entry per arm plus the default arm's name"""
+        return {
+            "default": self.default,
+            "arms": {unit.name: unit.describe() for unit in self},
+        }
@@ -0,0 +1,141 @@
+"""In-process snapshot of the arm state, kept current by SDK report callbacks.
+
+Status queries and pre-move checks read :meth:`ArmStateCache.snapshot`
+instead of calling ``get_state``/``get_err_warn_code`` on the controller.
+The snapshot is refreshed by the XArmAPI report, state-changed and
+error/warn-changed callbacks. When those go quiet, a background thread
+polls instead. ``snapshot()`` never returns data older than
+``max_staleness``: if the cache is older than that, the caller polls the
+controller once.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+
+ArmSnapshot = namedtuple(
+    "ArmSnapshot",
+    ["version", "timestamp", "state", "error_code", "warn_code", "pose", "joints", "source"],
+)
+
+DEFAULT_MAX_STALENESS = 0.5  # s
+DEFAULT_POLL_INTERVAL = 0.2  # s without reports before the fallback polls
+
+
+class ArmStateCache:
+    def __init__(self, arm, max_staleness=DEFAULT_MAX_STALENESS,
+                 poll_interval=DEFAULT_POLL_INTERVAL, log=print):
+        self.arm = arm
+        self.max_staleness = max_staleness
+        self.poll_interval = poll_interval
+        self.log = log
+        self.reports = 0
+        self.polls = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._snapshot = ArmSnapshot(0, 0.0, None, 0, 0, None, None, "init")
+        self._thread = None
+        self._stop = threading.Event()
+
+    # ---- lifecycle ----
+    def start(self):
+        """Register the SDK callbacks, take a first reading and start the fallback poller"""
+        self.arm.register_report_location_callback(
+            self._on_location, report_cartesian=True, report_joints=True)
+        self.arm.register_state_changed_callback(self._on_state_changed)
+        self.arm.register_error_warn_changed_callback(self._on_error_warn_changed)
+        self.refresh()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll_loop, name="arm-state", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.arm.release_report_location_callback(self._on_location)
+        self.arm.release_state_changed_callback(self._on_state_changed)
+        self.arm.release_error_warn_changed_callback(self._on_error_warn_changed)
+
+    # ---- reads ----
+    def snapshot(self, max_age=None):
+        """Latest snapshot, polling the controller only if it is too old"""
+        max_age = self.max_staleness if max_age is None else max_age
+        snap = self._snapshot
+        if time.monotonic() - snap.timestamp <= max_age:
+            return snap
+        return self.refresh(max_age)
+
+    def invalidate(self):
+        """Mark the snapshot stale, e.g. right after we changed the arm state
+        ourselves and the report callback may not have caught up yet"""
+        with self._lock:
+            self._snapshot = self._snapshot._replace(timestamp=0.0)
+
+    def age(self):
+        return time.monotonic() - self._snapshot.timestamp
+
+    def stats(self):
+        snap = self._snapshot
+        return {
+            "version": snap.version,
+            "age_ms": round(self.age() * 1000, 1),
+            "source": snap.source,
+            "reports": self.reports,
+            "polls": self.polls,
+        }
+
+    # ---- updates ----
+    def refresh(self, max_age=0.0):
+        """Poll the controller for a full snapshot.
+
+        Concurrent callers share one poll: whoever waited on the lock reuses
+        the fresh result instead of polling again.
+        """
+        with self._refresh_lock:
+            snap = self._snapshot
+            if max_age and time.monotonic() - snap.timestamp <= max_age:
+                return snap
+            _, state = self.arm.get_state()
+            _, err_warn = self.arm.get_err_warn_code()
+            _, pose = self.arm.get_position(is_radian=False)
+            _, joints = self.arm.get_servo_angle(is_radian=False)
+            self.polls += 1
+            return self._update("poll", state=state,
+                                error_code=err_warn[0], warn_code=err_warn[1],
+                                pose=tuple(pose), joints=tuple(joints))
+
+    def _update(self, source, **fields):
+        with self._lock:
+            snap = self._snapshot._replace(
+                version=self._snapshot.version + 1,
+                timestamp=time.monotonic(),
+                source=source,
+                **fields)
+            self._snapshot = snap
+            return snap
+
+    def _on_location(self, data):
+        self.reports += 1
+        fields = {}
+        if data.get("cartesian") is not None:
+            fields["pose"] = tuple(data["cartesian"])
+        if data.get("joints") is not None:
+            fields["joints"] = tuple(data["joints"])
+        self._update("report", **fields)
+
+    def _on_state_changed(self, data):
+        self.reports += 1
+        self._update("report", state=data["state"])
+
+    def _on_error_warn_changed(self, data):
+        self.reports += 1
+        self._update("report", error_code=data["error_code"], warn_code=data["warn_code"])
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            if self.age() < self.poll_interval:
+                continue  # reports are flowing
+            try:
+                self.refresh(self.poll_interval)
+            except Exception as e:
+                self.log(f"[STATE] Poll failed: {e}")
@@ -0,0 +1,191 @@
+"""Non-blocking motion commands with IDs and completion events.
+
+A command submitted here is acknowledged straight away with an ``accepted``
+event and executed in order by a single worker thread. The submitter's
+``notify`` callback then receives ``started`` and ``completed``/``failed``
+events, or ``cancelled`` if it was cancelled. Every event carries the
+command ``id`` and the ``seq`` of the request that created it.
+"""
+
+import itertools
+import threading
+from collections import OrderedDict, deque
+
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+MAX_PENDING = 100
+HISTORY_SIZE = 256
+
+
+class MotionCommand:
+    __slots__ = ("id", "params", "notify", "seq", "state", "detail", "cancel_requested")
+
+    def __init__(self, command_id, params, notify, seq):
+        self.id = command_id
+        self.params = params
+        self.notify = notify
+        self.seq = seq
+        self.state = QUEUED
+        self.detail = None
+        self.cancel_requested = False
+
+    def event(self, name, **fields):
+        event = {"event": name, "id": self.id}
+        if self.seq is not None:
+            event["seq"] = self.seq
+        event.update(fields)
+        return event
+
+
+class CommandQueue:
+    """FIFO of motion commands executed by :meth:`run` on its own thread.
+
+    ``execute(params)`` performs one move and returns ``(ok, detail)``.
+    ``stop()`` aborts the motion in progress (e.g. ``arm.set_state(4)``) and
+    ``resume()`` makes the arm ready again afterwards.
+
+    Generated ids are ``id_prefix`` plus a number. Client ids of that form,
+    for this prefix or any in ``reserved`` (the prefixes of sibling queues),
+    are refused so they can never collide with a generated one.
+    """
+
+    def __init__(self, execute, stop=None, resume=None, log=print, max_pending=MAX_PENDING,
+                 id_prefix="c", reserved=()):
+        self.execute = execute
+        self.stop = stop
+        self.resume = resume
+        self.log = log
+        self.max_pending = max_pending
+        self.id_prefix = id_prefix  # keeps generated ids unique across several queues
+        self.reserved = {id_prefix, *reserved}
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._commands = {}  # id -> queued or running command
+        self._finished = OrderedDict()  # id -> final state, bounded
+        self._current = None
+        self._ids = itertools.count(1)
+
+    @property
+    def current_id(self):
+        current = self._current
+        return current.id if current is not None else None
+
+    def submit(self, params, notify, command_id=None, seq=None):
+        """Queue a move and send its ``accepted`` event; returns the command id.
+
+        Raises ``ValueError`` if the id is already in use or the queue is full.
+        """
+        with self._cond:
+            if command_id is None:
+                command_id = f"{self.id_prefix}{next(self._ids)}"
+            else:
+                command_id = str(command_id)
+                if command_id in self._commands:
+                    raise ValueError(f"Command id {command_id} is already in use")
+                if self._generated(command_id):
+                    raise ValueError(f"Command id {command_id} is reserved for generated ids")
+            if len(self._pending) >= self.max_pending:
+                raise ValueError("Command queue is full")
+
+            command = MotionCommand(command_id, params, notify, seq)
+            # Notify before the worker can see the command so that
+            # "accepted" always reaches the client ahead of "started"
+            self._notify(command, command.event("accepted", queued=len(self._pending)))
+            self._commands[command_id] = command
+            self._pending.append(command)
+            self._cond.notify()
+            return command_id
+
+    def _generated(self, command_id):
+        return any(command_id.startswith(prefix) and command_id[len(prefix):].isdigit()
+                   for prefix in self.reserved)
+
+    def cancel(self, command_id):
+        """Cancel a queued or running command.
+
+        Returns ``"cancelled"`` if it was still queued, ``"stopping"`` if the
+        running motion is being aborted, otherwise the final state of a
+        finished command or ``"unknown"``.
+        """
+        command_id = str(command_id)
+        with self._cond:
+            command = self._commands.get(command_id)
+            if command is None:
+                return self._finished.get(command_id, "unknown")
+            if command.state == QUEUED:
+                self._pending.remove(command)
+                self._finish(command, CANCELLED)
+                return CANCELLED
+            command.cancel_requested = True
+
+        if self.stop is not None:
+            self.stop()
+        return "stopping"
+
+    def cancel_all(self):
+        """Drop every queued command and abort the one in progress"""
+        with self._cond:
+            while self._pending:
+                self._finish(self._pending.popleft(), CANCELLED)
+            running = self._current
+            if running is not None:
+                running.cancel_requested = True
+        if running is not None and self.stop is not None:
+            self.stop()
+
+    def stats(self):
+        with self._cond:
+            return {"pending": len(self._pending), "current": self.current_id}
+
+    def run(self, stop_event=None, poll=0.5):
+        """Worker loop; execute queued commands until ``stop_event`` is set"""
+        while stop_event is None or not stop_event.is_set():
+            with self._cond:
+                if not self._pending:
+                    self._cond.wait(poll)
+                    continue
+                command = self._pending.popleft()
+                command.state = RUNNING
+                self._current = command
+
+            self._notify(command, command.event("started"))
+            try:
+                ok, detail = self.execute(command.params)
+            except Exception as e:
+                ok, detail = False, str(e)
+
+            with self._cond:
+                self._current = None
+                if command.cancel_requested:
+                    state = CANCELLED
+                else:
+                    state = COMPLETED if ok else FAILED
+                self._finish(command, state, detail)
+
+            if state == CANCELLED and self.resume is not None:
+                try:
+                    self.resume()
+                except Exception as e:
+                    self.log(f"[MOTION] Resume after cancel failed: {e}")
+
+    def _finish(self, command, state, detail=None):
+        # Caller holds self._cond
+        command.state = state
+        command.detail = detail
+        self._commands.pop(command.id, None)
+        self._finished[command.id] = state
+        while len(self._finished) > HISTORY_SIZE:
+            self._finished.popitem(last=False)
+        fields = {"status": detail} if detail is not None else {}
+        self._notify(command, command.event(state, **fields))
+
+    def _notify(self, command, event):
+        try:
+            command.notify(event)
+        except Exception as e:
+            self.log(f"[MOTION] Could not deliver {event['event']} for {command.id}: {e}")
@@ -0,0 +1,116 @@
+"""Deadband filter for streamed move targets.
+
+Haptic devices and tracked controllers never hold perfectly still. Passed
+straight through, every sub-millimetre wiggle becomes a full
+``set_position`` round trip that the controller has to plan and run.
+:class:`DeadbandFilter` sits on the move path in front of the arm and drops
+a target when:
+
+- it repeats the client's previous target or the last target that went
+  through exactly (``"duplicate"``);
+- it moved less than ``position`` mm and turned less than ``orientation``
+  degrees from that target (``"deadband"``).
+
+The reference is the last target sent to the arm, kept per arm. Slow
+drift therefore adds up until it crosses the threshold. It is not lost a
+step at a time. Every move of the arm, filtered or not (UI, async queue,
+trajectories), reports its target with :meth:`DeadbandFilter.moved`, so a
+client's repeated target still goes through once the arm was taken
+elsewhere. Call :meth:`DeadbandFilter.reset` when the arm's position is
+unknown (reset, servo mode, a failed move) so the next target always goes
+through.
+
+Counts are kept per client, so the stats show how much of each
+operator's stream was noise.
+"""
+
+import math
+import threading
+
+from servo_stream import wrap_degrees
+
+
+DEFAULT_POSITION_MM = 0.5
+DEFAULT_ORIENTATION_DEG = 0.5
+
+
+class DeadbandFilter:
+    """Drop targets that do not move the arm meaningfully"""
+
+    def __init__(self, position=DEFAULT_POSITION_MM, orientation=DEFAULT_ORIENTATION_DEG):
+        self.position = position
+        self.orientation = orientation
+        self._last = {}     # arm -> (x, y, z, roll, pitch, yaw) of the last passed target
+        self._seen = {}     # (source, arm) -> the client's previous target
+        self._clients = {}  # source -> {"passed": n, "duplicate": n, "deadband": n}
+        self._lock = threading.Lock()
+
+    def check(self, source, arm, pose):
+        """``None`` if ``pose`` should be sent to ``arm``, else the reason to drop it"""
+        pose = tuple(float(v) for v in pose)
+        with self._lock:
+            counts = self._clients.get(source)
+            if counts is None:
+                counts = self._clients[source] = {"passed": 0, "duplicate": 0, "deadband": 0}
+
+            reason = None
+            last = self._last.get(arm)
+            previous, self._seen[source, arm] = self._seen.get((source, arm)), pose
+            if pose == previous:
+                reason = "duplicate"
+            elif last is not None:
+                if pose == last:
+                    reason = "duplicate"
+                elif (math.dist(pose[:3], last[:3]) < self.position and
+                      max(abs(wrap_degrees(a - b)) for a, b in zip(pose[3:], last[3:])) < self.orientation):
+                    reason = "deadband"
+
+            if reason is None:
+                self._last[arm] = pose
+                counts["passed"] += 1
+            else:
+                counts[reason] += 1
+            return reason
+
+    def moved(self, arm, pose):
+        """Make ``pose`` the reference of ``arm``, which is being sent there.
+
+        Client histories for the arm are dropped: a target that repeats a
+        client's previous one is no longer a duplicate once the arm went
+        somewhere else.
+        """
+        pose = tuple(float(v) for v in pose)
+        with self._lock:
+            if self._last.get(arm) == pose:
+                return
+            self._last[arm] = pose
+            for key in [key for key in self._seen if key[1] == arm and self._seen[key] != pose]:
+                del self._seen[key]
+
+    def reset(self, arm=None):
+        """Forget the reference of ``arm`` (every arm if ``None``)"""
+        with self._lock:
+            if arm is None:
+                self._last.clear()
+                self._seen.clear()
+            else:
+                self._last.pop(arm, None)
+                for key in [key for key in self._seen if key[1] == arm]:
+                    del self._seen[key]
+
+    def stats(self, source=None):
+        """Counts for one client, or for every client plus a total"""
+        with self._lock:
+            if source is not None:
+                return _summary(self._clients.get(source, {"passed": 0, "duplicate": 0, "deadband": 0}))
+            clients = {str(source): _summary(counts) for source, counts in self._clients.items()}
+        total = {key: sum(c[key] for c in clients.values()) for key in ("passed", "duplicate", "deadband")}
+        return {"position_mm": self.position, "orientation_deg": self.orientation,
+                "total": _summary(total), "clients": clients}
+
+
+def _summary(counts):
+    suppressed = counts["duplicate"] + counts["deadband"]
+    seen = suppressed + counts["passed"]
+    return {**counts, "suppressed": suppressed,
+            "suppressed_pct": round(suppressed / seen * 100, 1) if seen else 0.0}
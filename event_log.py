@@ -0,0 +1,194 @@
+"""Fixed-capacity structured log shared by the servers and their UIs.
+
+Records are kept in a ring buffer. Each record has a monotonically
+increasing ``seq``, a wall-clock timestamp, a level, a source and optional
+extra fields. Appending builds the record outside the lock and only holds it
+to claim a sequence number and store one slot, so logging from the command
+path costs the same however full the buffer is.
+
+Readers poll incrementally: ``since(seq)`` returns only newer records,
+optionally filtered by minimum level and source. A reader that falls more
+than ``capacity`` records behind sees a gap in ``seq`` rather than
+stale data.
+
+An optional :class:`RotatingFileSink` writes records to disk from its own
+thread, so file I/O never happens on the caller's thread.
+"""
+
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import namedtuple
+
+
+LEVELS = ("debug", "info", "warning", "error")
+DEFAULT_CAPACITY = 1000
+
+LogRecord = namedtuple("LogRecord", ["seq", "ts", "level", "source", "message", "fields"])
+
+# "[TCP] Connection from ..." -> source "tcp"
+_TAG = re.compile(r"^\[([A-Za-z][\w ]*)\]\s*")
+
+
+def level_rank(level):
+    """Position of ``level`` in ``LEVELS``; ``ValueError`` if unknown"""
+    try:
+        return LEVELS.index(level)
+    except ValueError:
+        raise ValueError(f"Unknown log level: {level}")
+
+
+def format_record(record):
+    return f"[{time.strftime('%H:%M:%S', time.localtime(record.ts))}] {record.message}"
+
+
+def record_dict(record):
+    return {
+        "seq": record.seq,
+        "ts": round(record.ts, 3),
+        "level": record.level,
+        "source": record.source,
+        "message": record.message,
+        **({"fields": record.fields} if record.fields else {}),
+    }
+
+
+class RingLog:
+    """Ring buffer of :class:`LogRecord` with cursor-based reads.
+
+    ``echo(line)`` (e.g. ``print``) is called with the formatted line of
+    every record; ``sink`` receives every record, see :class:`RotatingFileSink`.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, echo=None, sink=None):
+        self.capacity = capacity
+        self.echo = echo
+        self.sink = sink
+        self._buf = [None] * capacity
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._tail_cache = (None, None)  # (key, text) for tail_text()
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def append(self, message, level="info", source=None, **fields):
+        """Record a message; ``source`` defaults to a leading ``[TAG]``"""
+        message = str(message)
+        if source is None:
+            tag = _TAG.match(message)
+            source = tag.group(1).lower() if tag else None
+        if level not in LEVELS:
+            level = "info"
+        record = LogRecord(0, time.time(), level, source, message, fields or None)
+
+        with self._lock:
+            self._seq += 1
+            record = record._replace(seq=self._seq)
+            self._buf[record.seq % self.capacity] = record
+
+        if self.echo is not None:
+            self.echo(format_record(record))
+        if self.sink is not None:
+            self.sink.put(record)
+        return record.seq
+
+    def since(self, seq=0, level=None, source=None, limit=None):
+        """Records newer than ``seq``, oldest first.
+
+        ``level`` is a minimum level, ``source`` an exact source name.
+        ``limit`` keeps only the newest ``limit`` matches.
+        """
+        head = self._seq
+        start = max(int(seq) + 1, head - self.capacity + 1, 1)
+        min_rank = level_rank(level) if level else 0
+        records = []
+        for s in range(start, head + 1):
+            record = self._buf[s % self.capacity]
+            if record is None or record.seq != s:
+                continue  # overwritten while we were reading
+            if min_rank and level_rank(record.level) < min_rank:
+                continue
+            if source is not None and record.source != source:
+                continue
+            records.append(record)
+        if limit is not None and len(records) > limit:
+            records = records[-limit:]
+        return records
+
+    def tail_text(self, lines=100, level=None, source=None):
+        """The newest ``lines`` records as one string, cached until a new
+        record arrives so repeated UI refreshes cost nothing"""
+        key = (self._seq, lines, level, source)
+        cached_key, text = self._tail_cache
+        if cached_key == key:
+            return text
+        text = "\n".join(format_record(r) for r in
+                         self.since(0, level=level, source=source, limit=lines))
+        self._tail_cache = (key, text)
+        return text
+
+
+class RotatingFileSink:
+    """Write records as JSON lines from a background thread.
+
+    The file is rotated to ``path.1`` ... ``path.<backups>`` once it grows
+    past ``max_bytes``. If the writer falls behind by ``max_queue`` records,
+    new records are dropped and counted rather than blocking the caller.
+    """
+
+    def __init__(self, path, max_bytes=1_000_000, backups=3, max_queue=10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+        self._thread.start()
+
+    def put(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=2.0):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        f = open(self.path, "a", encoding="utf-8")
+        size = f.tell()
+        try:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    return
+                line = json.dumps(record_dict(record), default=str) + "\n"
+                if size and size + len(line) > self.max_bytes:
+                    f.close()
+                    self._rotate()
+                    f = open(self.path, "a", encoding="utf-8")
+                    size = 0
+                f.write(line)
+                size += len(line)
+                self.written += 1
+                if self._queue.empty():
+                    f.flush()
+        finally:
+            f.close()
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
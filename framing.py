@@ -0,0 +1,247 @@
+"""Message framing for the robot TCP command servers.
+
+Two framings are supported on the same port:
+
+- ``json`` (default): newline-delimited JSON. Back-to-back objects without
+  a newline and pretty-printed objects spanning several lines are also
+  accepted, so older clients that send one bare JSON object per write keep
+  working.
+- ``length``: every frame is a 4-byte big-endian payload length followed by
+  a UTF-8 JSON payload.
+- ``binary``: packed pose records, see :mod:`pose_codec`.
+
+A client switches framing with ``{"framing": "length"}``; the reply is sent
+in the old framing and everything after it uses the new one.
+"""
+
+import json
+import struct
+
+from pose_codec import PoseDecoder, RecordError, encode_json_record
+
+
+FRAMING_JSON = "json"
+FRAMING_LENGTH = "length"
+FRAMING_BINARY = "binary"
+FRAMINGS = (FRAMING_JSON, FRAMING_LENGTH, FRAMING_BINARY)
+
+MAX_FRAME_SIZE = 64 * 1024
+
+_LENGTH_PREFIX = struct.Struct(">I")
+_json_decoder = json.JSONDecoder()
+
+
+class FramingError(ValueError):
+    """A frame could not be decoded.
+
+    ``fatal`` is set when the stream can no longer be resynchronised and the
+    connection should be closed.
+    """
+
+    def __init__(self, message, fatal=False):
+        super().__init__(message)
+        self.fatal = fatal
+
+
+def encode_frame(obj, mode=FRAMING_JSON):
+    """Serialise a reply dict into a frame for the given framing mode"""
+    payload = json.dumps(obj, separators=(",", ":")).encode()
+    if mode == FRAMING_LENGTH:
+        return _LENGTH_PREFIX.pack(len(payload)) + payload
+    if mode == FRAMING_BINARY:
+        return encode_json_record(obj)
+    return payload + b"\n"
+
+
+class FrameDecoder:
+    """Incremental per-connection parser.
+
+    Feed raw bytes with :meth:`feed` and pull complete messages with
+    :meth:`next_message` until it returns ``None``. ``mode`` may be changed
+    between messages; bytes already buffered are decoded with the new mode.
+
+    In binary mode pose records come back as the connection's shared
+    :class:`pose_codec.PoseRecord`, which is overwritten by the next pose.
+    """
+
+    def __init__(self, mode=FRAMING_JSON, max_frame_size=MAX_FRAME_SIZE):
+        if mode not in FRAMINGS:
+            raise ValueError(f"Unknown framing mode: {mode}")
+        self.mode = mode
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray()
+        self._pos = 0  # read offset, only advanced in binary mode
+        self._skip_line = False
+        self._poses = PoseDecoder()
+
+    def feed(self, data):
+        self._compact()
+        self._buffer += data
+
+    def pending(self):
+        """Number of buffered bytes not yet consumed"""
+        return len(self._buffer) - self._pos
+
+    def _compact(self):
+        if self._pos:
+            del self._buffer[:self._pos]
+            self._pos = 0
+
+    def next_message(self):
+        """Return the next decoded message, or ``None`` if more data is needed.
+
+        Raises :class:`FramingError` for a malformed frame; the bad frame is
+        consumed so the caller can report it and keep reading.
+        """
+        if self.mode == FRAMING_BINARY:
+            return self._next_binary()
+        self._compact()
+        if self.mode == FRAMING_LENGTH:
+            return self._next_length_prefixed()
+        return self._next_json()
+
+    # ---- binary pose records ----
+    def _next_binary(self):
+        # Records are decoded in place and the buffer is only compacted on
+        # the next feed, so a burst of poses costs no copies or slicing.
+        try:
+            record, size = self._poses.decode(self._buffer, self._pos)
+        except RecordError as e:
+            if not e.size:
+                self._buffer.clear()
+                self._pos = 0
+                raise FramingError(str(e), fatal=True)
+            self._pos += e.size
+            raise FramingError(str(e))
+        if record is None:
+            return None
+        self._pos += size
+        if isinstance(record, bytes):
+            return _loads_object(record)
+        return record
+
+    # ---- length-prefixed ----
+    def _next_length_prefixed(self):
+        if len(self._buffer) < _LENGTH_PREFIX.size:
+            return None
+        (size,) = _LENGTH_PREFIX.unpack_from(self._buffer)
+        if size > self.max_frame_size:
+            self._buffer.clear()
+            raise FramingError(f"Frame of {size} bytes exceeds limit", fatal=True)
+        end = _LENGTH_PREFIX.size + size
+        if len(self._buffer) < end:
+            return None
+        payload = bytes(self._buffer[_LENGTH_PREFIX.size:end])
+        del self._buffer[:end]
+        return _loads_object(payload)
+
+    # ---- newline-delimited / concatenated JSON ----
+    def _next_json(self):
+        buf = self._buffer
+        if self._skip_line:
+            newline = buf.find(b"\n")
+            if newline < 0:
+                buf.clear()
+                return None
+            del buf[:newline + 1]
+            self._skip_line = False
+
+        self._strip_whitespace()
+        if not buf:
+            return None
+
+        newline = buf.find(b"\n")
+        if newline >= 0:
+            chunk = bytes(buf[:newline])
+        else:
+            chunk = bytes(buf)
+
+        try:
+            text = chunk.decode()
+        except UnicodeDecodeError:
+            if newline < 0 and len(buf) <= self.max_frame_size:
+                return None  # possibly a split multi-byte character
+            self._consume_line(newline)
+            raise FramingError("Invalid UTF-8 in frame")
+
+        try:
+            obj, end = _json_decoder.raw_decode(text)
+        except json.JSONDecodeError:
+            if newline < 0:
+                if len(buf) > self.max_frame_size:
+                    buf.clear()
+                    self._skip_line = True
+                    raise FramingError("Frame exceeds size limit")
+                return None  # incomplete object, wait for more bytes
+            decoded = self._next_multiline(newline)
+            if decoded is None:
+                return None
+            obj, text, end = decoded
+
+        del buf[:len(text[:end].encode(errors="surrogateescape"))]
+        # Eat the delimiter too, so a framing switch starts on a clean boundary
+        self._strip_whitespace()
+        if not isinstance(obj, dict):
+            raise FramingError("Expected a JSON object")
+        return obj
+
+    def _next_multiline(self, newline):
+        """Decode an object spanning several lines, e.g. pretty-printed JSON.
+
+        Returns ``(obj, text, end)``, or ``None`` while the object is still
+        incomplete. JSON that is invalid before the end of the buffered data
+        is reported and its first line consumed, as for a single line.
+        """
+        buf = self._buffer
+        text = bytes(buf).decode(errors="surrogateescape")
+        try:
+            obj, end = _json_decoder.raw_decode(text)
+            return obj, text, end
+        except json.JSONDecodeError as e:
+            # Incomplete if the error is on the unterminated last line or in
+            # trailing whitespace; JSON strings can't span lines
+            if text.find("\n", e.pos) < 0 or not text[e.pos:].strip():
+                if len(buf) > self.max_frame_size:
+                    buf.clear()
+                    self._skip_line = True
+                    raise FramingError("Frame exceeds size limit")
+                return None
+        self._consume_line(newline)
+        raise FramingError("Invalid JSON")
+
+    def _strip_whitespace(self):
+        buf = self._buffer
+        start = 0
+        while start < len(buf) and buf[start] in b" \t\r\n":
+            start += 1
+        if start:
+            del buf[:start]
+
+    def _consume_line(self, newline):
+        if newline >= 0:
+            del self._buffer[:newline + 1]
+        else:
+            self._buffer.clear()
+
+
+def _loads_object(payload):
+    try:
+        obj = json.loads(payload)
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise FramingError("Invalid JSON")
+    if not isinstance(obj, dict):
+        raise FramingError("Expected a JSON object")
+    return obj
+
+
+def switch_framing(decoder, msg):
+    """Apply a ``{"framing": ...}`` request to ``decoder``.
+
+    Returns the reply dict. The caller must send it with the framing that was
+    active *before* this call.
+    """
+    mode = msg.get("framing")
+    if mode not in FRAMINGS:
+        return {"error": f"Unknown framing: {mode}"}
+    decoder.mode = mode
+    return {"framing": mode}
@@ -1,6 +1,13 @@
 from xarm.wrapper import XArmAPI
+import os
+import sys
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import paths
+from trajectory import run_trajectory, validate_trajectory
+
 # Connect to robot
 arm = XArmAPI('192.168.1.188')
 arm.connect()
@@ -20,19 +27,17 @@ speed = 100
 x0, y0 = 100, 100
 size = 100  # square side length (mm)
 
-# Define corners (in XY plane)
-square_points = [
-    (x0, y0, z),               # bottom-left
-    (x0+size, y0, z),          # bottom-right
-    (x0+size, y0+size, z),     # top-right
-    (x0, y0+size, z),          # top-left
-    (x0, y0, z)                # back to start
-]
+step = 10     # mm between waypoints along the edges
+radius = 2    # mm blend radius, keeps the corners sharp
+
+# Square in the XY plane, closed back at the starting corner
+square = paths.rectangle((x0, y0, z), size, size, step=step,
+                         orientation=(roll, pitch, yaw))
+waypoints = validate_trajectory(paths.to_waypoints(square, speed=speed, radius=radius))
 
-# Move through each corner
+# Each lap is one blended motion with no stop at the corners
 while(True):
-    for (x, y, z) in square_points:
-        arm.set_position(x=x, y=y, z=z,
-                         roll=roll, pitch=pitch, yaw=yaw,
-                         speed=speed, wait=True)
-        time.sleep(0.1)  # small pause
+    code, index, elapsed = run_trajectory(arm, waypoints)
+    if code != 0:
+        print(f"Square stopped at waypoint {index} with code {code}")
+        break
@@ -1,9 +1,15 @@
+import os
+import sys
 import time
 import json
 import keyboard  # pip install keyboard
 import HaplyHardwareAPI
 from HaplyHardwareAPI import SerialStream, Inverse3
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from rate_scheduler import RateScheduler
+
 # -----------------------------
 # CONFIGURATION
 # -----------------------------
@@ -52,6 +58,7 @@ def haply_to_xarm_coords(haply_pos):
 # MAIN LOOP
 # -----------------------------
 last_space_state = False
+rate = RateScheduler(1 / LOOP_TIME)
 print("Press SPACEBAR to save Haply coordinates to JSON. Press ESC to exit.")
 
 try:
@@ -86,7 +93,7 @@ try:
             print("\nExiting program.")
             break
 
-        time.sleep(LOOP_TIME)
+        rate.sleep()
 
 except KeyboardInterrupt:
     print("Interrupted by user.")
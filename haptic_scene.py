@@ -0,0 +1,259 @@
+"""Force fields for the Haply haptic loop.
+
+A :class:`HapticScene` holds every primitive of one kind in preallocated
+NumPy arrays. :meth:`HapticScene.evaluate` works out the force of all of
+them from the device position and velocity, sums it, and limits its
+magnitude to ``max_force``. Each kind is a handful of vectorized calls
+whatever the number of primitives, about forty calls in all. They write
+into scratch arrays allocated by the scene, so no array is created per
+tick. Dozens of primitives evaluate in a few tens of microseconds, and
+hundreds barely more, well inside the 1 ms loop (see
+``scripts/bench_haptic_scene.py``).
+
+Primitives (units follow the device: m, m/s, N):
+
+- spheres: push the device out (``inside=False``) or keep it in
+  (``inside=True``), with force ``stiffness * depth`` along the radius;
+- boxes: push out along the shallowest axis, or keep the device in (per
+  axis, like a padded cage);
+- planes: push the device back to the side the normal points to;
+- damping: ``-coefficient * velocity`` inside a sphere (everywhere if no
+  radius is given);
+- springs: ``stiffness * (anchor - position)``.
+
+Adding, moving and clearing primitives is done outside the hot path.
+"""
+
+import math
+
+import numpy as np
+
+
+DEFAULT_CAPACITY = 64      # primitives of each kind
+DEFAULT_MAX_FORCE = 10.0   # N, total force is scaled down to this
+EPSILON = 1e-9
+
+KINDS = ("sphere", "box", "cage", "plane", "damping", "spring")
+
+
+class HapticScene:
+    """Primitives in preallocated arrays, evaluated together once per tick"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, max_force=DEFAULT_MAX_FORCE):
+        self.capacity = capacity
+        self.max_force = max_force
+        self.saturated = 0  # ticks where the force was limited
+
+        c = capacity
+        self.count = dict.fromkeys(KINDS, 0)
+        # Parameters, one row per primitive
+        self.center = {kind: np.zeros((c, 3)) for kind in KINDS}  # plane point, spring anchor
+        self.gain = {kind: np.zeros(c) for kind in KINDS}  # stiffness or damping coefficient
+        self.radius = np.zeros(c)          # sphere
+        self.sign = np.ones(c)             # sphere: 1 keeps the device out, -1 in
+        self.half = {"box": np.zeros((c, 3)), "cage": np.zeros((c, 3))}
+        self.low = np.zeros((c, 3))        # cage corners
+        self.high = np.zeros((c, 3))
+        self.normal = np.zeros((c, 3))     # plane
+        self.offset = np.zeros(c)          # plane: point . normal
+        self.reach = np.zeros(c)           # damping: radius squared
+        self._signed_gain = np.zeros(c)
+        self._spring_gain = 0.0
+        self._spring_pull = np.zeros(3)    # sum of stiffness * anchor
+
+        # Scratch space reused every tick
+        self.force = np.zeros(3)
+        self._position = np.zeros(3)
+        self._vec = np.zeros((c, 3))
+        self._vec2 = np.zeros((c, 3))
+        self._scalar = np.zeros(c)
+        self._scalar2 = np.zeros(c)
+        self._mask = np.zeros((c, 3), dtype=bool)
+        self._flags = np.zeros(c, dtype=bool)
+        self._partial = np.zeros((len(KINDS), 3))  # force of each kind
+        self._ones = np.ones(len(KINDS))
+        self._bind()
+
+    # ---- building the scene ----
+    def _add(self, kind, center, gain):
+        index = self.count[kind]
+        if index >= self.capacity:
+            raise ValueError(f"Scene already holds {self.capacity} {kind} primitives")
+        self.center[kind][index] = center
+        self.gain[kind][index] = gain
+        self.count[kind] = index + 1
+        return kind, index
+
+    def add_sphere(self, center, radius, stiffness, inside=False):
+        """Sphere that pushes the device out, or keeps it in with ``inside=True``"""
+        handle = self._add("sphere", center, stiffness)
+        self.radius[handle[1]] = radius
+        self.sign[handle[1]] = -1.0 if inside else 1.0
+        self._bind()
+        return handle
+
+    def add_box(self, center, size, stiffness, inside=False):
+        """Axis-aligned box of ``size`` (x, y, z); solid, or a cage with ``inside=True``"""
+        kind, index = handle = self._add("cage" if inside else "box", center, stiffness)
+        self.half[kind][index] = np.asarray(size, dtype=float) / 2.0
+        self._bind()
+        return handle
+
+    def add_plane(self, point, normal, stiffness):
+        """Wall through ``point``; the device is kept on the side ``normal`` points to"""
+        normal = np.asarray(normal, dtype=float)
+        handle = self._add("plane", point, stiffness)
+        self.normal[handle[1]] = normal / np.linalg.norm(normal)
+        self._bind()
+        return handle
+
+    def add_damping(self, coefficient, center=(0.0, 0.0, 0.0), radius=None):
+        """Viscous region (N per m/s); everywhere when ``radius`` is ``None``"""
+        handle = self._add("damping", center, coefficient)
+        # Stored squared so the tick needs no square root
+        self.reach[handle[1]] = math.inf if radius is None else radius * radius
+        self._bind()
+        return handle
+
+    def add_spring(self, anchor, stiffness):
+        """Zero-length spring pulling the device towards ``anchor``"""
+        handle = self._add("spring", anchor, stiffness)
+        self._bind()
+        return handle
+
+    def move(self, handle, center):
+        """Move a primitive (sphere/box center, plane point, spring anchor)"""
+        kind, index = handle
+        self.center[kind][index] = center
+        self._bind()
+
+    def clear(self):
+        for kind in KINDS:
+            self.count[kind] = 0
+        self._bind()
+
+    def _bind(self):
+        """Derived values and views of the active rows.
+
+        Rebuilt on every change to the scene, so a tick neither slices nor
+        recomputes anything that only depends on the primitives.
+        """
+        n = self.count
+        k = n["cage"]
+        np.subtract(self.center["cage"][:k], self.half["cage"][:k], out=self.low[:k])
+        np.add(self.center["cage"][:k], self.half["cage"][:k], out=self.high[:k])
+        k = n["plane"]
+        np.einsum("ij,ij->i", self.center["plane"][:k], self.normal[:k], out=self.offset[:k])
+        k = n["sphere"]
+        np.multiply(self.gain["sphere"][:k], self.sign[:k], out=self._signed_gain[:k])
+
+        # Springs are linear, so their sum collapses to one gain and one pull
+        k = n["spring"]
+        gain = self.gain["spring"][:k]
+        self._spring_gain = float(gain.sum())
+        self._spring_pull[:] = (self.center["spring"][:k] * gain[:, None]).sum(axis=0)
+        self._partial[:] = 0.0
+
+        def rows(kind, *arrays):
+            return tuple(array[:n[kind]] for array in arrays)
+
+        self._sphere_rows = rows("sphere", self.center["sphere"], self.radius, self.sign,
+                                 self._signed_gain, self._vec, self._scalar, self._scalar2)
+        self._box_rows = rows("box", self.center["box"], self.half["box"], self.gain["box"],
+                              self._vec, self._vec2, self._scalar, self._flags, self._mask)
+        self._cage_rows = rows("cage", self.low, self.high, self.gain["cage"], self._vec)
+        self._plane_rows = rows("plane", self.normal, self.offset, self.gain["plane"], self._scalar)
+        self._damping_rows = rows("damping", self.center["damping"], self.reach, self.gain["damping"],
+                                  self._vec, self._scalar, self._flags)
+
+    # ---- hot path ----
+    def evaluate(self, position, velocity=None):
+        """Total force for the device state; returns the scene's own force array.
+
+        The array is overwritten on the next call; copy it (or ``tolist()``
+        it for the device API) if it has to be kept.
+        """
+        p = self._position
+        p[:] = position
+        count, partial = self.count, self._partial
+
+        np.multiply(p, -self._spring_gain, out=partial[0])
+        np.add(partial[0], self._spring_pull, out=partial[0])
+        if count["sphere"]:
+            self._spheres(p, partial[1])
+        if count["box"]:
+            self._boxes(p, partial[2])
+        if count["cage"]:
+            self._cages(p, partial[3])
+        if count["plane"]:
+            self._planes(p, partial[4])
+        if count["damping"]:
+            self._damping(p, velocity, partial[5])
+
+        force = self.force
+        np.dot(self._ones, partial, out=force)
+        magnitude = math.sqrt(force[0] * force[0] + force[1] * force[1] + force[2] * force[2])
+        if magnitude > self.max_force:
+            np.multiply(force, self.max_force / magnitude, out=force)
+            self.saturated += 1
+        return force
+
+    def _spheres(self, p, out):
+        center, radius, sign, gain, diff, dist, depth = self._sphere_rows
+        np.subtract(p, center, out=diff)
+        np.einsum("ij,ij->i", diff, diff, out=dist)
+        np.sqrt(dist, out=dist)
+        # Penetration: inside a solid sphere, or outside a containing one
+        np.subtract(radius, dist, out=depth)
+        np.multiply(depth, sign, out=depth)
+        np.maximum(depth, 0.0, out=depth)
+        # force = radial unit vector * (radius - distance) * stiffness
+        np.maximum(dist, EPSILON, out=dist)
+        np.divide(depth, dist, out=depth)
+        np.multiply(depth, gain, out=depth)
+        np.dot(depth, diff, out=out)
+
+    def _boxes(self, p, out):
+        center, half, gain, diff, depth, shallowest, inside, mask = self._box_rows
+        np.subtract(p, center, out=diff)
+        np.abs(diff, out=depth)
+        np.subtract(half, depth, out=depth)
+        # Inside when every axis penetrates; push out along the shallowest one
+        np.minimum(depth[:, 0], depth[:, 1], out=shallowest)
+        np.minimum(shallowest, depth[:, 2], out=shallowest)
+        np.greater(shallowest, 0.0, out=inside)
+        np.equal(depth, shallowest[:, None], out=mask)
+        np.logical_and(mask, inside[:, None], out=mask)
+        np.copysign(depth, diff, out=depth)
+        np.multiply(depth, mask, out=depth)
+        np.dot(gain, depth, out=out)
+
+    def _cages(self, p, out):
+        low, high, gain, pull = self._cage_rows
+        # Pull back to the nearest point of the box, per axis
+        np.maximum(p, low, out=pull)
+        np.minimum(pull, high, out=pull)
+        np.subtract(pull, p, out=pull)
+        np.dot(gain, pull, out=out)
+
+    def _planes(self, p, out):
+        normal, offset, gain, depth = self._plane_rows
+        np.dot(normal, p, out=depth)
+        np.subtract(offset, depth, out=depth)
+        np.maximum(depth, 0.0, out=depth)
+        np.multiply(depth, gain, out=depth)
+        np.dot(depth, normal, out=out)
+
+    def _damping(self, p, velocity, out):
+        center, reach, gain, diff, dist, inside = self._damping_rows
+        coefficient = 0.0
+        if velocity is not None:
+            np.subtract(p, center, out=diff)
+            np.einsum("ij,ij->i", diff, diff, out=dist)
+            np.less_equal(dist, reach, out=inside)
+            coefficient = float(np.dot(gain, inside))
+        if coefficient:
+            out[:] = velocity
+            np.multiply(out, -coefficient, out=out)
+        else:
+            out[:] = 0.0
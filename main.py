@@ -1,105 +1,280 @@
-import socket
-import json
+import os
 import threading
 import time
 import sys
+from concurrent.futures import Future
 
 from xarm.wrapper import XArmAPI
-from fastapi import FastAPI
+from fastapi import FastAPI, Response, WebSocket
+from fastapi.responses import FileResponse
 import uvicorn
 
+from admission import AdmissionPolicy
+from arm_pool import ArmPool
+from arm_state import ArmStateCache
+from command_queue import CommandQueue
+from deadband import DeadbandFilter
+from event_log import RingLog, RotatingFileSink, format_record, record_dict
+from metrics import CONTENT_TYPE, CommandMetrics, client_label, reply_failed, timed
+from orientation import nearest_euler
+from planner import Limits, plan_motion
+from profiling import SamplingProfiler
+from reachability import load_index, vet_target
+from recorder import Recorder, Recording, list_recordings, replay
+from target_slot import TargetSlot, follow_targets, make_target
+from tcp_server import CommandServer
+from telemetry import TelemetrySampler
+from trajectory import run_trajectory, shortest_rotations, validate_trajectory
+from ws_server import serve_websocket
+
 
 # --------------------------------
 # Configuration
 # --------------------------------
 
-ARM_IP = "192.168.1.188"
+# name -> controller IP; commands pick an arm with "arm", default is the first
+ARMS = {
+    "arm1": "192.168.1.188",
+}
 
 TCP_HOST = "0.0.0.0"
 TCP_PORT = 5005
+TCP_MAX_WORKERS = 4
+
+# Per-client admission control; over-limit commands get a rejection reply
+TCP_RATE_LIMIT = 100.0
+TCP_BURST = 50
+TCP_QUEUE_DEPTH = 32
+TCP_CLIENT_WEIGHTS = {}
 
 HTTP_PORT = 8000
 
+# Default for new TCP connections; a client can send {"coalesce": true/false}
+COALESCE_MOVES = False
+
+# Workspace reachability index from scripts/build_reachability.py (a missing
+# file disables the check); REACH_CLAMP moves unreachable targets to the
+# nearest reachable position instead of rejecting them
+REACH_INDEX_FILE = "workspace_xarm6.npz"
+REACH_CLAMP = False
+
+# Streamed moves within this distance/angle of the last one sent to the arm
+# are dropped (deadband.py); 0 and 0 drops only exact duplicates
+DEADBAND_MM = 0.5
+DEADBAND_DEG = 0.5
+
+# Limits for trajectories sent with "optimize": true (planner.py)
+PLAN_LIMITS = Limits()
+
+# Sampling profiles of the command path, started over HTTP (/profile/start)
+PROFILE_DIR = "profiles"
+
+# Continuous telemetry recording, one directory per arm and server start
+RECORD_ENABLED = False
+RECORD_DIR = "recordings"
+RECORD_RATE_HZ = 100
+
 
 # --------------------------------
 # Debug logging
 # --------------------------------
 
-debug_log = []
-log_lock = threading.Lock()
+LOG_CAPACITY = 1000
+LOG_FILE = None  # e.g. "main.log" to also keep rotated JSON lines on disk
+
+debug_log = RingLog(
+    LOG_CAPACITY,
+    echo=print,
+    sink=RotatingFileSink(LOG_FILE) if LOG_FILE else None
+)
+
+
+def log(message, level="info", **fields):
+    debug_log.append(message, level=level, **fields)
+
+
+# --------------------------------
+# Workspace reachability
+# --------------------------------
+
+reach_index = load_index(REACH_INDEX_FILE, log=log)
+
+
+def check_reach(x, y, z, roll=180, pitch=0, yaw=0):
+
+    target, rejection = vet_target(
+        reach_index,
+        float(x), float(y), float(z),
+        float(roll), float(pitch), float(yaw),
+        clamp=REACH_CLAMP
+    )
+
+    if rejection is not None:
+        log(f"[REACH] {rejection['error']}", level="warning")
+    elif target != (x, y, z):
+        log(f"[REACH] Clamped ({x}, {y}, {z}) to {target}")
+
+    return target, rejection
+
+
+def reach_command(cmd):
+
+    # Checks a move command before it is dispatched; may clamp x/y/z in place
+    (cmd["x"], cmd["y"], cmd["z"]), rejection = check_reach(
+        cmd["x"],
+        cmd["y"],
+        cmd["z"],
+        cmd.get("roll", 180),
+        cmd.get("pitch", 0),
+        cmd.get("yaw", 0)
+    )
+
+    return rejection
+
+
+# --------------------------------
+# Move filter
+# --------------------------------
+
+move_filter = DeadbandFilter(DEADBAND_MM, DEADBAND_DEG)
+
 
+def filter_move(cmd, client):
 
-def log(message):
-    with log_lock:
-        timestamp = time.strftime("%H:%M:%S")
-        line = f"[{timestamp}] {message}"
+    # Reason to drop a streamed move ("duplicate" / "deadband"), or None
+    label = client_label(client)
+
+    reason = move_filter.check(
+        label,
+        cmd["arm"],
+        (
+            cmd["x"],
+            cmd["y"],
+            cmd["z"],
+            cmd.get("roll", 180),
+            cmd.get("pitch", 0),
+            cmd.get("yaw", 0)
+        )
+    )
 
-        debug_log.append(line)
-        print(line)
+    if reason is not None:
+        command_metrics.suppressed.labels(reason, label).inc()
 
-        if len(debug_log) > 200:
-            debug_log.pop(0)
+    return reason
+
+
+# --------------------------------
+# Motion planning
+# --------------------------------
+
+def optimize_trajectory(waypoints):
+
+    # Per-segment speed/mvacc instead of one constant speed
+    timing = plan_motion(waypoints, PLAN_LIMITS)
+    timing.apply(waypoints)
+
+    summary = timing.describe()
+
+    log(
+        f"[PLAN] {len(waypoints)} waypoints planned at {summary['duration']}s, "
+        f"{summary['saving']}s ({summary['saving_pct']}%) faster than constant speed"
+    )
+
+    return summary
 
 
 # --------------------------------
 # Robot initialization
 # --------------------------------
 
-print("Connecting to xArm...")
+def connect_arm(unit):
+
+    print(f"Connecting to xArm {unit.name} at {unit.ip}...")
+
+    arm = XArmAPI(unit.ip)
+
+    arm.connect()
+
+    arm.motion_enable(True)
+    arm.set_mode(0)
+    arm.set_state(0)
 
-arm = XArmAPI(ARM_IP)
+    time.sleep(1)
 
-arm.connect()
+    unit.arm = arm
 
-arm.motion_enable(True)
-arm.set_mode(0)
-arm.set_state(0)
+    # Status and pre-move checks read this cache, not the controller
+    unit.state = ArmStateCache(arm, log=log)
+    unit.state.start()
 
-time.sleep(1)
+    print(f"xArm {unit.name} connected.")
 
-print("xArm connected.")
+
+def connected_unit(arm=None):
+
+    unit = arms.get(arm)
+
+    if not unit.connected:
+        raise RuntimeError(f"Arm {unit.name} is not connected")
+
+    return unit
 
 
 # --------------------------------
 # Robot control functions
 # --------------------------------
 
-def reset_safe_position():
+def reset_safe_position(arm=None):
 
     try:
 
-        log("Reset command received")
+        unit = connected_unit(arm)
 
-        arm.clean_error()
-        arm.clean_warn()
+        log(f"Reset command received for {unit.name}")
 
-        arm.motion_enable(True)
-        arm.set_mode(0)
-        arm.set_state(0)
+        move_filter.reset(unit.name)
 
-        code = arm.set_position(
-            x=250,
-            y=0,
-            z=150,
-            roll=180,
-            pitch=0,
-            yaw=0,
-            speed=50,
-            wait=True
-        )
+        with timed("recovery"):
 
-        return {"status": "ok", "code": code}
+            unit.arm.clean_error()
+            unit.arm.clean_warn()
+
+            unit.arm.motion_enable(True)
+            unit.arm.set_mode(0)
+            unit.arm.set_state(0)
+            unit.state.invalidate()
+
+        command_metrics.recoveries.labels(unit.name, "reset").inc()
+
+        with timed("motion"):
+
+            code = unit.arm.set_position(
+                x=250,
+                y=0,
+                z=150,
+                roll=180,
+                pitch=0,
+                yaw=0,
+                speed=50,
+                wait=True
+            )
+
+        return {"status": "ok", "arm": unit.name, "code": code}
 
     except Exception as e:
 
-        log(f"Reset error: {e}")
+        log(f"Reset error: {e}", level="error")
         return {"status": "error", "message": str(e)}
 
 
 def move_robot(cmd):
 
+    unit = None
+
     try:
 
+        unit = connected_unit(cmd.get("arm"))
+
         x = float(cmd["x"])
         y = float(cmd["y"])
         z = float(cmd["z"])
@@ -109,37 +284,144 @@ def move_robot(cmd):
         yaw = float(cmd.get("yaw", 0))
         speed = float(cmd.get("speed", 100))
 
-        log(f"Move command: {x} {y} {z}")
-
-        code = arm.set_position(
-            x=x,
-            y=y,
-            z=z,
-            roll=roll,
-            pitch=pitch,
-            yaw=yaw,
-            speed=speed,
-            wait=True
-        )
+        log(f"Move command for {unit.name}: {x} {y} {z}")
+
+        # The target went through reach_command where it came in
+        with timed("precheck"):
+            state = unit.state.snapshot().state
+
+        if state > 2:
+            return {"status": "error", "message": f"Arm in error state {state}"}
+
+        # One move at a time per arm, whichever thread sends it
+        with unit.motion_lock:
+
+            # Spell the orientation so the controller turns the short way
+            reference = unit.orientation()
+
+            if reference is not None:
+                roll, pitch, yaw = nearest_euler((roll, pitch, yaw), reference).tolist()
+
+            unit.target = (x, y, z, roll, pitch, yaw)
+            move_filter.moved(unit.name, unit.target)
+
+            # wait=True: controller call and motion completion together
+            with timed("motion"):
+
+                code = unit.arm.set_position(
+                    x=x,
+                    y=y,
+                    z=z,
+                    roll=roll,
+                    pitch=pitch,
+                    yaw=yaw,
+                    speed=speed,
+                    wait=True
+                )
+
+        if code != 0:
+
+            # The arm may have stopped anywhere short of the target
+            move_filter.reset(unit.name)
 
         return {"status": "ok", "code": code}
 
     except Exception as e:
 
-        log(f"Move error: {e}")
+        log(f"Move error: {e}", level="error")
+
+        if unit is not None:
+            move_filter.reset(unit.name)
+
         return {"status": "error", "message": str(e)}
 
 
-def get_status():
+def run_trajectory_command(waypoints, arm=None, planned=None):
+
+    unit = None
 
     try:
 
-        _, state = arm.get_state()
-        _, err = arm.get_err_warn_code()
+        unit = connected_unit(arm)
+
+        log(f"Trajectory command for {unit.name}: {len(waypoints)} waypoints")
+
+        with timed("precheck"):
+            state = unit.state.snapshot().state
 
+        if state > 2:
+            return {"status": "error", "message": f"Arm in error state {state}"}
+
+        with unit.motion_lock:
+
+            shortest_rotations(waypoints, unit.orientation())
+
+            last = waypoints[-1]
+            unit.target = tuple(last[k] for k in ("x", "y", "z", "roll", "pitch", "yaw"))
+            move_filter.moved(unit.name, unit.target)
+
+            with timed("motion"):
+                code, index, elapsed = run_trajectory(unit.arm, waypoints)
+
+        if code != 0:
+
+            # Flush the rest of the blended path from the controller
+            move_filter.reset(unit.name)
+            unit.arm.set_state(4)
+            unit.arm.set_state(0)
+            unit.state.invalidate()
+
+            return {"status": "error", "code": code, "waypoint": index}
+
+        reply = {"status": "ok", "code": code, "elapsed": round(elapsed, 3)}
+
+        if planned is not None:
+            reply["planned"] = planned
+
+        return reply
+
+    except Exception as e:
+
+        log(f"Trajectory error: {e}", level="error")
+
+        if unit is not None:
+            move_filter.reset(unit.name)
+
+        return {"status": "error", "message": str(e)}
+
+
+def arm_status(unit):
+
+    if not unit.connected:
+        return {"arm": unit.name, "status": "offline"}
+
+    snap = unit.state.snapshot()
+
+    return {
+        "arm": unit.name,
+        "state": snap.state,
+        "error": [snap.error_code, snap.warn_code],
+        "cache": unit.state.stats(),
+        "targets": unit.slot.stats(),
+        "commands": unit.queue.stats(),
+        "recorder": unit.recorder.stats() if unit.recorder is not None else None
+    }
+
+
+def get_status(arm=None, top=None):
+
+    try:
+
+        if arm is not None:
+            return arm_status(arms.get(arm))
+
+        # One arm at the top level (the default unless "top" names one),
+        # every arm under "arms"
         return {
-            "state": state,
-            "error": err
+            **arm_status(arms.get(top)),
+            "arms": {unit.name: arm_status(unit) for unit in arms},
+            "admission": tcp_server.admission_stats(),
+            "filter": move_filter.stats()
         }
 
     except Exception as e:
@@ -148,81 +430,536 @@ def get_status():
 
 
 # --------------------------------
-# TCP CLIENT HANDLER
+# TELEMETRY
+# --------------------------------
+
+def sample_telemetry(fields, arm=None):
+
+    unit = connected_unit(arm)
+
+    # Built from the cached snapshot: no controller round trips
+    snap = unit.state.snapshot()
+
+    sample = {
+        "t": round(time.time(), 3),
+        "state": snap.state,
+        "error": snap.error_code,
+        "warn": snap.warn_code
+    }
+
+    if "pose" in fields:
+        sample["pose"] = [round(v, 2) for v in snap.pose]
+
+    if "joints" in fields:
+        sample["joints"] = [round(v, 2) for v in snap.joints]
+
+    if "command" in fields:
+        sample["command"] = unit.queue.current_id
+
+    return sample
+
+
+def handle_subscribe(msg, unit, key, push):
+
+    if not unit.connected:
+        return {"error": f"Arm {unit.name} is not connected"}
+
+    try:
+        subscription = unit.telemetry.subscribe(
+            key,
+            lambda event: push({**event, "arm": unit.name}),
+            fields=msg.get("fields"),
+            rate=msg.get("rate", 1.0),
+            on_change=msg.get("on_change", False)
+        )
+    except ValueError as e:
+        return {"error": str(e)}
+
+    return {"subscribed": subscription, "arm": unit.name}
+
+
+def unsubscribe_all(key):
+
+    stopped = stop_replay(key)
+
+    return any([unit.telemetry.unsubscribe(key) for unit in arms]) or stopped
+
+
+# --------------------------------
+# RECORDING
 # --------------------------------
 
-def client_handler(conn, addr):
+# {"replay": "<recording>", "speed": 2} plays a recording back to the
+# client as telemetry events marked "replay": true; "unsubscribe" stops it.
+
+replays = {}  # client -> threading.Event
+
+
+def start_recorder(unit):
+
+    unit.recorder = Recorder(
+        unit.state,
+        RECORD_DIR,
+        f"{unit.name}-{time.strftime('%Y%m%d-%H%M%S')}",
+        target=lambda: unit.target,
+        rate_hz=RECORD_RATE_HZ,
+        log=log
+    )
+
+    unit.recorder.start()
+
+
+def open_recording(name):
+
+    # Only names listed under RECORD_DIR, never arbitrary paths
+    if name not in list_recordings(RECORD_DIR):
+        raise ValueError(f"Unknown recording: {name}")
 
-    log(f"Client connected: {addr}")
+    return Recording(f"{RECORD_DIR}/{name}")
 
-    with conn:
 
-        while True:
+def handle_replay(msg, client):
+
+    try:
+        recording = open_recording(str(msg["replay"]))
+        speed = float(msg.get("speed", 1.0))
+        if speed <= 0:
+            raise ValueError("speed must be positive")
+    except ValueError as e:
+        return {"error": str(e)}
+
+    stop_replay(client)
+    stop = replays[client] = threading.Event()
+
+    def run():
+
+        try:
+            count = replay(
+                recording,
+                lambda event: client.push(event, droppable=True),
+                t0=msg.get("t0"),
+                t1=msg.get("t1"),
+                speed=speed,
+                stop_event=stop
+            )
+            client.push({"event": "replay_done", "replay": msg["replay"], "samples": count})
+        except Exception as e:
+            log(f"Replay of {msg['replay']} failed: {e}", level="error")
+            client.push({"event": "replay_failed", "replay": msg["replay"], "message": str(e)})
+        finally:
+            if replays.get(client) is stop:
+                del replays[client]
+
+    threading.Thread(target=run, daemon=True).start()
+
+    return {"replaying": msg["replay"], **recording.describe()}
+
+
+def stop_replay(key):
+
+    stop = replays.pop(key, None)
+
+    if stop is None:
+        return False
+
+    stop.set()
+    return True
+
+
+# --------------------------------
+# STREAMED TARGETS
+# --------------------------------
+
+# Coalescing clients drop moves into the arm's latest-wins slot; one
+# follower thread per arm always moves toward the newest one.
+
+def move_to_target(target, arm=None):
+
+    result = move_robot({**target._asdict(), "arm": arm})
+
+    if result.get("status") != "ok":
+        log(f"Streamed target {target.seq} from {target.source} failed: {result}", level="warning")
+
+
+def start_target_follower(unit):
+
+    follow_targets(
+        unit.slot,
+        lambda target: move_to_target(target, unit.name),
+        log=log
+    )
+
+
+# --------------------------------
+# ASYNCHRONOUS MOVES
+# --------------------------------
+
+# Moves sent with "async": true get an "accepted" event right away and run
+# in order on the arm's motion worker, which pushes started/completed/failed
+# events.
+
+def execute_move(params, arm=None):
+
+    # Runs long after the "accepted" reply, so it is timed as its own command
+    return command_metrics.run(
+        "trajectory_queued" if "trajectory" in params else "move_queued",
+        _execute_move,
+        params,
+        arm,
+        failed=lambda result: not result[0]
+    )
+
+
+def _execute_move(params, arm):
+
+    if "trajectory" in params:
+        result = run_trajectory_command(params["trajectory"], arm)
+    else:
+        result = move_robot({**params, "arm": arm})
+
+    return result.get("status") == "ok" and not result.get("code"), result
+
+
+def stop_motion(arm=None):
+
+    unit = connected_unit(arm)
+    unit.arm.set_state(4)
+    unit.state.invalidate()
+
+
+def resume_motion(arm=None):
+
+    unit = connected_unit(arm)
+    unit.arm.set_state(0)
+    unit.state.invalidate()
+
+
+def start_motion_worker(unit):
+
+    unit.queue.run()
+
+
+def wants_coalescing(client):
+
+    options = client.options if client is not None else {}
+    return options.get("coalesce", COALESCE_MOVES)
+
+
+# --------------------------------
+# ARM POOL
+# --------------------------------
+
+arms = ArmPool(ARMS, log=log)
+
+for _unit in arms:
+
+    _unit.slot = TargetSlot()
+
+    _unit.queue = CommandQueue(
+        lambda params, name=_unit.name: execute_move(params, name),
+        stop=lambda name=_unit.name: stop_motion(name),
+        resume=lambda name=_unit.name: resume_motion(name),
+        log=log,
+        id_prefix=f"{_unit.name}-c" if len(arms) > 1 else "c",
+        reserved=[f"{name}-c" for name in arms.names()]
+    )
+
+    # One sampler per arm serves every subscriber of that arm
+    _unit.telemetry = TelemetrySampler(
+        lambda fields, name=_unit.name: sample_telemetry(fields, name),
+        log=log
+    )
+
+arms.connect(connect_arm)
+
+
+# --------------------------------
+# TCP COMMANDS
+# --------------------------------
+
+def addresses(msg, client, unit):
+
+    try:
+        return arms.route(msg, client) is unit
+    except ValueError:
+        return False
+
+
+def handle_command(msg, client=None):
+
+    if "cancel" in msg:
+
+        name, result = arms.cancel(msg["cancel"])
+        return {"cancel": str(msg["cancel"]), "arm": name, "result": result}
+
+    elif msg.get("status") and "arm" not in msg:
+
+        # The arm the connection selected at the top level, like other commands
+        return get_status(top=client.options.get("arm") if client is not None else None)
+
+    elif msg.get("unsubscribe") and client is not None:
+
+        return {"unsubscribed": unsubscribe_all(client)}
+
+    elif "replay" in msg and client is not None:
+
+        return handle_replay(msg, client)
+
+    elif "coalesce" in msg:
+
+        if client is not None:
+            client.options["coalesce"] = bool(msg["coalesce"])
+
+        return {
+            "coalesce": wants_coalescing(client),
+            "targets": {unit.name: unit.slot.stats() for unit in arms}
+        }
+
+    try:
+        unit = arms.route(msg, client)
+    except ValueError as e:
+        return {"error": str(e), "arms": arms.names()}
+
+    if msg.get("select") and client is not None:
+
+        client.options["arm"] = unit.name
+        return {"selected": unit.name}
+
+    elif msg.get("reset"):
+
+        tcp_server.flush_queued(
+            "reset",
+            match=lambda queued, owner: addresses(queued, owner, unit)
+        )
+        unit.slot.clear()
+        unit.queue.cancel_all()
+        return reset_safe_position(unit.name)
+
+    elif msg.get("status"):
+
+        return get_status(unit.name)
+
+    elif msg.get("subscribe") and client is not None:
+
+        return handle_subscribe(
+            msg,
+            unit,
+            client,
+            lambda event: client.push(event, droppable=True)
+        )
+
+    elif "trajectory" in msg:
+
+        return handle_trajectory(msg, client)
+
+    elif all(k in msg for k in ("x", "y", "z")):
+
+        msg["arm"] = unit.name
+
+        rejection = reach_command(msg)
+
+        if rejection is not None:
+            return rejection
+
+        if msg.get("async") and client is not None:
 
             try:
+                unit.queue.submit(
+                    msg,
+                    client.push,
+                    command_id=msg.get("id"),
+                    seq=msg.get("seq")
+                )
+            except ValueError as e:
+                return {"error": str(e)}
+
+            # "accepted" has already been pushed by the queue
+            return None
+
+        suppressed = filter_move(msg, client)
+
+        if suppressed is not None:
+            return {"status": "suppressed", "reason": suppressed}
+
+        if wants_coalescing(client):
 
-                data = conn.recv(1024)
+            unit.slot.offer(make_target(
+                msg["x"],
+                msg["y"],
+                msg["z"],
+                roll=msg.get("roll", 180),
+                pitch=msg.get("pitch", 0),
+                yaw=msg.get("yaw", 0),
+                speed=msg.get("speed", 100),
+                source=client.addr if client is not None else None,
+                seq=msg.get("seq")
+            ))
 
-                if not data:
-                    break
+            return {"status": "queued", "superseded": unit.slot.superseded}
 
-                msg = json.loads(data.decode())
+        # Runs on the arm's own worker so other arms are never held up
+        return unit.submit(move_robot, msg)
 
-                if msg.get("reset"):
+    return {"error": "unknown command"}
 
-                    result = reset_safe_position()
 
-                elif msg.get("status"):
+def handle_trajectory(msg, client=None):
+
+    try:
+        unit = arms.route(msg, client)
+        waypoints = validate_trajectory(msg["trajectory"], defaults=msg)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    for index, waypoint in enumerate(waypoints):
+
+        rejection = reach_command(waypoint)
+
+        if rejection is not None:
+            return {**rejection, "waypoint": index}
+
+    planned = optimize_trajectory(waypoints) if msg.get("optimize") else None
+
+    if msg.get("async"):
+
+        # HTTP callers have no connection to push to; log their events
+        notify = client.push if client is not None else (
+            lambda event: log(f"Command event: {event}"))
+
+        try:
+            command_id = unit.queue.submit(
+                {"trajectory": waypoints},
+                notify,
+                command_id=msg.get("id"),
+                seq=msg.get("seq")
+            )
+        except ValueError as e:
+            return {"error": str(e)}
 
-                    result = get_status()
+        return None if client is not None else {"event": "accepted", "id": command_id}
 
-                elif all(k in msg for k in ("x", "y", "z")):
+    return unit.submit(run_trajectory_command, waypoints, unit.name, planned)
 
-                    result = move_robot(msg)
 
-                else:
+def handle_pose(pose, client=None):
 
-                    result = {"error": "unknown command"}
+    # Binary poses carry no arm field; they go to the connection's selected arm
+    unit = arms.route({}, client)
 
-                conn.sendall(json.dumps(result).encode())
+    # The decoder reuses the record for the next pose; copy it first
+    cmd = {**pose.as_command(), "arm": unit.name}
+    wants_ack = pose.wants_ack
 
-            except Exception as e:
+    rejection = reach_command(cmd)
 
-                log(f"Client error {addr}: {e}")
-                break
+    if rejection is not None:
+        return rejection
 
-    log(f"Client disconnected: {addr}")
+    suppressed = filter_move(cmd, client)
+
+    if suppressed is not None:
+        return {"status": "suppressed", "reason": suppressed} if wants_ack else None
+
+    if wants_coalescing(client):
+
+        unit.slot.offer(make_target(
+            cmd["x"], cmd["y"], cmd["z"],
+            cmd["roll"], cmd["pitch"], cmd["yaw"],
+            cmd["speed"],
+            source=client.addr if client is not None else None,
+            seq=cmd["seq"]
+        ))
+
+        return {"status": "queued"} if wants_ack else None
+
+    def move():
+
+        result = move_robot(cmd)
+
+        # Binary pose streams only hear back on failure or when asked to ack
+        if wants_ack or result.get("status") != "ok" or result.get("code"):
+            return result
+
+        return None
+
+    return unit.submit(move)
 
 
 # --------------------------------
 # TCP SERVER
 # --------------------------------
 
-def start_tcp_server():
+def command_failed(reply):
 
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # A move that ran but returned a non-zero controller code also failed
+    return reply_failed(reply) or bool(reply.get("code"))
 
-    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
-    server.bind((TCP_HOST, TCP_PORT))
-    server.listen()
+command_metrics = CommandMetrics(failed=command_failed)
 
-    log(f"TCP server running on port {TCP_PORT}")
+
+def is_control_command(msg):
+
+    # Never rate limited or queued behind moves
+    return (
+        msg.get("reset")
+        or msg.get("status")
+        or msg.get("unsubscribe")
+        or "cancel" in msg
+    )
+
+
+def is_connection_setting(msg):
+
+    # Change how the connection's later frames (binary poses too) are handled
+    return msg.get("select") or "coalesce" in msg
+
+
+tcp_server = CommandServer(
+    handle_command,
+    TCP_HOST,
+    TCP_PORT,
+    max_workers=TCP_MAX_WORKERS,
+    log=log,
+    pose_handler=handle_pose,
+    on_disconnect=unsubscribe_all,
+    admission=AdmissionPolicy(
+        rate=TCP_RATE_LIMIT,
+        burst=TCP_BURST,
+        queue_depth=TCP_QUEUE_DEPTH,
+        weights=TCP_CLIENT_WEIGHTS,
+        exempt=is_control_command,
+        ordered=is_connection_setting
+    ),
+    metrics=command_metrics
+)
+
+
+profiler = SamplingProfiler(
+    [
+        CommandServer._drain_frames,
+        handle_command,
+        handle_pose,
+        move_robot,
+        run_trajectory_command,
+        reset_safe_position,
+        get_status
+    ],
+    directory=PROFILE_DIR,
+    log=log
+)
+
+
+def start_tcp_server():
 
     while True:
 
         try:
 
-            conn, addr = server.accept()
-
-            threading.Thread(
-                target=client_handler,
-                args=(conn, addr),
-                daemon=True
-            ).start()
+            tcp_server.run()
 
         except Exception as e:
-            log(f"TCP server error: {e}")
+            log(f"TCP server error: {e}", level="error")
             wait_time = 15
             log(f"Retrying in {wait_time} seconds...")
 
@@ -251,16 +988,169 @@ def status():
     return get_status()
 
 
+@app.get("/arms")
+def arm_list():
+    return arms.status()
+
+
+@app.get("/arms/{name}/status")
+def arm_status_endpoint(name: str):
+    return get_status(name)
+
+
+@app.post("/trajectory")
+def trajectory(cmd: dict):
+
+    reply = handle_trajectory(cmd)
+
+    # Synchronous trajectories run on the arm's worker; wait for the result
+    return reply.result() if isinstance(reply, Future) else reply
+
+
+# /log?since=<seq>&level=warning&source=tcp returns only newer matching
+# records; pass the returned "next" as "since" on the following poll.
 @app.get("/log")
-def logs():
-    return {"log": debug_log}
+def logs(since: int = 0, level: str = None, source: str = None, limit: int = 200):
+
+    try:
+        records = debug_log.since(since, level=level, source=source, limit=limit)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    return {
+        "next": debug_log.last_seq,
+        "log": [format_record(r) for r in records],
+        "records": [record_dict(r) for r in records]
+    }
+
+
+# Prometheus scrape target: per-stage latency histograms and counters
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(command_metrics.render(), media_type=CONTENT_TYPE)
+
+
+# The same histograms as percentiles (ms), for a quick look without Prometheus
+@app.get("/metrics/latency")
+def latency():
+    return command_metrics.snapshot()
+
+
+# POST /profile/start?duration=30 samples the command path for a bounded
+# window; the report is written when it ends or on /profile/stop
+@app.post("/profile/start")
+def profile_start(duration: float = 30):
+    return {"started": profiler.start(duration), **profiler.status()}
+
+
+@app.post("/profile/stop")
+def profile_stop():
+    path = profiler.stop()
+    return {"report": path and os.path.basename(path), **profiler.status()}
+
+
+@app.get("/profile")
+def profile_status():
+    return {**profiler.status(), "reports": profiler.reports()}
+
+
+# Download a report (.txt) or its collapsed stacks for flame graphs (.folded)
+@app.get("/profile/{name}")
+def profile_download(name: str):
+
+    reports = profiler.reports()
+    if name not in reports and name.replace(".folded", ".txt") not in reports:
+        return {"error": f"Unknown report: {name}"}
+
+    return FileResponse(f"{PROFILE_DIR}/{name}", media_type="text/plain", filename=name)
+
+
+@app.get("/recordings")
+def recordings():
+    return {"recordings": [Recording(f"{RECORD_DIR}/{name}").describe()
+                           for name in list_recordings(RECORD_DIR)]}
+
+
+# /recordings/<name>?t0=<epoch>&t1=<epoch>&columns=t,pose,target returns
+# the samples in [t0, t1] column by column
+@app.get("/recordings/{name}")
+def recording_range(name: str, t0: float = None, t1: float = None, columns: str = None):
+
+    try:
+        recording = open_recording(name)
+        names = columns.split(",") if columns else recording.columns
+        unknown = [c for c in names if c not in recording.columns]
+        if unknown:
+            raise ValueError(f"Unknown columns: {unknown}")
+    except ValueError as e:
+        return {"error": str(e)}
+
+    data = recording.range(t0, t1, names)
+
+    return {
+        **recording.describe(),
+        # NaN (no commanded target) is not valid JSON
+        "columns": {c: [[None if v != v else v for v in row] if isinstance(row, list)
+                        else row for row in data[c].tolist()] for c in names}
+    }
+
+
+# Same commands as the TCP server, one JSON command per text frame.
+# They go through the TCP server's admission control and metrics.
+# /ws?telemetry=5 subscribes to the default arm's telemetry at 5 Hz on connect.
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket, telemetry: float = 0):
+
+    def on_connect(client):
+
+        if telemetry > 0:
+            reply = handle_subscribe(
+                {"rate": telemetry},
+                arms.get(),
+                client,
+                lambda event: client.push(event, droppable=True)
+            )
+            client.push(reply)
+
+    await serve_websocket(
+        websocket,
+        handle_command,
+        tcp_server.executor,
+        pose_handler=handle_pose,
+        on_connect=on_connect,
+        on_disconnect=unsubscribe_all,
+        log=log,
+        server=tcp_server if tcp_server.loop is not None else None
+    )
 
 # --------------------------------
 # MAIN
 # --------------------------------
 
 def main():
-    reset_safe_position()
+
+    for unit in arms:
+
+        if not unit.connected:
+            continue
+
+        reset_safe_position(unit.name)
+
+        if RECORD_ENABLED:
+            start_recorder(unit)
+
+        threading.Thread(
+            target=start_target_follower,
+            args=(unit,),
+            daemon=True
+        ).start()
+
+        threading.Thread(
+            target=start_motion_worker,
+            args=(unit,),
+            daemon=True
+        ).start()
+
     # start TCP server
     threading.Thread(
         target=start_tcp_server,
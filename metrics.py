@@ -0,0 +1,407 @@
+"""Command latency histograms and counters with Prometheus text export.
+
+Every TCP command carries a :class:`Trace` from the moment its bytes are
+read until its reply is written. The server laps it through the stages it
+owns::
+
+    receive    bytes read -> parsing starts (includes waiting behind earlier
+               frames from the same read)
+    parse      frame decoding
+    admission  waiting in the per-client admission queue
+    worker     waiting for a command worker thread
+    handler    the handler, including any arm-executor future it returns
+    send       writing the reply
+
+Application code adds nested stages with ``with timed("motion"):``. The
+trace is a context variable: it follows the handler onto its worker thread
+and (through :meth:`arm_pool.ArmUnit.submit`) onto the arm's executor, and
+``timed`` is a no-op when no command is being traced (e.g. Gradio calls).
+
+Histograms are log-linear in the spirit of HdrHistogram: a fixed array of
+buckets, 16 per power of two from 1 µs to about two minutes. Recording is
+an index computation and an increment, memory does not grow with the number
+of samples, and percentiles are accurate to a bucket width (about 6 %).
+"""
+
+import contextvars
+import math
+import threading
+import time
+from bisect import bisect_right
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+LOWEST = 1e-6          # s, smallest distinguishable latency
+HIGHEST = 120.0        # s, larger values land in the last bucket
+SUB_BUCKETS = 16       # per power of two
+
+# le= boundaries exported to Prometheus (s); percentiles use the full buckets
+EXPORT_BOUNDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PERCENTILES = (50, 90, 99, 99.9)
+
+# Top-level keys that name a command, checked in order; see command_type()
+COMMAND_KEYS = ("cancel", "reset", "select", "coalesce", "unsubscribe", "subscribe",
+                "servo", "replay", "framing", "trajectory", "status")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Fixed-size log-linear latency histogram (seconds)"""
+
+    def __init__(self, lowest=LOWEST, highest=HIGHEST, sub_buckets=SUB_BUCKETS):
+        self.lowest = lowest
+        self.sub_buckets = sub_buckets
+        octaves = max(1, math.ceil(math.log2(highest / lowest)))
+        # Upper edge of every bucket; bucket 0 holds everything <= lowest
+        self.bounds = [lowest] + [
+            lowest * 2 ** (i // sub_buckets) * (1 + (i % sub_buckets + 1) / sub_buckets)
+            for i in range(octaves * sub_buckets)
+        ]
+        self.counts = [0] * len(self.bounds)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def _index(self, value):
+        if value <= self.lowest:
+            return 0
+        mantissa, exponent = math.frexp(value / self.lowest)  # 0.5 <= mantissa < 1
+        index = (exponent - 1) * self.sub_buckets + int((mantissa * 2 - 1) * self.sub_buckets) + 1
+        return min(index, len(self.counts) - 1)
+
+    def record(self, value):
+        index = self._index(value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, percent):
+        """Upper edge of the bucket holding the ``percent``-th percentile"""
+        if not self.count:
+            return 0.0
+        wanted = math.ceil(self.count * percent / 100.0)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(self.bounds[index], self.max)
+        return self.max
+
+    def cumulative(self, bounds=EXPORT_BOUNDS):
+        """``[(le, count <= le), ...]`` for Prometheus ``_bucket`` lines.
+
+        A bucket straddling ``le`` is counted above it, so counts err slow.
+        """
+        counts = list(self.counts)
+        result = []
+        seen = 0
+        start = 0
+        for le in bounds:
+            end = bisect_right(self.bounds, le)
+            seen += sum(counts[start:end])
+            start = end
+            result.append((le, seen))
+        return result
+
+    def describe(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+            **{f"p{p:g}_ms": round(self.percentile(p) * 1000, 3) for p in PERCENTILES},
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Family:
+    """A metric name with one child per combination of label values"""
+
+    def __init__(self, name, kind, help, labelnames, factory):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._factory()
+        return child
+
+    def items(self):
+        return list(self._children.items())
+
+
+class Registry:
+    def __init__(self):
+        self._families = {}
+
+    def _add(self, name, kind, help, labelnames, factory):
+        if name in self._families:
+            raise ValueError(f"Metric {name} is already registered")
+        family = self._families[name] = Family(name, kind, help, labelnames, factory)
+        return family
+
+    def histogram(self, name, help, labelnames=()):
+        return self._add(name, "histogram", help, labelnames, Histogram)
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(name, "counter", help, labelnames, Counter)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for family in self._families.values():
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for values, child in family.items():
+                labels = _labels(family.labelnames, values)
+                if family.kind == "counter":
+                    lines.append(f"{family.name}{{{labels}}} {child.value}")
+                    continue
+                sep = "," if labels else ""
+                for le, count in child.cumulative():
+                    lines.append(f'{family.name}_bucket{{{labels}{sep}le="{le:g}"}} {count}')
+                lines.append(f'{family.name}_bucket{{{labels}{sep}le="+Inf"}} {child.count}')
+                lines.append(f"{family.name}_sum{{{labels}}} {child.sum:.6f}")
+                lines.append(f"{family.name}_count{{{labels}}} {child.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Every series as JSON: percentiles for histograms, values for counters"""
+        result = {}
+        for family in self._families.values():
+            result[family.name] = [
+                {**dict(zip(family.labelnames, values)),
+                 **(child.describe() if family.kind == "histogram" else {"value": child.value})}
+                for values, child in family.items()
+            ]
+        return result
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# ---- per-command traces ----
+_current = contextvars.ContextVar("command_trace", default=None)
+
+
+class Trace:
+    """Stage timings of one command; ``lap`` closes the stage since the last lap"""
+
+    __slots__ = ("kind", "client", "start", "t", "stages", "failed")
+
+    def __init__(self, kind, client, start=None):
+        self.kind = kind
+        self.client = client
+        self.start = self.t = time.perf_counter() if start is None else start
+        self.stages = {}
+        self.failed = None  # overrides the reply check when set
+
+    def lap(self, stage, now=None):
+        now = time.perf_counter() if now is None else now
+        self.add(stage, now - self.t)
+        self.t = now
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def call(self, fn, *args):
+        """Run ``fn`` with this trace current; the wait for the thread is ``worker``"""
+        self.lap("worker")
+        token = _current.set(self)
+        try:
+            return fn(*args)
+        finally:
+            _current.reset(token)
+
+
+def current_trace():
+    return _current.get()
+
+
+def record(stage, seconds):
+    """Add ``seconds`` to ``stage`` of the current command, if one is traced"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+class _Timed:
+    __slots__ = ("stage", "trace", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.trace = _current.get()
+        if self.trace is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.trace is not None:
+            self.trace.add(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def timed(stage):
+    """``with timed("precheck"):`` adds the block's time to the current command"""
+    return _Timed(stage)
+
+
+def command_type(msg):
+    """Short label for a JSON command, e.g. ``move``, ``move_async`` or ``reset``"""
+    for key in COMMAND_KEYS:
+        if key in msg:
+            kind = key
+            break
+    else:
+        kind = "move" if all(k in msg for k in ("x", "y", "z")) else "other"
+    if kind in ("move", "trajectory") and msg.get("async"):
+        kind += "_async"
+    return kind
+
+
+def client_label(client):
+    """Clients are labelled by host so reconnects don't create new series"""
+    return addr_label(getattr(client, "addr", None))
+
+
+def addr_label(addr):
+    if isinstance(addr, tuple) and addr:
+        return str(addr[0])
+    return "local" if addr is None else str(addr)
+
+
+def reply_failed(reply):
+    return "error" in reply or reply.get("status") == "error"
+
+
+class CommandMetrics:
+    """The latency histograms and counters of one command server.
+
+    ``command_type(msg)`` labels commands and ``failed(reply)`` decides
+    which replies count as errors.
+    """
+
+    def __init__(self, registry=None, command_type=command_type, failed=reply_failed):
+        self.registry = registry if registry is not None else Registry()
+        self.command_type = command_type
+        self.failed = failed
+        r = self.registry
+        self.stages = r.histogram("robot_command_stage_seconds",
+                                  "Time spent in each stage of a command",
+                                  ("command", "stage"))
+        self.latency = r.histogram("robot_command_seconds",
+                                   "Time from receiving a command to sending its reply",
+                                   ("command", "client"))
+        self.commands = r.counter("robot_commands_total", "Commands completed",
+                                  ("command", "client"))
+        self.errors = r.counter("robot_command_errors_total", "Commands answered with an error",
+                                ("command", "client"))
+        self.rejections = r.counter("robot_commands_rejected_total",
+                                    "Commands refused by admission control",
+                                    ("reason", "client"))
+        self.recoveries = r.counter("robot_recoveries_total",
+                                    "Arm error recoveries and resets", ("arm", "reason"))
+        self.suppressed = r.counter("robot_moves_suppressed_total",
+                                    "Streamed moves dropped by the deadband filter",
+                                    ("reason", "client"))
+
+    def start(self, msg, client, received, parse_start):
+        """Trace for a command whose bytes were read at ``received`` and whose
+        frame was decoded from ``parse_start`` until now"""
+        kind = self.command_type(msg) if isinstance(msg, dict) else "pose"
+        trace = Trace(kind, client_label(client), received)
+        trace.lap("receive", parse_start)
+        trace.lap("parse")
+        return trace
+
+    def finish(self, trace, reply=None):
+        now = time.perf_counter()
+        for stage, seconds in trace.stages.items():
+            self.stages.labels(trace.kind, stage).record(seconds)
+        self.latency.labels(trace.kind, trace.client).record(now - trace.start)
+        self.commands.labels(trace.kind, trace.client).inc()
+        failed = trace.failed
+        if failed is None:
+            failed = reply is not None and self.failed(reply)
+        if failed:
+            self.errors.labels(trace.kind, trace.client).inc()
+
+    def rejected(self, client, reason):
+        self.rejections.labels(reason, client_label(client)).inc()
+
+    def run(self, kind, fn, *args, client="queue", failed=None):
+        """Call ``fn(*args)`` as a traced command of its own, e.g. a queued
+        async move; ``failed(result)`` decides whether it counts as an error"""
+        trace = Trace(kind, client)
+        token = _current.set(trace)
+        try:
+            result = fn(*args)
+            if failed is not None:
+                trace.failed = bool(failed(result))
+            return result
+        except Exception:
+            trace.failed = True
+            raise
+        finally:
+            _current.reset(token)
+            self.finish(trace)
+
+    def render(self):
+        return self.registry.render()
+
+    def snapshot(self):
+        return self.registry.snapshot()
+
+
+def serve_metrics(registry, host="0.0.0.0", port=9105, log=print):
+    """Serve ``registry`` on ``http://host:port/metrics`` from a daemon thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # a scrape every few seconds would flood the debug log
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log(f"[METRICS] Exporter listening on {host}:{port}/metrics")
+    return server
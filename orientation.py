@@ -0,0 +1,195 @@
+"""Orientation maths for xArm poses.
+
+The SDK describes orientation as ``roll``, ``pitch``, ``yaw`` in degrees,
+applied as ``R = Rz(yaw) @ Ry(pitch) @ Rx(roll)``. The same rotation has
+many spellings: angles repeat every 360 degrees, and
+``(roll + 180, 180 - pitch, yaw + 180)`` is the same rotation as
+``(roll, pitch, yaw)``. A target that spells the current orientation
+differently (``-180`` instead of ``180``, or a 0-360 slider value) can send
+the controller the long way round.
+
+:func:`nearest_euler` picks the spelling of a target closest to a reference
+orientation, so the move from the reference is the shortest rotation.
+:func:`continuous_euler` does the same along a whole sequence of poses.
+
+Every function is vectorized over leading dimensions. Quaternions are
+``(w, x, y, z)`` arrays of shape ``(..., 4)``, Euler angles ``(..., 3)``
+degrees and rotation matrices ``(..., 3, 3)``. :func:`slerp` interpolates
+batches of quaternion pairs along the shorter arc.
+"""
+
+import numpy as np
+
+
+def normalize_degrees(angles):
+    """Angles mapped to [-180, 180)"""
+    return (np.asarray(angles, dtype=float) + 180.0) % 360.0 - 180.0
+
+
+def euler_to_quaternion(rpy):
+    half = np.radians(np.asarray(rpy, dtype=float)) / 2.0
+    cr, cp, cy = np.cos(half[..., 0]), np.cos(half[..., 1]), np.cos(half[..., 2])
+    sr, sp, sy = np.sin(half[..., 0]), np.sin(half[..., 1]), np.sin(half[..., 2])
+    return np.stack([
+        cr * cp * cy + sr * sp * sy,
+        sr * cp * cy - cr * sp * sy,
+        cr * sp * cy + sr * cp * sy,
+        cr * cp * sy - sr * sp * cy,
+    ], axis=-1)
+
+
+def quaternion_to_euler(q):
+    q = normalize_quaternion(q)
+    w, x, y, z = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    roll = np.arctan2(2.0 * (w * x + y * z), 1.0 - 2.0 * (x * x + y * y))
+    pitch = np.arcsin(np.clip(2.0 * (w * y - z * x), -1.0, 1.0))
+    yaw = np.arctan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+    return np.degrees(np.stack([roll, pitch, yaw], axis=-1))
+
+
+def quaternion_to_matrix(q):
+    q = normalize_quaternion(q)
+    w, x, y, z = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    return np.stack([
+        np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)], axis=-1),
+        np.stack([2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)], axis=-1),
+        np.stack([2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)], axis=-1),
+    ], axis=-2)
+
+
+def matrix_to_quaternion(m):
+    """Quaternion of rotation matrices, from the best conditioned pivot"""
+    m = np.asarray(m, dtype=float)
+    m00, m01, m02 = m[..., 0, 0], m[..., 0, 1], m[..., 0, 2]
+    m10, m11, m12 = m[..., 1, 0], m[..., 1, 1], m[..., 1, 2]
+    m20, m21, m22 = m[..., 2, 0], m[..., 2, 1], m[..., 2, 2]
+    pivots = np.stack([m00 + m11 + m22, m00, m11, m22], axis=-1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = 2.0 * np.sqrt(np.maximum(np.stack([
+            1.0 + m00 + m11 + m22,
+            1.0 + m00 - m11 - m22,
+            1.0 - m00 + m11 - m22,
+            1.0 - m00 - m11 + m22,
+        ], axis=-1), 0.0))
+        candidates = np.stack([
+            np.stack([s[..., 0] / 4, (m21 - m12) / s[..., 0], (m02 - m20) / s[..., 0], (m10 - m01) / s[..., 0]], -1),
+            np.stack([(m21 - m12) / s[..., 1], s[..., 1] / 4, (m01 + m10) / s[..., 1], (m02 + m20) / s[..., 1]], -1),
+            np.stack([(m02 - m20) / s[..., 2], (m01 + m10) / s[..., 2], s[..., 2] / 4, (m12 + m21) / s[..., 2]], -1),
+            np.stack([(m10 - m01) / s[..., 3], (m02 + m20) / s[..., 3], (m12 + m21) / s[..., 3], s[..., 3] / 4], -1),
+        ], axis=-2)
+
+    best = pivots.argmax(axis=-1)[..., None, None]
+    q = np.take_along_axis(candidates, best, axis=-2)[..., 0, :]
+    return normalize_quaternion(q)
+
+
+def euler_to_matrix(rpy):
+    return quaternion_to_matrix(euler_to_quaternion(rpy))
+
+
+def matrix_to_euler(m):
+    return quaternion_to_euler(matrix_to_quaternion(m))
+
+
+def normalize_quaternion(q):
+    q = np.asarray(q, dtype=float)
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+
+def quaternion_angle(q0, q1):
+    """Rotation angle in degrees between two (batches of) quaternions"""
+    dot = np.abs(np.sum(normalize_quaternion(q0) * normalize_quaternion(q1), axis=-1))
+    return np.degrees(2.0 * np.arccos(np.clip(dot, 0.0, 1.0)))
+
+
+def rotation_angle(rpy0, rpy1):
+    """Angle in degrees of the shortest rotation between two orientations"""
+    return quaternion_angle(euler_to_quaternion(rpy0), euler_to_quaternion(rpy1))
+
+
+def slerp(q0, q1, t):
+    """Spherical interpolation from ``q0`` to ``q1`` along the shorter arc.
+
+    ``q0``, ``q1`` (``(..., 4)``) and ``t`` (``(...)``) broadcast together,
+    e.g. one pair and an array of ``t``, or one ``t`` per pair.
+    """
+    q0 = normalize_quaternion(q0)
+    q1 = normalize_quaternion(q1)
+    t = np.asarray(t, dtype=float)[..., None]
+
+    dot = np.sum(q0 * q1, axis=-1, keepdims=True)
+    q1 = np.where(dot < 0.0, -q1, q1)  # q and -q are the same rotation
+    dot = np.abs(dot)
+
+    theta = np.arccos(np.clip(dot, -1.0, 1.0))
+    sin = np.sin(theta)
+    close = sin < 1e-6
+    with np.errstate(divide="ignore", invalid="ignore"):
+        w0 = np.where(close, 1.0 - t, np.sin((1.0 - t) * theta) / sin)
+        w1 = np.where(close, t, np.sin(t * theta) / sin)
+    return normalize_quaternion(w0 * q0 + w1 * q1)
+
+
+def equivalent_euler(rpy):
+    """The other roll/pitch/yaw spelling of the same rotation, normalized"""
+    rpy = np.asarray(rpy, dtype=float)
+    return normalize_degrees(np.stack([rpy[..., 0] + 180.0, 180.0 - rpy[..., 1], rpy[..., 2] + 180.0], axis=-1))
+
+
+def nearest_euler(rpy, reference):
+    """The spelling of ``rpy`` closest to ``reference``, each angle within
+    180 degrees of the reference angle.
+
+    Moving from ``reference`` to the result turns every angle the short
+    way, e.g. ``(-180, 0, 270)`` from ``(180, 0, 0)`` becomes ``(180, 0, -90)``.
+    The result is not wrapped, so ``-175`` from ``175`` is ``185``. With a
+    reference in [-180, 180] (such as the arm's measured pose) it stays
+    within [-360, 360]; chaining results as references lets angles grow.
+    """
+    rpy = np.asarray(rpy, dtype=float)
+    reference = np.asarray(reference, dtype=float)
+    candidates = np.stack([normalize_degrees(rpy), equivalent_euler(rpy)], axis=-2)
+
+    steps = normalize_degrees(candidates - reference[..., None, :])
+    best = np.abs(steps).max(axis=-1).argmin(axis=-1)[..., None, None]
+    return reference + np.take_along_axis(steps, best, axis=-2)[..., 0, :]
+
+
+def _distance(u, v):
+    return np.abs(normalize_degrees(u - v)).max(axis=-1)
+
+
+def continuous_euler(rpy, reference=None):
+    """Spell a sequence of orientations so each step is the shortest rotation.
+
+    ``rpy`` is ``(N, 3)``; the first row is taken relative to ``reference``
+    (e.g. the arm's current orientation), or only normalized if ``None``.
+
+    Each row takes whichever of its two spellings is closer to the row
+    before it (to ``reference`` for the first row), without a loop. Unlike
+    :func:`nearest_euler` the angles are normalized to [-180, 180]; an angle
+    of exactly 180 takes the sign of the angle before it.
+    """
+    rpy = np.asarray(rpy, dtype=float)
+    if len(rpy) == 0:
+        return rpy.copy()
+    a = normalize_degrees(rpy)
+    b = equivalent_euler(rpy)
+
+    # Swapping both spellings preserves distances, so whether row i switches
+    # spelling relative to row i - 1 doesn't depend on how that row was spelt
+    first = False if reference is None else _distance(b[0], reference) < _distance(a[0], reference)
+    switch = _distance(a[1:], a[:-1]) > _distance(b[1:], a[:-1])
+    spelling = (np.concatenate([[first], switch]).cumsum() % 2).astype(bool)
+    out = np.where(spelling[:, None], b, a)
+
+    # 180 and -180 are the same angle; keep the side the previous angle was on
+    tie = out == -180.0
+    if tie.any():
+        rows = np.arange(len(out))[:, None]
+        last = np.maximum.accumulate(np.where(tie, -1, rows), axis=0)
+        start = np.full(3, -180.0) if reference is None else np.asarray(reference, dtype=float)
+        before = np.vstack([start, out])[np.maximum(last, -1) + 1, np.arange(3)]
+        out = np.where(tie & (before > 0), 180.0, out)
+    return out
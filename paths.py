@@ -0,0 +1,213 @@
+"""Dense pose paths for shapes and sweeps.
+
+Every generator returns an ``(N, 6)`` float array of poses
+``(x, y, z, roll, pitch, yaw)`` in mm and degrees, built in one NumPy call.
+Consecutive poses are at most ``step`` mm apart (``angle_step`` degrees for
+orientation), and within a segment they are evenly spaced. Corners of
+polylines and rectangles are kept exactly, so a square is still square at a
+coarse resolution.
+
+A path is just an array, so it can be shifted, stacked or clipped with
+NumPy. :func:`to_waypoints` turns it into waypoints for
+:func:`trajectory.validate_trajectory` / :func:`trajectory.run_trajectory`.
+There the controller blends the segments into one continuous motion. For a
+servo stream, :func:`timestamps` gives the time of each pose at a constant
+speed::
+
+    path = paths.rectangle((100, 100, 150), 100, 100, step=5)
+    run_trajectory(arm, validate_trajectory(paths.to_waypoints(path, speed=100)))
+"""
+
+import math
+
+import numpy as np
+
+from orientation import continuous_euler, euler_to_quaternion, quaternion_to_euler, rotation_angle, slerp
+
+
+DEFAULT_STEP = 2.0          # mm between poses
+DEFAULT_ANGLE_STEP = 1.0    # degrees between poses in orientation sweeps
+ORIENTATION = (180.0, 0.0, 0.0)  # tool pointing down
+
+AXES = {"roll": 3, "pitch": 4, "yaw": 5}
+PLANES = {"xy": (0, 1), "xz": (0, 2), "yz": (1, 2)}
+
+
+def _pose(point, orientation=ORIENTATION):
+    """A 3- or 6-element point as a 6-element pose"""
+    point = np.asarray(point, dtype=float)
+    if point.shape == (3,):
+        return np.concatenate([point, np.asarray(orientation, dtype=float)])
+    if point.shape != (6,):
+        raise ValueError("Points must be (x, y, z) or (x, y, z, roll, pitch, yaw)")
+    return point
+
+
+def _check_step(step):
+    if not step > 0:
+        raise ValueError("step must be positive")
+
+
+def _pieces(distance, turn, step, angle_step):
+    """Pieces a segment must be cut into to respect both steps"""
+    return np.maximum(np.ceil(np.maximum(distance / step, turn / angle_step)), 1).astype(np.int64)
+
+
+def polyline(points, step=DEFAULT_STEP, orientation=ORIENTATION, angle_step=DEFAULT_ANGLE_STEP):
+    """Straight segments through ``points``, every vertex included.
+
+    Points are 3- or 6-element; 3-element points take ``orientation``.
+    Along a segment the tool turns by the shortest rotation (slerp), and
+    the angles are spelled continuously from the first point.
+    """
+    _check_step(step)
+    vertices = np.array([_pose(p, orientation) for p in points])
+    if len(vertices) < 2:
+        raise ValueError("A path needs at least two points")
+
+    delta = np.diff(vertices, axis=0)
+    turn = rotation_angle(vertices[:-1, 3:], vertices[1:, 3:])
+    pieces = _pieces(np.linalg.norm(delta[:, :3], axis=1), turn, step, angle_step)
+
+    # Segment index and fraction for every pose but the final vertex
+    segment = np.repeat(np.arange(len(delta)), pieces)
+    starts = np.cumsum(pieces) - pieces
+    fraction = (np.arange(pieces.sum()) - starts[segment]) / pieces[segment]
+
+    path = np.vstack([vertices[segment] + delta[segment] * fraction[:, None], vertices[-1]])
+    if turn.any():
+        quaternions = euler_to_quaternion(vertices[:, 3:])
+        path[:-1, 3:] = quaternion_to_euler(
+            slerp(quaternions[segment], quaternions[segment + 1], fraction))
+        path[:, 3:] = continuous_euler(path[:, 3:], vertices[0, 3:])
+    return path
+
+
+def line(start, end, step=DEFAULT_STEP, orientation=ORIENTATION, angle_step=DEFAULT_ANGLE_STEP):
+    """Straight line from ``start`` to ``end``"""
+    return polyline([start, end], step, orientation, angle_step)
+
+
+def rectangle(corner, width, height, step=DEFAULT_STEP, plane="xy", orientation=ORIENTATION):
+    """Closed rectangle starting and ending at ``corner`` (x, y, z).
+
+    ``width`` runs along the first axis of ``plane`` and ``height`` along
+    the second; negative sizes draw towards smaller coordinates.
+    """
+    u, v = PLANES[plane]
+    corner = np.asarray(corner, dtype=float)
+    offsets = np.array([(0, 0), (width, 0), (width, height), (0, height), (0, 0)], dtype=float)
+    points = np.repeat(corner[None, :], len(offsets), axis=0)
+    points[:, u] += offsets[:, 0]
+    points[:, v] += offsets[:, 1]
+    return polyline(points, step, orientation)
+
+
+def arc(center, radius, start, end, step=DEFAULT_STEP, plane="xy", orientation=ORIENTATION):
+    """Arc of ``radius`` around ``center`` from angle ``start`` to ``end``.
+
+    Angles are in degrees from the first axis of ``plane`` towards the
+    second; ``end < start`` runs clockwise.
+    """
+    _check_step(step)
+    if not radius > 0:
+        raise ValueError("radius must be positive")
+    u, v = PLANES[plane]
+    sweep = math.radians(end - start)
+    pieces = max(int(math.ceil(abs(sweep) * radius / step)), 1)
+    theta = math.radians(start) + np.linspace(0.0, sweep, pieces + 1)
+
+    path = np.empty((pieces + 1, 6))
+    path[:, :3] = np.asarray(center, dtype=float)
+    path[:, u] += radius * np.cos(theta)
+    path[:, v] += radius * np.sin(theta)
+    path[:, 3:] = orientation
+    return path
+
+
+def circle(center, radius, step=DEFAULT_STEP, start=0.0, plane="xy", orientation=ORIENTATION):
+    """Full circle around ``center``, closed at angle ``start``"""
+    return arc(center, radius, start, start + 360.0, step, plane, orientation)
+
+
+def spiral(center, start_radius, end_radius, turns, step=DEFAULT_STEP, rise=0.0,
+           start=0.0, plane="xy", orientation=ORIENTATION):
+    """Archimedean spiral from ``start_radius`` to ``end_radius``.
+
+    ``rise`` moves the path that far along the axis normal to ``plane`` over
+    the whole spiral (a helix when the radii are equal). Poses are evenly
+    spaced by arc length.
+    """
+    _check_step(step)
+    if turns <= 0 or min(start_radius, end_radius) < 0:
+        raise ValueError("turns must be positive and radii non-negative")
+    u, v = PLANES[plane]
+    w = 3 - u - v
+
+    # Oversample in angle, then place poses evenly along the arc length
+    estimate = 2 * math.pi * turns * max(start_radius, end_radius) + abs(rise)
+    s = np.linspace(0.0, 1.0, max(int(estimate / step) * 8, 64) + 1)
+    theta = math.radians(start) + 2 * math.pi * turns * s
+    r = start_radius + (end_radius - start_radius) * s
+
+    path = np.empty((len(s), 6))
+    path[:, :3] = np.asarray(center, dtype=float)
+    path[:, u] += r * np.cos(theta)
+    path[:, v] += r * np.sin(theta)
+    path[:, w] += rise * s
+    path[:, 3:] = orientation
+    return resample(path, step)
+
+
+def sweep(pose, axis, start, end, angle_step=DEFAULT_ANGLE_STEP):
+    """Turn one orientation ``axis`` of ``pose`` from ``start`` to ``end`` degrees in place"""
+    if axis not in AXES:
+        raise ValueError("Axis must be 'roll', 'pitch', or 'yaw'")
+    if not angle_step > 0:
+        raise ValueError("angle_step must be positive")
+    pieces = max(int(math.ceil(abs(end - start) / angle_step)), 1)
+    path = np.repeat(_pose(pose)[None, :], pieces + 1, axis=0)
+    path[:, AXES[axis]] = np.linspace(start, end, pieces + 1)
+    return path
+
+
+def concatenate(*paths):
+    """Join paths, dropping a pose repeated where one ends and the next starts"""
+    joined = [paths[0]]
+    for path in paths[1:]:
+        joined.append(path[1:] if np.allclose(path[0], joined[-1][-1]) else path)
+    return np.vstack(joined)
+
+
+def path_length(path):
+    """Cumulative Cartesian distance (mm) at every pose, starting at 0"""
+    distance = np.linalg.norm(np.diff(path[:, :3], axis=0), axis=1)
+    return np.concatenate([[0.0], np.cumsum(distance)])
+
+
+def resample(path, step=DEFAULT_STEP):
+    """The same path with poses evenly spaced ``step`` mm (or less) apart"""
+    _check_step(step)
+    length = path_length(path)
+    if length[-1] == 0:
+        return path[[0, -1]]
+    at = np.linspace(0.0, length[-1], int(math.ceil(length[-1] / step)) + 1)
+    return np.column_stack([np.interp(at, length, path[:, i]) for i in range(6)])
+
+
+def timestamps(path, speed, angular_speed=None):
+    """Time (s) of every pose when the path is run at a constant ``speed`` mm/s.
+
+    Orientation-only moves are timed at ``angular_speed`` degrees/s
+    (``speed`` if not given).
+    """
+    distance = np.linalg.norm(np.diff(path[:, :3], axis=0), axis=1) / speed
+    turn = rotation_angle(path[:-1, 3:], path[1:, 3:]) / (angular_speed or speed)
+    return np.concatenate([[0.0], np.cumsum(np.maximum(distance, turn))])
+
+
+def to_waypoints(path, speed=None, mvacc=None, radius=None):
+    """Waypoint dicts for :func:`trajectory.validate_trajectory`"""
+    keys = ("x", "y", "z", "roll", "pitch", "yaw")
+    segment = {k: v for k, v in (("speed", speed), ("mvacc", mvacc), ("radius", radius)) if v is not None}
+    return [{**dict(zip(keys, pose)), **segment} for pose in path.tolist()]
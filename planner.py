@@ -0,0 +1,197 @@
+"""Time-optimal speed and acceleration for a sequence of poses.
+
+A hand-picked constant ``speed`` makes short hops crawl and caps long
+moves. :func:`plan_motion` instead picks, for every segment of a path, the
+fastest trapezoidal profile (accelerate, cruise, decelerate) the
+:class:`Limits` allow:
+
+- Cartesian speed and acceleration of the TCP;
+- angular speed of the tool, so turns in place are limited too;
+- corner speed, ``sqrt(accel * R)`` with ``R`` the radius of the path
+  through three consecutive positions, so curves and corners slow down
+  without sharp corners stopping the arm completely;
+- joint speed and acceleration, when the joint angles of the waypoints
+  are given (e.g. from ``arm.get_inverse_kinematics``).
+
+The profile is the usual forward/backward pass: the speed at each waypoint
+is the lowest of its own limit, what can be reached by accelerating from
+earlier waypoints and what can still be braked from before later ones.
+Both passes are a running minimum over the path, so each is one NumPy
+``minimum.accumulate``. A thousand waypoints plan in about half a
+millisecond and ten thousand in a few. The path starts and ends at rest.
+
+The result is a :class:`Plan` of per-segment ``speed``/``mvacc`` (what
+``set_position`` takes) and the predicted time at every waypoint. It also
+gives the time of the same path at the constant ``speed``/``mvacc`` the
+scripts used before. The controller takes one jerk setting for all moves,
+so the profiles are not jerk-limited.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from orientation import rotation_angle
+from trajectory import MAX_MVACC, MAX_SPEED
+
+
+Limits = namedtuple(
+    "Limits",
+    ["speed", "accel", "angular_speed", "joint_speed", "joint_accel"],
+    defaults=[500.0, 2000.0, 90.0, 180.0, 1000.0],
+)
+Limits.__doc__ = """Motion limits: mm/s, mm/s^2, deg/s, and deg/s, deg/s^2 for every joint"""
+
+BASELINE_SPEED = 100.0   # mm/s, the constant speed moves used so far
+BASELINE_MVACC = 500.0   # mm/s^2
+
+POSE_KEYS = ("x", "y", "z", "roll", "pitch", "yaw")
+
+
+def _poses(path):
+    """(N, 6) array from a pose array or a list of waypoint dicts"""
+    if isinstance(path, np.ndarray):
+        return path.astype(float, copy=False)
+    return np.array([[float(p[k]) for k in POSE_KEYS] for p in path])
+
+
+def _waypoint_caps(path, key):
+    """Per-segment cap from waypoint ``key`` (the waypoint a segment ends at)"""
+    if isinstance(path, np.ndarray):
+        return None
+    caps = np.array([p.get(key) if p.get(key) is not None else np.inf for p in path[1:]], dtype=float)
+    return caps if np.isfinite(caps).any() else None
+
+
+def _corner_radius(positions):
+    """Radius of the circle through every three consecutive positions.
+
+    Straight runs give ``inf`` and reversals 0 (the arm has to stop).
+    """
+    a = positions[1:-1] - positions[:-2]
+    b = positions[2:] - positions[1:-1]
+    la, lb = np.linalg.norm(a, axis=1), np.linalg.norm(b, axis=1)
+    lc = np.linalg.norm(positions[2:] - positions[:-2], axis=1)
+    cross = np.linalg.norm(np.cross(a, b), axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        radius = la * lb * lc / (2.0 * cross)
+    straight = cross <= 1e-9 * la * lb
+    return np.where(straight, np.where((a * b).sum(axis=1) >= 0, np.inf, 0.0), radius)
+
+
+def _profile(length, cap, accel, node_cap):
+    """Waypoint speeds, segment peak speeds and segment times.
+
+    ``length``, ``cap`` and ``accel`` are per segment; ``node_cap`` is per
+    interior waypoint.
+    """
+    limit = np.minimum(np.append(cap, 0.0), np.insert(cap, 0, 0.0))
+    limit[1:-1] = np.minimum(limit[1:-1], node_cap)
+    limit2 = limit ** 2
+
+    # v_i^2 <= v_k^2 + 2 * (work from k to i), for every k before (and after) i
+    work = np.concatenate([[0.0], np.cumsum(2.0 * accel * length)])
+    forward = np.minimum.accumulate(limit2 - work) + work
+    backward = np.minimum.accumulate((limit2 + work)[::-1])[::-1] - work
+    v = np.sqrt(np.maximum(np.minimum(forward, backward), 0.0))
+
+    v0, v1 = v[:-1], v[1:]
+    peak = np.minimum(cap, np.sqrt((v0 ** 2 + v1 ** 2) / 2.0 + accel * length))
+    peak = np.maximum(peak, np.maximum(v0, v1))
+    ramps = (2.0 * peak ** 2 - v0 ** 2 - v1 ** 2) / (2.0 * accel)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cruise = np.where(peak > 0, np.maximum(length - ramps, 0.0) / peak, 0.0)
+    times = (2.0 * peak - v0 - v1) / accel + cruise
+    return v, peak, np.where(length > 0, times, 0.0)
+
+
+class Plan:
+    """Timed trajectory: per-segment speed/mvacc and the time at each waypoint"""
+
+    def __init__(self, times, speed, accel, velocity, baseline):
+        self.times = times          # s at each waypoint, from 0
+        self.speed = speed          # mm/s per segment (the waypoint it ends at)
+        self.accel = accel          # mm/s^2 per segment
+        self.velocity = velocity    # mm/s at each waypoint
+        self.baseline = baseline    # s at BASELINE_SPEED / BASELINE_MVACC
+
+    @property
+    def duration(self):
+        return float(self.times[-1])
+
+    @property
+    def saving(self):
+        return self.baseline - self.duration
+
+    def apply(self, waypoints):
+        """Set ``speed`` and ``mvacc`` on trajectory waypoint dicts in place"""
+        for waypoint, speed, accel in zip(waypoints[1:], self.speed.tolist(), self.accel.tolist()):
+            waypoint["speed"] = speed
+            waypoint["mvacc"] = accel
+        waypoints[0]["speed"] = waypoints[1]["speed"] if len(waypoints) > 1 else BASELINE_SPEED
+        waypoints[0]["mvacc"] = waypoints[1]["mvacc"] if len(waypoints) > 1 else BASELINE_MVACC
+        return waypoints
+
+    def describe(self):
+        return {
+            "duration": round(self.duration, 3),
+            "baseline": round(self.baseline, 3),
+            "saving": round(self.saving, 3),
+            "saving_pct": round(self.saving / self.baseline * 100, 1) if self.baseline > 0 else 0.0,
+            "max_speed": round(float(self.speed.max()), 1) if len(self.speed) else 0.0,
+        }
+
+
+def plan_motion(path, limits=Limits(), joints=None,
+                baseline_speed=BASELINE_SPEED, baseline_mvacc=BASELINE_MVACC):
+    """Fastest speed/acceleration profile along ``path`` within ``limits``.
+
+    ``path`` is an (N, 6) pose array (see :mod:`paths`) or validated
+    trajectory waypoints, whose own ``speed``/``mvacc`` act as extra caps.
+    ``joints`` is an optional (N, 6) array of joint angles in degrees.
+    """
+    poses = _poses(path)
+    if len(poses) < 2:
+        raise ValueError("A plan needs at least two poses")
+
+    delta = np.diff(poses, axis=0)
+    distance = np.linalg.norm(delta[:, :3], axis=1)
+    turn = rotation_angle(poses[:-1, 3:], poses[1:, 3:])
+
+    # Turning counts as distance at the ratio of the linear and angular limits
+    length = np.maximum(distance, turn * (limits.speed / limits.angular_speed))
+
+    cap = np.full(len(delta), min(limits.speed, MAX_SPEED), dtype=float)
+    accel = np.full(len(delta), min(limits.accel, MAX_MVACC), dtype=float)
+
+    for key, caps in (("speed", cap), ("mvacc", accel)):
+        given = _waypoint_caps(path, key)
+        if given is not None:
+            np.minimum(caps, given, out=caps)
+
+    if joints is not None:
+        # Joint rate per mm of path; speed and acceleration scale with it
+        dq = np.abs(np.diff(np.asarray(joints, dtype=float), axis=0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rate = np.where(length[:, None] > 0, dq / length[:, None], 0.0)
+            np.minimum(cap, (limits.joint_speed / rate).min(axis=1), out=cap)
+            np.minimum(accel, (limits.joint_accel / rate).min(axis=1), out=accel)
+
+    corner = np.sqrt(limits.accel * _corner_radius(poses[:, :3]))
+    velocity, speed, times = _profile(length, cap, accel, corner)
+
+    base = np.full(len(delta), float(baseline_speed))
+    _, _, base_times = _profile(length, base, np.full(len(delta), float(baseline_mvacc)),
+                                np.full(len(poses) - 2, np.inf))
+
+    # set_position takes the linear speed, so scale back segments dominated
+    # by turning: a short hop with a large turn gets a low linear speed that
+    # keeps the turn within angular_speed. Segments that do not move keep a
+    # valid speed
+    moving = distance > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(moving, distance / length, 1.0)
+    speed = np.where(moving, speed * scale, cap)
+    mvacc = np.where(moving, accel * scale, accel)
+    return Plan(np.concatenate([[0.0], np.cumsum(times)]), speed, mvacc, velocity,
+                float(base_times.sum()))
@@ -0,0 +1,185 @@
+"""Packed binary pose records for high-rate streaming.
+
+A client enables this with ``{"framing": "binary"}`` on the TCP server. From
+then on the stream is a sequence of records, each starting with a one-byte
+type. All fields are little-endian.
+
+``P`` absolute pose, 44 bytes::
+
+    B type, B flags, 2x pad, I seq, d timestamp,
+    f x, f y, f z, f roll, f pitch, f yaw, f speed
+
+``D`` delta pose, 32 bytes, relative to the previous pose on the connection.
+Position deltas are int16 in 0.01 mm, angle deltas int16 in 0.01 deg::
+
+    B type, B flags, 2x pad, I seq, d timestamp,
+    h dx, h dy, h dz, h droll, h dpitch, h dyaw, f speed
+
+``J`` embedded JSON command (e.g. ``reset``, ``status`` or a framing switch)
+and every server reply::
+
+    B type, x pad, H length, <length bytes of UTF-8 JSON>
+
+Set ``FLAG_ACK`` on a pose to get a reply even when the move succeeds.
+"""
+
+import json
+import struct
+
+
+RECORD_POSE = ord("P")
+RECORD_DELTA = ord("D")
+RECORD_JSON = ord("J")
+
+FLAG_ACK = 0x01
+
+DELTA_POSITION_SCALE = 100.0  # 0.01 mm per unit
+DELTA_ANGLE_SCALE = 100.0     # 0.01 deg per unit
+
+POSE_STRUCT = struct.Struct("<BBxxId7f")
+DELTA_STRUCT = struct.Struct("<BBxxId6hf")
+JSON_HEADER = struct.Struct("<BxH")
+
+_INT16_MIN, _INT16_MAX = -32768, 32767
+
+
+class RecordError(ValueError):
+    """A record could not be decoded.
+
+    ``size`` is the number of bytes to skip to reach the next record, or 0 if
+    the stream cannot be resynchronised.
+    """
+
+    def __init__(self, message, size=0):
+        super().__init__(message)
+        self.size = size
+
+
+class PoseRecord:
+    """Mutable pose, reused by the decoder for every record on a connection"""
+
+    __slots__ = ("seq", "timestamp", "flags",
+                 "x", "y", "z", "roll", "pitch", "yaw", "speed")
+
+    def __init__(self):
+        self.seq = 0
+        self.timestamp = 0.0
+        self.flags = 0
+        self.x = self.y = self.z = 0.0
+        self.roll = self.pitch = self.yaw = 0.0
+        self.speed = 0.0
+
+    @property
+    def wants_ack(self):
+        return bool(self.flags & FLAG_ACK)
+
+    def as_command(self):
+        """The equivalent JSON move command"""
+        return {
+            "seq": self.seq,
+            "x": self.x, "y": self.y, "z": self.z,
+            "roll": self.roll, "pitch": self.pitch, "yaw": self.yaw,
+            "speed": self.speed,
+        }
+
+
+class PoseDecoder:
+    """Decode binary records from a buffer without copying it.
+
+    ``decode(buf, pos)`` returns ``(record, size)`` where ``record`` is the
+    shared :class:`PoseRecord` for pose records or the raw payload ``bytes``
+    of a JSON record, and ``(None, 0)`` if ``buf`` does not yet hold a
+    complete record. Bad records raise :class:`RecordError`.
+    """
+
+    def __init__(self):
+        self.pose = PoseRecord()
+        self.has_pose = False
+
+    def decode(self, buf, pos=0):
+        available = len(buf) - pos
+        if available < 1:
+            return None, 0
+        kind = buf[pos]
+
+        if kind == RECORD_POSE:
+            if available < POSE_STRUCT.size:
+                return None, 0
+            p = self.pose
+            (_, p.flags, p.seq, p.timestamp,
+             p.x, p.y, p.z, p.roll, p.pitch, p.yaw,
+             p.speed) = POSE_STRUCT.unpack_from(buf, pos)
+            self.has_pose = True
+            return p, POSE_STRUCT.size
+
+        if kind == RECORD_DELTA:
+            if available < DELTA_STRUCT.size:
+                return None, 0
+            if not self.has_pose:
+                raise RecordError("Delta record before any absolute pose",
+                                  DELTA_STRUCT.size)
+            p = self.pose
+            (_, p.flags, p.seq, p.timestamp,
+             dx, dy, dz, droll, dpitch, dyaw,
+             p.speed) = DELTA_STRUCT.unpack_from(buf, pos)
+            p.x += dx / DELTA_POSITION_SCALE
+            p.y += dy / DELTA_POSITION_SCALE
+            p.z += dz / DELTA_POSITION_SCALE
+            p.roll += droll / DELTA_ANGLE_SCALE
+            p.pitch += dpitch / DELTA_ANGLE_SCALE
+            p.yaw += dyaw / DELTA_ANGLE_SCALE
+            return p, DELTA_STRUCT.size
+
+        if kind == RECORD_JSON:
+            if available < JSON_HEADER.size:
+                return None, 0
+            _, length = JSON_HEADER.unpack_from(buf, pos)
+            end = pos + JSON_HEADER.size + length
+            if len(buf) < end:
+                return None, 0
+            return bytes(buf[pos + JSON_HEADER.size:end]), end - pos
+
+        raise RecordError(f"Unknown binary record type 0x{kind:02x}")
+
+
+def encode_json_record(obj):
+    payload = json.dumps(obj, separators=(",", ":")).encode()
+    return JSON_HEADER.pack(RECORD_JSON, len(payload)) + payload
+
+
+def encode_pose(seq, timestamp, x, y, z, roll, pitch, yaw, speed, flags=0):
+    return POSE_STRUCT.pack(RECORD_POSE, flags, seq, timestamp,
+                            x, y, z, roll, pitch, yaw, speed)
+
+
+class PoseEncoder:
+    """Client-side encoder that sends deltas whenever they fit in int16.
+
+    Deltas are taken against the pose the server will have reconstructed
+    (not the exact float input), so rounding never accumulates.
+    """
+
+    def __init__(self, use_delta=True):
+        self.use_delta = use_delta
+        self._last = None
+
+    def encode(self, seq, timestamp, x, y, z, roll, pitch, yaw, speed, flags=0):
+        pose = (x, y, z, roll, pitch, yaw)
+        if self.use_delta and self._last is not None:
+            scales = (DELTA_POSITION_SCALE,) * 3 + (DELTA_ANGLE_SCALE,) * 3
+            steps = [round((v - last) * scale)
+                     for v, last, scale in zip(pose, self._last, scales)]
+            if all(_INT16_MIN <= s <= _INT16_MAX for s in steps):
+                self._last = tuple(last + s / scale
+                                   for last, s, scale in zip(self._last, steps, scales))
+                return DELTA_STRUCT.pack(RECORD_DELTA, flags, seq, timestamp,
+                                         *steps, speed)
+
+        record = encode_pose(seq, timestamp, *pose, speed, flags=flags)
+        # Mirror the float32 rounding the server will see
+        self._last = POSE_STRUCT.unpack(record)[4:10]
+        return record
+
+    def reset(self):
+        """Forget the last pose, e.g. after reconnecting"""
+        self._last = None
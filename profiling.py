@@ -0,0 +1,169 @@
+"""On-demand sampling profiler for the command hot path.
+
+While a profile runs, a background thread snapshots every thread's Python
+stack (``sys._current_frames``) at a fixed interval. It keeps only the
+stacks that pass through one of the configured entry points, e.g. the TCP
+dispatch loop or the Gradio handlers, and only the part from that entry
+point down. Threads idle in the event loop or in unrelated work are
+therefore ignored.
+
+When the window ends (or :meth:`SamplingProfiler.stop` is called) the
+samples are written to ``<directory>/profile-<time>.txt``, a per-function
+table of self and inclusive time. A matching ``.folded`` file holds the
+stacks in the collapsed format that flame graph tools read.
+
+The timing is wall clock, so time a thread spends blocked in an SDK call
+shows up against that call. Nothing is installed into the profiled code.
+When no profile is running there is no hook, wrapper or flag check on the
+hot path at all.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+DEFAULT_INTERVAL = 0.002   # s between stack samples
+DEFAULT_DURATION = 30.0    # s, profiles always stop on their own
+MAX_DURATION = 600.0
+MAX_DEPTH = 64             # frames kept below the entry point
+REPORT_ROWS = 60
+
+
+def _label(code):
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Sample the stacks under ``entries`` (functions or methods) on demand"""
+
+    def __init__(self, entries, directory="profiles", interval=DEFAULT_INTERVAL, log=print):
+        self.entries = {getattr(fn, "__func__", fn).__code__: fn.__name__ for fn in entries}
+        self.directory = directory
+        self.interval = interval
+        self.log = log
+        self.last_report = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._deadline = 0.0
+        self._ticks = 0
+        self._samples = 0
+
+    @property
+    def active(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration=DEFAULT_DURATION):
+        """Profile for ``duration`` seconds; ``False`` if already running"""
+        duration = min(max(float(duration), self.interval), MAX_DURATION)
+        with self._lock:
+            if self.active:
+                return False
+            self._stop.clear()
+            self._deadline = time.monotonic() + duration
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+        self.log(f"[PROFILE] Sampling every {self.interval * 1000:g} ms for {duration:g} s")
+        return True
+
+    def stop(self):
+        """End the window early; returns the report path (``None`` if idle)"""
+        thread = self._thread
+        if thread is None:
+            return None
+        self._stop.set()
+        thread.join()
+        return self.last_report
+
+    def status(self):
+        return {
+            "active": self.active,
+            "remaining": round(max(0.0, self._deadline - time.monotonic()), 1) if self.active else 0,
+            "samples": self._samples,
+            "interval_ms": self.interval * 1000,
+            "entries": sorted(set(self.entries.values())),
+            "last_report": self.last_report,
+        }
+
+    def reports(self):
+        """Report file names, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((name for name in os.listdir(self.directory)
+                       if name.startswith("profile-") and name.endswith(".txt")), reverse=True)
+
+    # ---- sampling ----
+    def _run(self):
+        own = threading.get_ident()
+        entries = self.entries
+        own_time = Counter()   # code -> samples at the top of the stack
+        total = Counter()      # code -> samples anywhere in the stack
+        stacks = Counter()     # (code, ...) root first -> samples
+        scopes = Counter()     # entry name -> samples
+        self._ticks = self._samples = 0
+        started = time.perf_counter()
+        try:
+            while not self._stop.is_set() and time.monotonic() < self._deadline:
+                self._ticks += 1
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    codes = []
+                    entry = -1
+                    while frame is not None:
+                        codes.append(frame.f_code)
+                        if frame.f_code in entries:
+                            entry = len(codes) - 1  # keep the outermost
+                        frame = frame.f_back
+                    if entry < 0:
+                        continue
+                    stack = codes[:entry + 1]  # leaf first
+                    if len(stack) > MAX_DEPTH + 1:
+                        # Too deep: drop frames from the middle but keep the
+                        # leaf, which owns the self time
+                        stack = stack[:1] + stack[-MAX_DEPTH:]
+                    stack = tuple(reversed(stack))
+                    self._samples += 1
+                    scopes[entries[stack[0]]] += 1
+                    own_time[stack[-1]] += 1
+                    total.update(set(stack))
+                    stacks[stack] += 1
+                frame = None  # don't keep the last stack alive between ticks
+                self._stop.wait(self.interval)
+        finally:
+            elapsed = time.perf_counter() - started
+            try:
+                self.last_report = self._write(elapsed, own_time, total, stacks, scopes)
+                self.log(f"[PROFILE] {self._samples} samples written to {self.last_report}")
+            except OSError as e:
+                self.log(f"[PROFILE] Could not write report: {e}")
+
+    def _write(self, elapsed, own_time, total, stacks, scopes):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"profile-{time.strftime('%Y%m%d-%H%M%S')}")
+        tick = elapsed / self._ticks if self._ticks else self.interval
+        samples = self._samples or 1
+
+        lines = [
+            f"Profile: {elapsed:.1f} s window, {self._ticks} ticks of {tick * 1000:.2f} ms, "
+            f"{self._samples} samples under an entry point",
+            "Entry points: " + ", ".join(f"{name} {count}" for name, count in scopes.most_common())
+            if scopes else "Entry points: no samples",
+            "Times are wall clock (blocked calls count), summed over threads",
+            "",
+            f"{'self %':>7} {'total %':>8} {'self s':>8} {'total s':>8}  function",
+        ]
+        for code, count in sorted(total.items(), key=lambda item: (-own_time[item[0]], -item[1]))[:REPORT_ROWS]:
+            lines.append(f"{own_time[code] / samples * 100:7.1f} {count / samples * 100:8.1f} "
+                         f"{own_time[code] * tick:8.3f} {count * tick:8.3f}  {_label(code)}")
+
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        with open(base + ".folded", "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(";".join(_label(code) for code in stack) + f" {count}\n")
+        return base + ".txt"
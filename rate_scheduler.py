@@ -0,0 +1,167 @@
+"""Fixed-rate loop pacing for the haptic loops.
+
+A spin-wait (``while perf_counter() - start < period: pass``) holds the
+rate but keeps a core at 100%. Restarting the timer after each wait also
+lets every tick's lateness add to the next one, so the loop drifts below
+its rate. :class:`RateScheduler` instead keeps absolute deadlines
+(``start + n * period``) and waits for each one in two stages:
+
+- ``time.sleep`` up to ``margin`` before the deadline, which costs no CPU;
+- a short spin on ``perf_counter`` to the deadline itself.
+
+``margin`` adapts to how late the OS actually wakes the thread, so the
+spin stays as short as the platform's sleep allows.
+
+When a tick's work overruns the period, ``policy`` decides what happens:
+
+- ``"skip"`` runs the late tick at once and drops the ticks that were
+  missed, keeping the original phase;
+- ``"catch_up"`` runs the missed ticks back to back, at most
+  ``max_burst`` of them. Use it when every tick counts, e.g. when
+  integrating.
+
+:meth:`RateScheduler.stats` reports wake-up jitter percentiles, overruns,
+skipped ticks, work time and the process CPU use since :meth:`start`::
+
+    rate = RateScheduler(1000)
+    while True:
+        forces = scene.evaluate(*inverse3.end_effector_force(forces)).tolist()
+        rate.sleep()
+"""
+
+import time
+
+
+SKIP = "skip"
+CATCH_UP = "catch_up"
+POLICIES = (SKIP, CATCH_UP)
+
+DEFAULT_MARGIN = 0.0005     # s before the deadline to stop sleeping and spin
+MIN_MARGIN = 0.00005
+MARGIN_RISE = 0.05          # how fast margin follows a later wake-up ...
+MARGIN_FALL = 0.005         # ... and an earlier one, so it settles near the p95
+DEFAULT_MAX_BURST = 10      # catch-up ticks run back to back at most
+DEFAULT_WINDOW = 1000       # ticks kept for jitter percentiles
+
+
+class RateScheduler:
+    """Pace a loop at ``rate_hz`` with absolute deadlines and sleep-then-spin waits"""
+
+    def __init__(self, rate_hz, policy=SKIP, margin=DEFAULT_MARGIN,
+                 max_burst=DEFAULT_MAX_BURST, window=DEFAULT_WINDOW):
+        if rate_hz <= 0:
+            raise ValueError("rate_hz must be positive")
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz
+        self.policy = policy
+        self.max_burst = max_burst
+        # Never more than half a period, so the loop always sleeps a little
+        # (and keeps measuring the OS) when the work is short
+        self.max_margin = self.period / 2
+        self.initial_margin = min(margin, self.max_margin)
+        self.window = window
+        self._deadline = None
+        self._reset()
+
+    def _reset(self):
+        self.margin = self.initial_margin
+        self.ticks = 0
+        self.overruns = 0   # ticks whose deadline had passed when the loop got back
+        self.skipped = 0    # ticks dropped by the skip policy or max_burst
+        self.max_late = 0.0
+        self.max_work = 0.0
+        self._late = [0.0] * self.window
+        self._work_total = 0.0
+        self._spin_total = 0.0
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+        self._tick_start = self._started
+
+    def start(self):
+        """Restart the clock: the next tick is one period from now"""
+        self._reset()
+        self._deadline = self._started + self.period
+
+    def sleep(self):
+        """Wait for the next tick and return how late (s) it starts.
+
+        Starts the clock on the first call.
+        """
+        if self._deadline is None:
+            self.start()
+        period = self.period
+        deadline = self._deadline
+
+        now = time.perf_counter()
+        work = now - self._tick_start
+        self._work_total += work
+        if work > self.max_work:
+            self.max_work = work
+
+        behind = now - deadline
+        if behind >= 0:
+            self.overruns += 1
+            missed = int(behind // period)  # later deadlines already passed too
+            if self.policy == SKIP:
+                drop = missed
+            else:
+                drop = max(missed - self.max_burst, 0)
+            self.skipped += drop
+            self._deadline = deadline + (drop + 1) * period
+            late = behind - drop * period
+        else:
+            wake = deadline - self.margin
+            if now < wake:
+                time.sleep(wake - now)
+                self._adapt(time.perf_counter() - wake)
+            spin_start = time.perf_counter()
+            while time.perf_counter() < deadline:
+                pass
+            now = time.perf_counter()
+            self._spin_total += now - spin_start
+            self._deadline = deadline + period
+            late = now - deadline
+
+        self._late[self.ticks % self.window] = late
+        if late > self.max_late:
+            self.max_late = late
+        self.ticks += 1
+        self._tick_start = now
+        return late
+
+    def _adapt(self, oversleep):
+        """Keep ``margin`` just above how late sleep usually wakes up.
+
+        Rising faster than falling tracks a high percentile, and a single
+        stall of the OS moves it only a little.
+        """
+        wanted = min(oversleep, self.period) + MIN_MARGIN
+        gain = MARGIN_RISE if wanted > self.margin else MARGIN_FALL
+        self.margin = min(max(self.margin + (wanted - self.margin) * gain, MIN_MARGIN), self.max_margin)
+
+    def stats(self):
+        ticks = self.ticks
+        elapsed = time.perf_counter() - self._started
+        late = sorted(self._late[:min(ticks, self.window)])
+
+        def percentile(q):
+            return round(late[min(int(q * len(late)), len(late) - 1)] * 1e6, 1) if late else 0.0
+
+        return {
+            "rate_hz": self.rate_hz,
+            "policy": self.policy,
+            "ticks": ticks,
+            "actual_hz": round(ticks / elapsed, 1) if elapsed > 0 else 0.0,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "jitter_us": {"p50": percentile(0.5), "p99": percentile(0.99),
+                          "max": round(self.max_late * 1e6, 1)},
+            "mean_work_us": round(self._work_total / ticks * 1e6, 1) if ticks else 0.0,
+            "max_work_us": round(self.max_work * 1e6, 1),
+            "margin_us": round(self.margin * 1e6, 1),
+            "spin_pct": round(self._spin_total / elapsed * 100, 1) if elapsed > 0 else 0.0,
+            "cpu_pct": round((time.process_time() - self._cpu_started) / elapsed * 100, 1)
+                       if elapsed > 0 else 0.0,
+        }
@@ -0,0 +1,281 @@
+"""Precomputed workspace reachability index.
+
+Targets are checked against this index before they reach
+``arm.set_position``. An unreachable pose is rejected locally (or clamped)
+instead of faulting the controller and paying for an error recovery.
+
+The index is built offline by :func:`build_index` (see
+``scripts/build_reachability.py``). It samples the joint space within the
+arm's joint limits, runs forward kinematics in NumPy batches and records
+which tool directions each part of the workspace can be reached with. J1
+turns the whole arm about the base axis, so reachability only depends on
+the radius ``r = hypot(x, y)``, the height ``z`` and the tool direction
+relative to the target's azimuth. The grid is therefore 2-D over (r, z).
+Each cell holds a bit per tool-direction bin: 10 degree bands of the tool
+z axis tilt from vertical times 10 degree azimuth sectors. Rotation about
+the tool axis (J6) is unlimited and is not indexed.
+
+Lookups are a few float operations and one byte test (about a
+microsecond). A cell counts as reachable if any sample landed in it, so
+answers are accurate to the grid resolution.
+"""
+
+import math
+
+import numpy as np
+
+
+FORMAT_VERSION = 1
+
+# Modified DH parameters (a_{i-1}, alpha_{i-1}, d_i, theta offset) and joint
+# limits in degrees, from the UFACTORY kinematics documentation
+MODELS = {
+    "xarm6": {
+        "dh": [
+            (0.0, 0.0, 267.0, 0.0),
+            (0.0, -math.pi / 2, 0.0, -1.3849179),
+            (289.48866, 0.0, 0.0, 1.3849179),
+            (77.5, -math.pi / 2, 342.5, 0.0),
+            (0.0, math.pi / 2, 0.0, 0.0),
+            (76.0, -math.pi / 2, 97.0, 0.0),
+        ],
+        "limits": [(-360, 360), (-118, 120), (-225, 11), (-360, 360), (-97, 180), (-360, 360)],
+    },
+}
+
+DEFAULT_RESOLUTION = 10.0    # mm per (r, z) cell
+DEFAULT_SAMPLES = 16_000_000
+ELEVATION_BANDS = 18         # tool axis angle from +z, 10 degrees each
+AZIMUTH_SECTORS = 36
+BATCH = 250_000
+
+
+# ---- offline build ----
+def _dh(a, alpha, theta, d):
+    """Batched modified-DH transforms for an array of joint angles"""
+    n = theta.shape[0]
+    ct, st = np.cos(theta), np.sin(theta)
+    ca, sa = math.cos(alpha), math.sin(alpha)
+    t = np.zeros((n, 4, 4))
+    t[:, 0, 0], t[:, 0, 1], t[:, 0, 3] = ct, -st, a
+    t[:, 1, 0], t[:, 1, 1], t[:, 1, 2], t[:, 1, 3] = st * ca, ct * ca, -sa, -sa * d
+    t[:, 2, 0], t[:, 2, 1], t[:, 2, 2], t[:, 2, 3] = st * sa, ct * sa, ca, ca * d
+    t[:, 3, 3] = 1.0
+    return t
+
+
+def forward_kinematics(model, joints):
+    """Flange poses (N, 4, 4) for joint angles (N, 6) in radians"""
+    pose = None
+    for i, (a, alpha, d, offset) in enumerate(MODELS[model]["dh"]):
+        t = _dh(a, alpha, joints[:, i] + offset, d)
+        pose = t if pose is None else pose @ t
+    return pose
+
+
+def _direction_bins(dx, dy, dz):
+    """Bin of a tool direction already rotated into the target's azimuth frame"""
+    band = np.arccos(np.clip(dz, -1.0, 1.0)) / math.pi * ELEVATION_BANDS
+    band = np.minimum(band.astype(np.int64), ELEVATION_BANDS - 1)
+    sector = np.floor((np.arctan2(dy, dx) + math.pi) / (2 * math.pi) * AZIMUTH_SECTORS)
+    sector = np.clip(sector.astype(np.int64), 0, AZIMUTH_SECTORS - 1)
+    return band * AZIMUTH_SECTORS + sector
+
+
+def _close(bits):
+    """Fill single-cell sampling holes: 3x3 dilation then erosion over (r, z)"""
+    def shifted(grid, fill):
+        padded = np.pad(grid, ((1, 1), (1, 1), (0, 0)), constant_values=fill)
+        return [padded[1 + i:padded.shape[0] - 1 + i, 1 + j:padded.shape[1] - 1 + j]
+                for i in (-1, 0, 1) for j in (-1, 0, 1)]
+    dilated = np.logical_or.reduce(shifted(bits, False))
+    return np.logical_and.reduce(shifted(dilated, True)) | bits
+
+
+def build_index(model="xarm6", resolution=DEFAULT_RESOLUTION, samples=DEFAULT_SAMPLES,
+                tcp_offset=0.0, min_z=None, seed=0, log=print):
+    """Sample the joint space of ``model`` and return a :class:`ReachabilityIndex`.
+
+    ``tcp_offset`` (mm along the tool axis) matches a TCP offset configured
+    on the controller; ``min_z`` drops poses below a table or floor.
+    """
+    spec = MODELS[model]
+    limits = np.deg2rad(np.array(spec["limits"], dtype=float))
+    rng = np.random.default_rng(seed)
+
+    # J1 only rotates about z and J6 only about the tool axis; neither changes
+    # (r, z) or the relative tool direction, so both stay at zero
+    points = []
+    for start in range(0, samples, BATCH):
+        n = min(BATCH, samples - start)
+        joints = np.zeros((n, 6))
+        joints[:, 1:5] = rng.uniform(limits[1:5, 0], limits[1:5, 1], size=(n, 4))
+        pose = forward_kinematics(model, joints)
+        tool = pose[:, :3, 2]
+        pos = pose[:, :3, 3] + tool * tcp_offset
+        if min_z is not None:
+            keep = pos[:, 2] >= min_z
+            pos, tool = pos[keep], tool[keep]
+        azimuth = np.arctan2(pos[:, 1], pos[:, 0])
+        c, s = np.cos(azimuth), np.sin(azimuth)
+        r = np.hypot(pos[:, 0], pos[:, 1])
+        bins = _direction_bins(c * tool[:, 0] + s * tool[:, 1],
+                               -s * tool[:, 0] + c * tool[:, 1], tool[:, 2])
+        points.append((r, pos[:, 2], bins))
+        log(f"[REACH] Sampled {start + n}/{samples} poses")
+
+    r = np.concatenate([p[0] for p in points])
+    z = np.concatenate([p[1] for p in points])
+    bins = np.concatenate([p[2] for p in points])
+    z0 = math.floor(z.min() / resolution) * resolution
+    shape = (int(r.max() // resolution) + 2, int((z.max() - z0) // resolution) + 2,
+             ELEVATION_BANDS * AZIMUTH_SECTORS)
+    bits = np.zeros(shape, dtype=bool)
+    bits[(r // resolution).astype(np.int64), ((z - z0) // resolution).astype(np.int64), bins] = True
+
+    # The end bands are small caps around straight up / straight down, where
+    # the azimuth of the tool axis is meaningless: one sector stands for all
+    for band in (0, ELEVATION_BANDS - 1):
+        cap = slice(band * AZIMUTH_SECTORS, (band + 1) * AZIMUTH_SECTORS)
+        bits[:, :, cap] = bits[:, :, cap].any(axis=2, keepdims=True)
+    bits = _close(bits)
+    # ... and single-sector holes between neighbouring tool directions
+    grid = bits.reshape(shape[0], shape[1], ELEVATION_BANDS, AZIMUTH_SECTORS)
+    dilated = grid | np.roll(grid, 1, axis=3) | np.roll(grid, -1, axis=3)
+    grid |= dilated & np.roll(dilated, 1, axis=3) & np.roll(dilated, -1, axis=3)
+
+    return ReachabilityIndex(np.packbits(bits, axis=2), resolution, z0, {
+        "model": model, "samples": samples, "tcp_offset": tcp_offset, "min_z": min_z,
+    })
+
+
+# ---- runtime ----
+class ReachabilityIndex:
+    """Answer "can the arm reach this pose?" from the precomputed grid"""
+
+    def __init__(self, packed, resolution, z0, meta=None):
+        self.packed = packed
+        self.resolution = float(resolution)
+        self.z0 = float(z0)
+        self.meta = meta or {}
+        self.nr, self.nz, self.nbytes = packed.shape
+        self._flat = packed.tobytes()   # plain bytes are the fastest thing to index
+        self._any = packed.any(axis=2)  # reachable with some orientation
+        self._cells = {}                # direction bin -> reachable cell coordinates
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != FORMAT_VERSION:
+                raise ValueError(f"{path}: unsupported index version {int(data['version'])}")
+            meta = {k[5:]: data[k].item() for k in data.files if k.startswith("meta_")}
+            meta = {k: None if v == "" else v for k, v in meta.items()}
+            return cls(data["packed"], float(data["resolution"]), float(data["z0"]), meta)
+
+    def save(self, path):
+        np.savez_compressed(
+            path, version=FORMAT_VERSION, packed=self.packed, resolution=self.resolution,
+            z0=self.z0, **{f"meta_{k}": ("" if v is None else v) for k, v in self.meta.items()}
+        )
+
+    def describe(self):
+        reachable = int(self._any.sum())
+        return {
+            **self.meta,
+            "resolution": self.resolution,
+            "max_radius": self.nr * self.resolution,
+            "z_range": [self.z0, self.z0 + self.nz * self.resolution],
+            "reachable_cells": reachable,
+        }
+
+    def _locate(self, x, y, z, roll, pitch, yaw):
+        """(ir, iz, direction bin, azimuth), or ``None`` outside the grid"""
+        r = math.hypot(x, y)
+        ir = int(r // self.resolution)
+        iz = int((z - self.z0) // self.resolution)
+        azimuth = math.atan2(y, x)
+        # Tool z axis of R = Rz(yaw) Ry(pitch) Rx(roll), as the controller uses
+        cr, sr = math.cos(math.radians(roll)), math.sin(math.radians(roll))
+        cp, sp = math.cos(math.radians(pitch)), math.sin(math.radians(pitch))
+        cy, sy = math.cos(math.radians(yaw)), math.sin(math.radians(yaw))
+        dx = cy * sp * cr + sy * sr
+        dy = sy * sp * cr - cy * sr
+        dz = cp * cr
+        ca, sa = math.cos(azimuth), math.sin(azimuth)
+        band = min(int(math.acos(max(-1.0, min(1.0, dz))) / math.pi * ELEVATION_BANDS),
+                   ELEVATION_BANDS - 1)
+        sector = int((math.atan2(-sa * dx + ca * dy, ca * dx + sa * dy) + math.pi)
+                     / (2 * math.pi) * AZIMUTH_SECTORS)
+        direction = band * AZIMUTH_SECTORS + min(max(sector, 0), AZIMUTH_SECTORS - 1)
+        inside = 0 <= ir < self.nr and 0 <= iz < self.nz
+        return (ir, iz, direction, azimuth) if inside else (None, None, direction, azimuth)
+
+    def check(self, x, y, z, roll=180, pitch=0, yaw=0):
+        """``None`` if the pose is reachable, otherwise the reason it is not"""
+        ir, iz, direction, _ = self._locate(x, y, z, roll, pitch, yaw)
+        if ir is None:
+            return "position is out of reach"
+        byte = self._flat[(ir * self.nz + iz) * self.nbytes + (direction >> 3)]
+        if byte & (0x80 >> (direction & 7)):
+            return None
+        if not self._any[ir, iz]:
+            return "position is out of reach"
+        return "orientation is not reachable at this position"
+
+    def nearest(self, x, y, z, roll=180, pitch=0, yaw=0):
+        """Closest reachable position with the same orientation, as ``(x, y, z)``,
+        or ``None`` if that orientation is never reachable"""
+        _, _, direction, azimuth = self._locate(x, y, z, roll, pitch, yaw)
+        cells = self._cells.get(direction)
+        if cells is None:
+            hit = (self.packed[:, :, direction >> 3] & (0x80 >> (direction & 7))) != 0
+            # Edge cells are only partly reachable; aim for cells whose four
+            # neighbours are reachable too
+            inner = hit.copy()
+            inner[1:, :] &= hit[:-1, :]
+            inner[:-1, :] &= hit[1:, :]
+            inner[:, 1:] &= hit[:, :-1]
+            inner[:, :-1] &= hit[:, 1:]
+            cells = self._cells[direction] = (np.argwhere(inner if inner.any() else hit) + 0.5) * self.resolution
+        if not len(cells):
+            return None
+        r = math.hypot(x, y)
+        best = cells[np.argmin((cells[:, 0] - r) ** 2 + (cells[:, 1] + self.z0 - z) ** 2)]
+        r, z = float(best[0]), float(best[1]) + self.z0
+        return (round(r * math.cos(azimuth), 1), round(r * math.sin(azimuth), 1), round(z, 1))
+
+
+def load_index(path, log=print):
+    """The index at ``path``, or ``None`` (checks disabled) if it can't be read"""
+    if not path:
+        return None
+    try:
+        index = ReachabilityIndex.load(path)
+    except (OSError, ValueError, KeyError) as e:
+        log(f"[REACH] No reachability index loaded from {path}: {e}")
+        return None
+    log(f"[REACH] Loaded {path}: {index.describe()}")
+    return index
+
+
+def vet_target(index, x, y, z, roll=180, pitch=0, yaw=0, clamp=False):
+    """``((x, y, z), rejection)`` for a move target.
+
+    ``rejection`` is ``None`` when the move may go ahead, otherwise a reply
+    dict naming the problem and the nearest reachable position. With
+    ``clamp`` an unreachable target is moved to that position instead.
+    Without an index every target passes.
+    """
+    if index is None:
+        return (x, y, z), None
+    reason = index.check(x, y, z, roll, pitch, yaw)
+    if reason is None:
+        return (x, y, z), None
+    nearest = index.nearest(x, y, z, roll, pitch, yaw)
+    if clamp and nearest is not None:
+        return nearest, None
+    return (x, y, z), {
+        "error": f"Unreachable target ({x:g}, {y:g}, {z:g}): {reason}",
+        "rejected": "unreachable",
+        "nearest": list(nearest) if nearest is not None else None,
+    }
@@ -0,0 +1,320 @@
+"""Telemetry recorder writing memory-mapped NumPy column files.
+
+A recording is a directory::
+
+    recordings/arm1-20251018-141500/
+        index.json              columns, chunk list, sample counts, time spans
+        chunk_00000/t.npy       one .npy file per column, preallocated
+        chunk_00000/pose.npy
+        ...
+
+Each chunk holds ``chunk_samples`` rows. Its column files are created at
+full size with ``numpy.lib.format.open_memmap``, so recording only writes
+into existing pages. Arrays never grow, and nothing is buffered in Python.
+When a chunk fills up it is flushed and closed, and the next one is
+created. Memory use stays flat however long the shift runs.
+
+:class:`Recording` opens a finished or live recording read-only. Time-range
+queries return views into the memory-mapped files, and :func:`replay` plays
+samples back as telemetry events at the original pace.
+"""
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+
+INDEX_FILE = "index.json"
+FORMAT_VERSION = 1
+DEFAULT_RATE_HZ = 100
+DEFAULT_CHUNK_SAMPLES = 60000   # 10 minutes at 100 Hz, about 6 MB
+INDEX_INTERVAL = 5.0            # s between index updates inside a chunk
+
+# name -> (dtype, row shape)
+COLUMNS = {
+    "t": ("f8", ()),            # wall-clock time of the sample
+    "pose": ("f4", (6,)),       # x, y, z, roll, pitch, yaw
+    "joints": ("f4", (7,)),
+    "state": ("i1", ()),
+    "error": ("i2", ()),
+    "warn": ("i2", ()),
+    "target": ("f4", (6,)),     # commanded pose, NaN when there is none
+    "state_age": ("f4", ()),    # s since the cached arm state was refreshed
+}
+
+
+def _chunk_name(number):
+    return f"chunk_{number:05d}"
+
+
+def _write_json_atomic(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp, path)
+
+
+class Recorder:
+    """Sample an :class:`arm_state.ArmStateCache` at a fixed rate into a recording.
+
+    ``target()`` returns the currently commanded pose (6 values) or ``None``.
+    """
+
+    def __init__(self, state, directory, name, target=None, rate_hz=DEFAULT_RATE_HZ,
+                 chunk_samples=DEFAULT_CHUNK_SAMPLES, log=print):
+        self.state = state
+        self.target = target
+        self.rate_hz = rate_hz
+        self.chunk_samples = chunk_samples
+        self.log = log
+        self.path = os.path.join(directory, name)
+        self.samples = 0
+        self.overruns = 0
+        self.skipped = 0
+        self._chunks = []
+        self._columns = None
+        self._row = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def active(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.active:
+            return False
+        os.makedirs(self.path, exist_ok=True)
+        self._stop.clear()
+        self._open_chunk()
+        self._thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self._thread.start()
+        self.log(f"[REC] Recording {self.rate_hz} Hz to {self.path}")
+        return True
+
+    def stop(self):
+        if self._thread is None:
+            return False
+        self._stop.set()
+        self._thread.join(timeout=2)
+        self._thread = None
+        self._close_chunk()
+        self._write_index(final=True)
+        self.log(f"[REC] Stopped: {self.stats()}")
+        return True
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "active": self.active,
+            "samples": self.samples,
+            "chunks": len(self._chunks),
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+        }
+
+    # ---- chunk files ----
+    def _open_chunk(self):
+        name = _chunk_name(len(self._chunks))
+        directory = os.path.join(self.path, name)
+        os.makedirs(directory, exist_ok=True)
+        self._columns = {
+            column: np.lib.format.open_memmap(
+                os.path.join(directory, column + ".npy"), mode="w+",
+                dtype=dtype, shape=(self.chunk_samples,) + shape)
+            for column, (dtype, shape) in COLUMNS.items()
+        }
+        self._row = 0
+        self._chunks.append({"dir": name, "count": 0, "start": None, "end": None})
+        self._write_index()
+
+    def _close_chunk(self):
+        if self._columns is None:
+            return
+        for column in self._columns.values():
+            column.flush()
+        self._columns = None
+
+    def _write_index(self, final=False):
+        _write_json_atomic(os.path.join(self.path, INDEX_FILE), {
+            "version": FORMAT_VERSION,
+            "rate_hz": self.rate_hz,
+            "chunk_samples": self.chunk_samples,
+            "columns": {name: {"dtype": dtype, "shape": list(shape)}
+                        for name, (dtype, shape) in COLUMNS.items()},
+            "chunks": self._chunks,
+            "complete": final,
+        })
+
+    # ---- sampling ----
+    def _record(self, now_wall, now_mono):
+        snap = self.state.snapshot(max_age=float("inf"))  # never poll from here
+        cols = self._columns
+        i = self._row
+        cols["t"][i] = now_wall
+        if snap.pose is not None:
+            cols["pose"][i] = snap.pose
+        if snap.joints is not None:
+            cols["joints"][i, :len(snap.joints)] = snap.joints
+        cols["state"][i] = snap.state if snap.state is not None else -1
+        cols["error"][i] = snap.error_code
+        cols["warn"][i] = snap.warn_code
+        target = self.target() if self.target is not None else None
+        if target is None:
+            cols["target"][i] = np.nan
+        else:
+            cols["target"][i] = target
+        cols["state_age"][i] = now_mono - snap.timestamp
+
+        chunk = self._chunks[-1]
+        if chunk["start"] is None:
+            chunk["start"] = now_wall
+        chunk["end"] = now_wall
+        chunk["count"] = i + 1
+        self._row = i + 1
+        self.samples += 1
+
+        if self._row == self.chunk_samples:
+            self._close_chunk()
+            self._open_chunk()
+
+    def _run(self):
+        period = 1.0 / self.rate_hz
+        deadline = time.perf_counter()
+        next_index = time.monotonic() + INDEX_INTERVAL
+        while not self._stop.is_set():
+            deadline += period
+            try:
+                self._record(time.time(), time.monotonic())
+            except Exception as e:
+                self.log(f"[REC] Sample failed: {e}")
+
+            if time.monotonic() >= next_index:
+                self._write_index()
+                next_index = time.monotonic() + INDEX_INTERVAL
+
+            remaining = deadline - time.perf_counter()
+            if remaining > 0:
+                self._stop.wait(remaining)
+            else:
+                self.overruns += 1
+                missed = int(-remaining // period)
+                if missed:
+                    self.skipped += missed
+                    deadline += missed * period
+
+
+class Recording:
+    """Read-only access to a recording directory"""
+
+    def __init__(self, path):
+        self.path = path
+        self.reload()
+
+    def reload(self):
+        """Re-read the index, e.g. to see new samples of a live recording"""
+        with open(os.path.join(self.path, INDEX_FILE), encoding="utf-8") as f:
+            self.index = json.load(f)
+        self.chunks = [c for c in self.index["chunks"] if c["count"]]
+        self.columns = list(self.index["columns"])
+
+    @property
+    def start(self):
+        return self.chunks[0]["start"] if self.chunks else None
+
+    @property
+    def end(self):
+        return self.chunks[-1]["end"] if self.chunks else None
+
+    @property
+    def samples(self):
+        return sum(c["count"] for c in self.chunks)
+
+    def describe(self):
+        return {
+            "name": os.path.basename(self.path),
+            "samples": self.samples,
+            "start": self.start,
+            "end": self.end,
+            "rate_hz": self.index["rate_hz"],
+            "complete": self.index.get("complete", False),
+        }
+
+    def _load(self, chunk, column):
+        array = np.load(os.path.join(self.path, chunk["dir"], column + ".npy"), mmap_mode="r")
+        return array[:chunk["count"]]
+
+    def iter_ranges(self, t0=None, t1=None, columns=None):
+        """Yield one ``{column: view}`` dict per chunk overlapping [t0, t1].
+
+        The arrays are slices of the memory-mapped files; nothing is copied.
+        """
+        columns = columns or self.columns
+        for chunk in self.chunks:
+            if t0 is not None and chunk["end"] < t0:
+                continue
+            if t1 is not None and chunk["start"] > t1:
+                break
+            t = self._load(chunk, "t")
+            lo = 0 if t0 is None else int(np.searchsorted(t, t0, side="left"))
+            hi = len(t) if t1 is None else int(np.searchsorted(t, t1, side="right"))
+            if lo < hi:
+                yield {c: self._load(chunk, c)[lo:hi] for c in columns}
+
+    def range(self, t0=None, t1=None, columns=None):
+        """Columns for [t0, t1]: views for a single chunk, one copy when the
+        range spans several"""
+        parts = list(self.iter_ranges(t0, t1, columns))
+        columns = columns or self.columns
+        if not parts:
+            return {c: np.empty((0,) + tuple(self.index["columns"][c]["shape"]),
+                                dtype=self.index["columns"][c]["dtype"]) for c in columns}
+        if len(parts) == 1:
+            return parts[0]
+        return {c: np.concatenate([p[c] for p in parts]) for c in columns}
+
+
+def list_recordings(directory):
+    """Names of the recordings under ``directory``, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory)
+                  if os.path.exists(os.path.join(directory, name, INDEX_FILE)))
+
+
+def replay(recording, push, t0=None, t1=None, speed=1.0, stop_event=None,
+           fields=("state", "error", "warn", "pose", "joints", "target")):
+    """Push the samples in [t0, t1] as telemetry events at ``speed`` x real time.
+
+    Events look like live telemetry with ``"replay": true`` added. Returns
+    the number of samples pushed.
+    """
+    columns = ["t"] + list(fields)
+    started = time.perf_counter()
+    first = None
+    pushed = 0
+    for part in recording.iter_ranges(t0, t1, columns):
+        t = part["t"]
+        for i in range(len(t)):
+            if stop_event is not None and stop_event.is_set():
+                return pushed
+            if first is None:
+                first = t[i]
+            delay = (t[i] - first) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+            event = {"event": "telemetry", "replay": True, "t": round(float(t[i]), 3)}
+            for field in fields:
+                value = part[field][i]
+                if value.ndim == 0:
+                    event[field] = value.item()
+                elif np.isnan(value).all():
+                    event[field] = None  # e.g. no commanded target
+                else:
+                    event[field] = np.round(value, 2).tolist()
+            push(event)
+            pushed += 1
+    return pushed
@@ -0,0 +1,453 @@
+"""Client library for the robot TCP server.
+
+Keeps one connection open, reconnects with exponential backoff when it
+drops, and pipelines requests: every command gets a ``seq`` and its reply
+resolves the matching future, so many commands can be in flight without
+waiting for each round trip::
+
+    client = RobotClient("10.3.36.6")
+    client.connect()
+    pending = [client.move(250, y, 150) for y in (0, 50, 100)]
+    print([p.result() for p in pending])
+
+    client.configure({"coalesce": True})   # replayed after every reconnect
+    client.stream_pose(250, 0, 150)        # fire-and-forget
+
+:class:`AsyncRobotClient` offers the same API for asyncio code; its
+requests return awaitables.
+
+Frames that do not answer a pending request (telemetry, async move events,
+errors for streamed poses) go to ``on_event(frame)``. With
+``framing="binary"`` streamed poses are sent as packed pose records (delta
+encoded when possible) instead of JSON.
+"""
+
+import asyncio
+import concurrent.futures
+import itertools
+import socket
+import threading
+import time
+
+from framing import FRAMING_BINARY, FRAMING_JSON, FrameDecoder, FramingError, encode_frame
+from pose_codec import FLAG_ACK, PoseEncoder
+
+
+DEFAULT_PORT = 5005
+CONNECT_TIMEOUT = 5.0
+BACKOFF_INITIAL = 0.2   # s before the first reconnect attempt
+BACKOFF_MAX = 5.0       # s cap on the delay between attempts
+READ_SIZE = 4096
+
+
+class _Protocol:
+    """Sequence numbers, encoding and reply matching shared by both clients"""
+
+    def __init__(self, framing):
+        if framing not in (FRAMING_JSON, FRAMING_BINARY):
+            raise ValueError(f"Unsupported client framing: {framing}")
+        self.framing = framing
+        self._seq = itertools.count(1)
+        self.pose_encoder = PoseEncoder()
+        self.decoder = FrameDecoder(FRAMING_JSON)
+        self.write_mode = FRAMING_JSON
+        self.switch_seq = None
+
+    def reset(self):
+        """Fresh connection: the server starts over in JSON framing"""
+        self.decoder = FrameDecoder(FRAMING_JSON)
+        self.write_mode = FRAMING_JSON
+        self.pose_encoder.reset()
+        self.switch_seq = None
+
+    def handshake(self):
+        """Frame switching to the requested framing, or ``None``"""
+        if self.framing == FRAMING_JSON:
+            return None
+        self.switch_seq = next(self._seq)
+        frame = encode_frame({"framing": self.framing, "seq": self.switch_seq}, FRAMING_JSON)
+        # The server decodes everything after the switch in the new framing
+        self.write_mode = self.framing
+        return frame
+
+    def command(self, msg):
+        """``(seq, frame)`` for a command dict"""
+        msg = dict(msg)
+        seq = msg.setdefault("seq", next(self._seq))
+        return seq, encode_frame(msg, self.write_mode)
+
+    def pose(self, x, y, z, roll, pitch, yaw, speed, ack=False):
+        seq = next(self._seq)
+        if self.write_mode == FRAMING_BINARY:
+            return seq, self.pose_encoder.encode(
+                seq, time.time(), x, y, z, roll, pitch, yaw, speed,
+                flags=FLAG_ACK if ack else 0)
+        return self.command({"x": x, "y": y, "z": z, "roll": roll, "pitch": pitch,
+                             "yaw": yaw, "speed": speed, "seq": seq, "t": time.time()})
+
+    def frames(self, data):
+        """Decode received bytes into reply/event dicts"""
+        self.decoder.feed(data)
+        while True:
+            frame = self.decoder.next_message()
+            if frame is None:
+                return
+            if frame.get("seq") == self.switch_seq and "framing" in frame:
+                self.switch_seq = None
+                if "error" not in frame:
+                    self.decoder.mode = self.framing
+                continue
+            yield frame
+
+
+def _move_command(x, y, z, roll, pitch, yaw, speed, extra):
+    msg = {"x": x, "y": y, "z": z, "roll": roll, "pitch": pitch, "yaw": yaw, "speed": speed}
+    msg.update(extra)
+    return msg
+
+
+class RobotClient:
+    """Thread-based client; requests return ``concurrent.futures.Future``"""
+
+    def __init__(self, host, port=DEFAULT_PORT, framing=FRAMING_JSON, reconnect=True,
+                 on_event=None, log=print):
+        self.host = host
+        self.port = port
+        self.reconnect = reconnect
+        self.on_event = on_event
+        self.log = log
+        self.streamed = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self._protocol = _Protocol(framing)
+        self._sock = None
+        self._pending = {}
+        self._session = []  # commands replayed after reconnecting
+        self._lock = threading.Lock()
+        self._connected = threading.Event()
+        self._closed = threading.Event()
+        self._thread = None
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def connect(self, timeout=CONNECT_TIMEOUT):
+        """Start the connection thread and wait for the first connection.
+
+        Raises ``ConnectionError`` if not connected within ``timeout``; the
+        thread keeps retrying in the background unless :meth:`close` is called.
+        """
+        if self._thread is None:
+            self._closed.clear()
+            self._thread = threading.Thread(target=self._run, name="robot-client", daemon=True)
+            self._thread.start()
+        if not self._connected.wait(timeout):
+            raise ConnectionError(f"Could not connect to {self.host}:{self.port}")
+        return self
+
+    def close(self):
+        self._closed.set()
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        self._thread = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---- requests ----
+    def request(self, msg):
+        """Send a command without waiting; the future resolves with its reply"""
+        future = concurrent.futures.Future()
+        with self._lock:
+            if not self._connected.is_set():
+                future.set_exception(ConnectionError("Not connected to the robot server"))
+                return future
+            seq, frame = self._protocol.command(msg)
+            self._pending[seq] = future
+            try:
+                self._sock.sendall(frame)
+            except OSError as e:
+                self._pending.pop(seq, None)
+                future.set_exception(ConnectionError(f"Send failed: {e}"))
+        return future
+
+    def call(self, msg, timeout=None):
+        """Send a command and block for its reply"""
+        return self.request(msg).result(timeout)
+
+    def configure(self, msg):
+        """Send a connection setting (coalesce, select, subscribe, ...) that
+        is sent again automatically after every reconnect"""
+        with self._lock:
+            self._session.append(dict(msg))
+        return self.request(msg)
+
+    def move(self, x, y, z, roll=180, pitch=0, yaw=0, speed=100, **extra):
+        return self.request(_move_command(x, y, z, roll, pitch, yaw, speed, extra))
+
+    def status(self, **extra):
+        return self.request({"status": True, **extra})
+
+    def reset(self, **extra):
+        return self.request({"reset": True, **extra})
+
+    def stream_pose(self, x, y, z, roll=180, pitch=0, yaw=0, speed=100):
+        """Fire-and-forget pose; returns False if it was dropped while offline.
+
+        Replies are not tracked. Errors still arrive through ``on_event``.
+        """
+        with self._lock:
+            if not self._connected.is_set():
+                self.dropped += 1
+                return False
+            _, frame = self._protocol.pose(x, y, z, roll, pitch, yaw, speed)
+            try:
+                self._sock.sendall(frame)
+            except OSError:
+                self.dropped += 1
+                return False
+            self.streamed += 1
+            return True
+
+    # ---- connection thread ----
+    def _run(self):
+        delay = BACKOFF_INITIAL
+        while not self._closed.is_set():
+            try:
+                self._open()
+            except OSError as e:
+                self.log(f"[CLIENT] Connect to {self.host}:{self.port} failed: {e}; "
+                         f"retrying in {delay:.1f}s")
+                if not self.reconnect or self._closed.wait(delay):
+                    return
+                delay = min(delay * 2, BACKOFF_MAX)
+                continue
+
+            delay = BACKOFF_INITIAL
+            try:
+                self._read()
+            except (OSError, FramingError) as e:
+                if not self._closed.is_set():
+                    self.log(f"[CLIENT] Connection lost: {e}")
+            self._drop_connection()
+            if not self.reconnect:
+                return
+            self.reconnects += 1
+
+    def _open(self):
+        sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self._lock:
+            self._sock = sock
+            self._protocol.reset()
+            handshake = self._protocol.handshake()
+            if handshake is not None:
+                sock.sendall(handshake)
+            for msg in self._session:
+                _, frame = self._protocol.command(msg)
+                sock.sendall(frame)
+            self._connected.set()
+        self.log(f"[CLIENT] Connected to {self.host}:{self.port}")
+
+    def _read(self):
+        while True:
+            data = self._sock.recv(READ_SIZE)
+            if not data:
+                raise ConnectionError("server closed the connection")
+            for frame in self._protocol.frames(data):
+                self._dispatch(frame)
+
+    def _dispatch(self, frame):
+        with self._lock:
+            future = self._pending.pop(frame.get("seq"), None)
+        if future is not None:
+            future.set_result(frame)
+        elif self.on_event is not None:
+            try:
+                self.on_event(frame)
+            except Exception as e:
+                self.log(f"[CLIENT] on_event failed: {e}")
+
+    def _drop_connection(self):
+        with self._lock:
+            self._connected.clear()
+            sock, self._sock = self._sock, None
+            pending, self._pending = self._pending, {}
+        if sock is not None:
+            sock.close()
+        for future in pending.values():
+            future.set_exception(ConnectionError("Connection lost before the reply arrived"))
+
+
+class AsyncRobotClient:
+    """asyncio client; requests return awaitable futures"""
+
+    def __init__(self, host, port=DEFAULT_PORT, framing=FRAMING_JSON, reconnect=True,
+                 on_event=None, log=print):
+        self.host = host
+        self.port = port
+        self.reconnect = reconnect
+        self.on_event = on_event
+        self.log = log
+        self.streamed = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self._protocol = _Protocol(framing)
+        self._writer = None
+        self._pending = {}
+        self._session = []
+        self._connected = None
+        self._closed = False
+        self._task = None
+
+    @property
+    def connected(self):
+        return self._connected is not None and self._connected.is_set()
+
+    async def connect(self, timeout=CONNECT_TIMEOUT):
+        if self._task is None:
+            self._closed = False
+            self._connected = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout)
+        except asyncio.TimeoutError:
+            raise ConnectionError(f"Could not connect to {self.host}:{self.port}")
+        return self
+
+    async def close(self):
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._drop_connection()
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # ---- requests ----
+    def request(self, msg):
+        """Send a command without waiting; await the result for its reply"""
+        future = asyncio.get_running_loop().create_future()
+        if not self.connected:
+            future.set_exception(ConnectionError("Not connected to the robot server"))
+            return future
+        seq, frame = self._protocol.command(msg)
+        self._pending[seq] = future
+        self._writer.write(frame)
+        return future
+
+    async def call(self, msg, timeout=None):
+        return await asyncio.wait_for(self.request(msg), timeout)
+
+    def configure(self, msg):
+        self._session.append(dict(msg))
+        return self.request(msg)
+
+    def move(self, x, y, z, roll=180, pitch=0, yaw=0, speed=100, **extra):
+        return self.request(_move_command(x, y, z, roll, pitch, yaw, speed, extra))
+
+    def status(self, **extra):
+        return self.request({"status": True, **extra})
+
+    def reset(self, **extra):
+        return self.request({"reset": True, **extra})
+
+    def stream_pose(self, x, y, z, roll=180, pitch=0, yaw=0, speed=100):
+        if not self.connected or self._writer.is_closing():
+            self.dropped += 1
+            return False
+        _, frame = self._protocol.pose(x, y, z, roll, pitch, yaw, speed)
+        self._writer.write(frame)
+        self.streamed += 1
+        return True
+
+    async def drain(self):
+        """Wait until buffered frames have been handed to the OS"""
+        if self._writer is not None:
+            await self._writer.drain()
+
+    # ---- connection task ----
+    async def _run(self):
+        delay = BACKOFF_INITIAL
+        while not self._closed:
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), CONNECT_TIMEOUT)
+            except (OSError, asyncio.TimeoutError) as e:
+                self.log(f"[CLIENT] Connect to {self.host}:{self.port} failed: {e}; "
+                         f"retrying in {delay:.1f}s")
+                if not self.reconnect:
+                    return
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, BACKOFF_MAX)
+                continue
+
+            delay = BACKOFF_INITIAL
+            sock = writer.get_extra_info("socket")
+            if sock is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._writer = writer
+            self._protocol.reset()
+            handshake = self._protocol.handshake()
+            if handshake is not None:
+                writer.write(handshake)
+            for msg in self._session:
+                writer.write(self._protocol.command(msg)[1])
+            self._connected.set()
+            self.log(f"[CLIENT] Connected to {self.host}:{self.port}")
+
+            try:
+                while True:
+                    data = await reader.read(READ_SIZE)
+                    if not data:
+                        raise ConnectionError("server closed the connection")
+                    for frame in self._protocol.frames(data):
+                        self._dispatch(frame)
+            except (OSError, FramingError) as e:
+                if not self._closed:
+                    self.log(f"[CLIENT] Connection lost: {e}")
+            self._drop_connection()
+            if not self.reconnect:
+                return
+            self.reconnects += 1
+
+    def _dispatch(self, frame):
+        future = self._pending.pop(frame.get("seq"), None)
+        if future is not None:
+            if not future.done():
+                future.set_result(frame)
+        elif self.on_event is not None:
+            try:
+                self.on_event(frame)
+            except Exception as e:
+                self.log(f"[CLIENT] on_event failed: {e}")
+
+    def _drop_connection(self):
+        if self._connected is not None:
+            self._connected.clear()
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.close()
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Connection lost before the reply arrived"))
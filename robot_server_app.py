@@ -1,23 +1,70 @@
 import gradio as gr
 import threading
 import time
-import json
-import socket
 from xarm.wrapper import XArmAPI
 import multiprocessing
 
+from admission import AdmissionPolicy
+from arm_pool import ArmPool
+from arm_state import ArmStateCache
+from command_queue import CommandQueue
+from deadband import DeadbandFilter
+from event_log import RingLog, RotatingFileSink
+from metrics import CommandMetrics, addr_label, serve_metrics, timed
+from orientation import nearest_euler
+from planner import Limits, plan_motion
+from profiling import SamplingProfiler
+from reachability import load_index, vet_target
+from recorder import Recorder
+from servo_stream import ServoStreamer
+from target_slot import TargetSlot, follow_targets, make_target
+from tcp_server import CommandServer
+from telemetry import TelemetrySampler
+from trajectory import run_trajectory, shortest_rotations, validate_trajectory
+from udp_pose import UdpPoseListener
+
+
+
+# ---- Arms ----
+# Every configured controller is served by this process; commands pick one
+# with an "arm" field and default to the first entry.
+ARMS = {
+    "arm1": "192.168.1.188",
+}
+
+# ---- Servo streaming settings ----
+SERVO_RATE_HZ = 100
+SERVO_DELAY = 0.03          # jitter buffer delay in seconds
+SERVO_MAX_STEP_MM = 2.0     # per tick
+SERVO_MAX_STEP_DEG = 1.0    # per tick
 
+# ---- Telemetry recording ----
+RECORD_ENABLED = False
+RECORD_DIR = "recordings"
+RECORD_RATE_HZ = 100
 
-arm = None
 
-def setup_arm():
-    global arm
-    arm = XArmAPI("192.168.1.188")
+def setup_arm(unit):
+    arm = XArmAPI(unit.ip)
     arm.connect()
     arm.motion_enable(True)
     arm.set_mode(0)
     arm.set_state(0)
     time.sleep(1)
+    unit.arm = arm
+    # Status and pre-move checks read this instead of querying the controller
+    unit.state = ArmStateCache(arm, log=add_debug)
+    unit.state.start()
+    unit.servo = ServoStreamer(
+        arm, rate_hz=SERVO_RATE_HZ, delay=SERVO_DELAY,
+        max_step_mm=SERVO_MAX_STEP_MM, max_step_deg=SERVO_MAX_STEP_DEG,
+        log=add_debug
+    )
+
+
+def servo_active(arm=None):
+    unit = arms.get(arm)
+    return unit.servo is not None and unit.servo.active
 
 
 # # ---- Arm setup ----
@@ -29,7 +76,8 @@ def setup_arm():
 # time.sleep(1)
 
 
-def init_robot():
+def init_robot(unit):
+    arm = unit.arm
     # Example: move each joint by angle (degrees)
     # joints = [J1, J2, J3, J4, J5, J6]
     arm.set_servo_angle(angle=[0, 0, 0, 0, 0, 0], speed=100, wait=True)
@@ -45,34 +93,47 @@ def init_robot():
     arm.set_state(0)
 
 
+def connected_unit(arm):
+    """The unit for ``arm``; raises ``RuntimeError`` if it is offline"""
+    unit = arms.get(arm)
+    if not unit.connected:
+        raise RuntimeError(f"Arm {unit.name} is not connected")
+    return unit
+
+
 # ---- Improved error handling ----
-def check_and_clear_errors():
+def check_and_clear_errors(arm=None):
     """Check for errors and clear them if present"""
-    code, state = arm.get_state()
-    code2, err_code = arm.get_err_warn_code()
+    unit = connected_unit(arm)
+    snap = unit.state.snapshot()
+    state = snap.state
+    err_code = [snap.error_code, snap.warn_code]
 
     if state > 2:  # Error state (3 or 4)
-        add_debug(f"[ERROR] Arm in error state: {state}, error code: {err_code}")
+        add_debug(f"[ERROR] {unit.name} in error state: {state}, error code: {err_code}",
+                  level="error", arm=unit.name, state=state)
 
         # Clear errors following the documentation
-        arm.clean_error()
+        unit.arm.clean_error()
         time.sleep(0.5)
 
         # Clear warn code if present
-        arm.clean_warn()
+        unit.arm.clean_warn()
         time.sleep(0.1)
 
         # Re-enable motion
-        arm.motion_enable(True)
+        unit.arm.motion_enable(True)
         time.sleep(0.2)
 
         # Reset mode to position control
-        arm.set_mode(0)
+        unit.arm.set_mode(0)
         time.sleep(0.1)
 
         # Set state to ready
-        arm.set_state(0)
+        unit.arm.set_state(0)
         time.sleep(0.5)
+        unit.state.invalidate()
+        command_metrics.recoveries.labels(unit.name, "error_cleared").inc()
 
         return True, f"Cleared error state {state}, error code {err_code}"
 
@@ -80,99 +141,397 @@ def check_and_clear_errors():
 
 
 # ---- Arm functions ----
-def reset_safe_position():
+def reset_safe_position(arm=None):
     """Reset arm to safe position with proper error handling"""
     try:
+        unit = connected_unit(arm)
+        # Don't let a queued teleop target or async move undo the reset
+        if unit.servo.active:
+            unit.servo.stop()
+            unit.state.invalidate()
+        unit.slot.clear()
+        unit.queue.cancel_all()
+        move_filter.reset(unit.name)
+
         # Check and clear any errors first
-        had_error, error_msg = check_and_clear_errors()
+        with timed("recovery"):
+            had_error, error_msg = check_and_clear_errors(unit.name)
         if had_error:
-            add_debug(f"[RESET] {error_msg}")
+            add_debug(f"[RESET] {unit.name}: {error_msg}")
+        command_metrics.recoveries.labels(unit.name, "reset").inc()
 
         # Move to safe position
-        code = arm.set_position(x=250, y=0, z=150, roll=180, pitch=0, yaw=0, speed=50, wait=True)
+        with timed("motion"):
+            code = unit.arm.set_position(x=250, y=0, z=150, roll=180, pitch=0, yaw=0, speed=50, wait=True)
 
         if code != 0:
             return f"⚠️ Reset completed with warning code: {code}"
 
         return "✅ Arm reset successful"
     except Exception as e:
-        add_debug(f"[RESET] Exception: {e}")
+        add_debug(f"[RESET] Exception: {e}", level="error")
         return f"❌ Failed to reset arm: {e}"
 
 
-def safe_set_position(x, y, z, roll=180, pitch=0, yaw=0, speed=100):
-    """Move arm with error checking before and after"""
+def move_from_ui(x, y, z, roll=180, pitch=0, yaw=0, speed=100, arm=None):
+    """Move button: check reach, then move"""
+    (x, y, z), rejection = check_reach(x, y, z, roll, pitch, yaw)
+    if rejection is not None:
+        return f"❌ {rejection['error']}"
+    return safe_set_position(x, y, z, roll, pitch, yaw, speed, arm)
+
+
+def safe_set_position(x, y, z, roll=180, pitch=0, yaw=0, speed=100, arm=None):
+    """Move arm with error checking before and after.
+
+    The target must already have passed check_reach at its entry point.
+    """
     try:
-        # Check state before moving
-        code, state = arm.get_state()
+        unit = connected_unit(arm)
+    except (ValueError, RuntimeError) as e:
+        return f"❌ {e}"
+    if unit.servo.active:
+        return "❌ Servo streaming is active. Stop it before position moves."
+    try:
+        # Check state before moving (cached, no controller round trip)
+        with timed("precheck"):
+            state = unit.state.snapshot().state
         if state > 2:  # In error state
             return f"❌ Arm in error state {state}. Please reset first."
 
-        # Attempt movement
-        ret_code = arm.set_position(
-            x=float(x), y=float(y), z=float(z),
-            roll=float(roll), pitch=float(pitch), yaw=float(yaw),
-            speed=float(speed), wait=True
-        )
+        # One move at a time per arm, whichever thread (executor, queue
+        # worker, target follower) sends it
+        with unit.motion_lock:
+            # Spell the orientation so the controller turns the short way
+            reference = unit.orientation()
+            if reference is not None:
+                roll, pitch, yaw = nearest_euler((float(roll), float(pitch), float(yaw)), reference).tolist()
+
+            # Attempt movement; with wait=True this includes the motion itself
+            unit.target = (float(x), float(y), float(z), float(roll), float(pitch), float(yaw))
+            move_filter.moved(unit.name, unit.target)
+            with timed("motion"):
+                ret_code = unit.arm.set_position(
+                    x=float(x), y=float(y), z=float(z),
+                    roll=float(roll), pitch=float(pitch), yaw=float(yaw),
+                    speed=float(speed), wait=True
+                )
 
         # Check if movement completed successfully
         if ret_code == 0:
             return f"✅ Moved to position: x={x}, y={y}, z={z}"
         else:
+            # The arm may have stopped anywhere short of the target
+            move_filter.reset(unit.name)
             # Check for errors after failed movement
-            code2, err_code = arm.get_err_warn_code()
-            add_debug(f"[MOVE] Failed with code {ret_code}, error: {err_code}")
+            snap = unit.state.snapshot()
+            err_code = [snap.error_code, snap.warn_code]
+            add_debug(f"[MOVE] {unit.name} failed with code {ret_code}, error: {err_code}",
+                      level="warning", arm=unit.name, code=ret_code)
             return f"⚠️ Motion completed with warning code: {ret_code}"
 
     except Exception as e:
-        add_debug(f"[MOVE] Exception: {e}")
+        add_debug(f"[MOVE] Exception: {e}", level="error")
+        move_filter.reset(unit.name)
         # Check if we're now in error state
-        code, state = arm.get_state()
+        state = unit.state.snapshot().state
         if state > 2:
             return f"❌ Motion failed - Arm in error state {state}. Use Reset button."
         return f"❌ Motion failed: {e}"
 
 
-def get_arm_status():
-    """Get detailed arm status for monitoring"""
+def safe_run_trajectory(waypoints, arm=None):
+    """Run a validated trajectory as one blended path with error checking"""
+    try:
+        unit = connected_unit(arm)
+    except (ValueError, RuntimeError) as e:
+        return f"❌ {e}"
     try:
-        code, state = arm.get_state()
-        code2, err_code = arm.get_err_warn_code()
+        with timed("precheck"):
+            state = unit.state.snapshot().state
+        if state > 2:
+            return f"❌ Arm in error state {state}. Please reset first."
+
+        with unit.motion_lock:
+            shortest_rotations(waypoints, unit.orientation())
+            last = waypoints[-1]
+            unit.target = tuple(last[k] for k in ("x", "y", "z", "roll", "pitch", "yaw"))
+            move_filter.moved(unit.name, unit.target)
+            with timed("motion"):
+                ret_code, index, elapsed = run_trajectory(unit.arm, waypoints)
+
+        if ret_code == 0:
+            return f"✅ Trajectory of {len(waypoints)} waypoints done in {elapsed:.2f}s"
+
+        # Don't leave the rest of the path queued on the controller
+        move_filter.reset(unit.name)
+        unit.arm.set_state(4)
+        unit.arm.set_state(0)
+        unit.state.invalidate()
+        snap = unit.state.snapshot()
+        err_code = [snap.error_code, snap.warn_code]
+        add_debug(f"[TRAJ] {unit.name} waypoint {index} failed with code {ret_code}, error: {err_code}",
+                  level="warning", arm=unit.name, code=ret_code, waypoint=index)
+        return f"⚠️ Trajectory stopped at waypoint {index} with code: {ret_code}"
+
+    except Exception as e:
+        add_debug(f"[TRAJ] Exception: {e}", level="error")
+        move_filter.reset(unit.name)
+        state = unit.state.snapshot().state
+        if state > 2:
+            return f"❌ Trajectory failed - Arm in error state {state}. Use Reset button."
+        return f"❌ Trajectory failed: {e}"
+
+
+STATE_DESC = {
+    1: "Ready",
+    2: "Paused",
+    3: "Error (stopped)",
+    4: "Error (collision)"
+}
+
 
-        state_desc = {
-            1: "Ready",
-            2: "Paused",
-            3: "Error (stopped)",
-            4: "Error (collision)"
-        }
+def get_arm_status(arm=None):
+    """Get detailed arm status for monitoring"""
+    try:
+        unit = connected_unit(arm)
+        snap = unit.state.snapshot()
+        state = snap.state
+        err_code = [snap.error_code, snap.warn_code]
+
+        status = ""
+        if len(arms) > 1:
+            # Aggregate line first so one glance covers every cell
+            overview = []
+            for other in arms:
+                if not other.connected:
+                    overview.append(f"{other.name}: offline")
+                else:
+                    other_state = other.state.snapshot().state
+                    overview.append(f"{other.name}: {STATE_DESC.get(other_state, other_state)}")
+            status += "Arms: " + ", ".join(overview) + "\n"
+            status += f"[{unit.name}] "
 
-        status = f"State: {state_desc.get(state, f'Unknown ({state})')}\n"
+        status += f"State: {STATE_DESC.get(state, f'Unknown ({state})')}\n"
         if err_code and err_code[0] != 0:
             status += f"Error Code: {err_code[0]}\n"
         if err_code and err_code[1] != 0:
             status += f"Warning Code: {err_code[1]}\n"
+        if unit.slot.offered:
+            status += (f"Streamed targets: {unit.slot.taken} executed, "
+                       f"{unit.slot.superseded} superseded\n")
+        queue = unit.queue.stats()
+        if queue["current"] or queue["pending"]:
+            status += f"Async moves: running {queue['current']}, {queue['pending']} pending\n"
+        if unit.recorder is not None and unit.recorder.active:
+            status += f"Recording: {unit.recorder.samples} samples to {unit.recorder.path}\n"
+        if unit.servo.active:
+            servo = unit.servo.stats()
+            status += (f"Servo: {servo['rate_hz']} Hz, {servo['overruns']} overruns, "
+                       f"{servo['underruns']} underruns\n")
+        admission = tcp_server.admission_stats()
+        if admission and admission["rejected"]:
+            status += (f"TCP admission: {admission['queued']} queued, "
+                       f"{admission['rejected']} rejected\n")
+        filtered = move_filter.stats()["total"]
+        if filtered["suppressed"]:
+            status += (f"Move filter: {filtered['suppressed']} of "
+                       f"{filtered['suppressed'] + filtered['passed']} streamed moves suppressed\n")
+        if UDP_ENABLED:
+            udp = udp_listener.stats()
+            status += f"UDP poses: {udp['accepted']} accepted, {udp['stale']} stale\n"
 
         return status
     except Exception as e:
         return f"Failed to get status: {e}"
 
 
+def sample_telemetry(fields, arm=None):
+    """Build the requested telemetry fields from the cached arm snapshot"""
+    unit = connected_unit(arm)
+    snap = unit.state.snapshot()
+    sample = {"t": round(time.time(), 3), "arm": unit.name, "state": snap.state,
+              "error": snap.error_code, "warn": snap.warn_code}
+    if "pose" in fields:
+        sample["pose"] = [round(v, 2) for v in snap.pose]
+    if "joints" in fields:
+        sample["joints"] = [round(v, 2) for v in snap.joints]
+    if "command" in fields:
+        sample["command"] = unit.queue.current_id
+    return sample
+
+
 # ---- Shared debug log ----
-debug_log = []
-debug_lock = threading.Lock()
+DEBUG_LOG_CAPACITY = 1000
+DEBUG_LOG_LINES = 100       # shown in the UI
+DEBUG_LOG_FILE = None       # e.g. "robot_server.log" to also keep rotated JSON lines on disk
+
+debug_log = RingLog(
+    DEBUG_LOG_CAPACITY,
+    sink=RotatingFileSink(DEBUG_LOG_FILE) if DEBUG_LOG_FILE else None
+)
 
 
-def add_debug(message):
-    with debug_lock:
-        timestamp = time.strftime("%H:%M:%S")
-        debug_log.append(f"[{timestamp}] {message}")
-        if len(debug_log) > 100:
-            debug_log.pop(0)
+def add_debug(message, level="info", **fields):
+    debug_log.append(message, level=level, **fields)
 
 
 def get_debug_log():
-    with debug_lock:
-        return "\n".join(debug_log)
+    return debug_log.tail_text(DEBUG_LOG_LINES)
+
+
+# ---- Workspace reachability ----
+# Built offline with scripts/build_reachability.py; a missing file disables
+# the check. With REACH_CLAMP an unreachable target is moved to the nearest
+# reachable position (same orientation) instead of being rejected.
+REACH_INDEX_FILE = "workspace_xarm6.npz"
+REACH_CLAMP = False
+
+reach_index = load_index(REACH_INDEX_FILE, log=add_debug)
+
+
+def check_reach(x, y, z, roll=180, pitch=0, yaw=0):
+    """``((x, y, z), rejection)`` for a move target, see reachability.vet_target"""
+    target, rejection = vet_target(reach_index, float(x), float(y), float(z),
+                                   float(roll), float(pitch), float(yaw), clamp=REACH_CLAMP)
+    if rejection is not None:
+        add_debug(f"[REACH] {rejection['error']}", level="warning")
+    elif target != (x, y, z):
+        add_debug(f"[REACH] Clamped ({x}, {y}, {z}) to {target}")
+    return target, rejection
+
+
+def reach_params(params):
+    """Check (and maybe clamp) move keyword arguments in place; returns the
+    rejection reply or ``None``"""
+    (params["x"], params["y"], params["z"]), rejection = check_reach(
+        params["x"], params["y"], params["z"], params["roll"], params["pitch"], params["yaw"])
+    return rejection
+
+
+# ---- Move filter ----
+# Streamed moves (TCP moves, binary poses, UDP), servo targets included, that
+# stay within the deadband of the last target sent to the arm are dropped
+# (deadband.py). Set both to 0
+# to drop only exact duplicates.
+DEADBAND_MM = 0.5
+DEADBAND_DEG = 0.5
+
+move_filter = DeadbandFilter(DEADBAND_MM, DEADBAND_DEG)
+
+
+def filter_move(params, addr, arm):
+    """Reason to drop a streamed move (``"duplicate"``/``"deadband"``), or ``None``"""
+    client = addr_label(addr)
+    reason = move_filter.check(client, arm, (params["x"], params["y"], params["z"],
+                                             params["roll"], params["pitch"], params["yaw"]))
+    if reason is not None:
+        command_metrics.suppressed.labels(reason, client).inc()
+    return reason
+
+
+# ---- Motion planning ----
+# Trajectories sent with "optimize": true get per-segment speed/mvacc from
+# planner.py instead of one constant speed
+PLAN_LIMITS = Limits()
+
+
+def optimize_trajectory(waypoints):
+    """Apply the time-optimal profile to validated waypoints; returns its summary"""
+    timing = plan_motion(waypoints, PLAN_LIMITS)
+    timing.apply(waypoints)
+    summary = timing.describe()
+    add_debug(f"[PLAN] {len(waypoints)} waypoints planned at {summary['duration']}s, "
+              f"{summary['saving']}s ({summary['saving_pct']}%) faster than constant speed")
+    return summary
+
+
+# ---- Arm pool ----
+arms = ArmPool(ARMS, log=add_debug)
+
+# Default for new TCP connections; a client can send {"coalesce": true/false}
+COALESCE_MOVES = False
+
+
+# ---- Streamed targets ----
+# Latest-wins slot per arm shared by coalescing TCP clients and the UDP
+# channel: a new target replaces one that is still waiting instead of
+# queueing behind it.
+def stream_target(target, arm=None):
+    """Hand a streamed target (already through check_reach) to the servo
+    loop, or to the latest-wins slot"""
+    unit = arms.get(arm)
+    if unit.servo is not None and unit.servo.active:
+        unit.target = (target.x, target.y, target.z, target.roll, target.pitch, target.yaw)
+        unit.servo.push(*unit.target, sent=target.sent, source=target.source, arrival=target.received)
+    else:
+        unit.slot.offer(target)
+
+
+def move_to_target(target, arm=None):
+    if servo_active(arm):
+        stream_target(target, arm)
+        return
+    result = safe_set_position(
+        x=target.x, y=target.y, z=target.z,
+        roll=target.roll, pitch=target.pitch, yaw=target.yaw,
+        speed=target.speed, arm=arm
+    )
+    if not result.startswith("✅"):
+        add_debug(f"[MOTION] Target {target.seq} from {target.source}: {result}", level="warning")
+
+
+def start_target_follower(unit):
+    follow_targets(unit.slot, lambda target: move_to_target(target, unit.name), log=add_debug)
+
+
+# ---- Asynchronous moves ----
+# Moves sent with "async": true are acknowledged immediately and run in order
+# on the arm's worker thread; started/completed/failed events are pushed to
+# the client.
+def execute_move(params, arm=None):
+    # Runs long after the "accepted" reply, so it is timed as its own command
+    kind = "trajectory_queued" if "trajectory" in params else "move_queued"
+    return command_metrics.run(kind, _execute_move, params, arm,
+                               failed=lambda result: not result[0])
+
+
+def _execute_move(params, arm):
+    if "trajectory" in params:
+        result = safe_run_trajectory(params["trajectory"], arm=arm)
+    else:
+        result = safe_set_position(**params, arm=arm)
+    return result.startswith("✅"), result
+
+
+def stop_motion(arm=None):
+    unit = connected_unit(arm)
+    unit.arm.set_state(4)
+    unit.state.invalidate()
+
+
+def resume_motion(arm=None):
+    unit = connected_unit(arm)
+    unit.arm.set_state(0)
+    unit.state.invalidate()
+
+
+def start_motion_worker(unit):
+    unit.queue.run()
+
+
+for _unit in arms:
+    _unit.slot = TargetSlot()
+    _unit.queue = CommandQueue(
+        lambda params, name=_unit.name: execute_move(params, name),
+        stop=lambda name=_unit.name: stop_motion(name),
+        resume=lambda name=_unit.name: resume_motion(name),
+        log=add_debug, id_prefix=f"{_unit.name}-c" if len(arms) > 1 else "c",
+        reserved=[f"{name}-c" for name in arms.names()]
+    )
+    # One sampler per arm feeds every client subscribed to it
+    _unit.telemetry = TelemetrySampler(
+        lambda fields, name=_unit.name: sample_telemetry(fields, name), log=add_debug)
 
 
 # ---- TCP server ----
@@ -180,67 +539,342 @@ TCP_HOST = "0.0.0.0"
 TCP_PORT = 5005
 
 
-def tcp_client_handler(conn, addr):
-    add_debug(f"[TCP] Connection from {addr}")
-    with conn:
-        while True:
-            try:
-                data = conn.recv(1024)
-                if not data:
-                    time.sleep(0.1)
-                    continue
-                try:
-                    msg = json.loads(data.decode())
-                except Exception:
-                    add_debug(f"[TCP] Invalid JSON from {addr}: {data}")
-                    conn.sendall(json.dumps({"error": "Invalid JSON"}).encode())
-                    continue
-
-                if msg.get("reset"):
-                    add_debug(f"[TCP] Reset command from {addr}")
-                    result = reset_safe_position()
-                    conn.sendall(json.dumps({"status": result}).encode())
-
-                elif all(k in msg for k in ("x", "y", "z")):
-                    add_debug(f"[TCP] Move command from {addr}: {msg}")
-                    result = safe_set_position(
-                        x=msg["x"], y=msg["y"], z=msg["z"],
-                        roll=msg.get("roll", 180),
-                        pitch=msg.get("pitch", 0),
-                        yaw=msg.get("yaw", 0),
-                        speed=msg.get("speed", 100)
-                    )
-                    conn.sendall(json.dumps({"status": result}).encode())
-
-                elif msg.get("status"):
-                    status = get_arm_status()
-                    conn.sendall(json.dumps({"status": status}).encode())
+TCP_MAX_WORKERS = 4
+
+# ---- Admission control ----
+# Per-client token bucket and queue; over-limit commands get a rejection reply
+TCP_RATE_LIMIT = 100.0     # commands/s per client
+TCP_BURST = 50
+TCP_QUEUE_DEPTH = 32       # queued commands per client
+TCP_CLIENT_WEIGHTS = {}    # host -> share of the arm, e.g. {"192.168.1.20": 2.0}
+
+# ---- Metrics ----
+# Per-stage command latencies and counters; the exporter serves them to
+# Prometheus on http://<host>:METRICS_PORT/metrics
+METRICS_ENABLED = False
+METRICS_PORT = 9105
+
+
+def tcp_reply_failed(reply):
+    """Replies carry the UI status strings; ❌ and ⚠️ mean the command failed"""
+    status = reply.get("status")
+    return "error" in reply or (isinstance(status, str) and status.startswith(("❌", "⚠")))
 
-                else:
-                    add_debug(f"[TCP] Unknown command from {addr}: {msg}")
-                    conn.sendall(json.dumps({"error": "Unknown command"}).encode())
 
-            except Exception as e:
-                add_debug(f"[TCP] Exception in client {addr}: {e}")
-                time.sleep(0.1)
+command_metrics = CommandMetrics(failed=tcp_reply_failed)
+
+
+def is_control_command(msg):
+    """Commands that must never wait behind moves or be rate limited"""
+    return (msg.get("reset") or "cancel" in msg or msg.get("status")
+            or msg.get("unsubscribe") or msg.get("servo") == "stop")
+
+
+def is_connection_setting(msg):
+    """Commands that change how the connection's later frames are handled"""
+    return msg.get("select") or "coalesce" in msg
+
+
+def move_params(msg):
+    """Keyword arguments for safe_set_position from a move command"""
+    return {
+        "x": msg["x"], "y": msg["y"], "z": msg["z"],
+        "roll": msg.get("roll", 180),
+        "pitch": msg.get("pitch", 0),
+        "yaw": msg.get("yaw", 0),
+        "speed": msg.get("speed", 100),
+    }
+
+
+def sent_time(msg):
+    """The sender's timestamp of a streamed move ("t", seconds), if valid"""
+    t = msg.get("t")
+    return float(t) if isinstance(t, (int, float)) and not isinstance(t, bool) and t > 0 else None
+
+
+def addresses(msg, client, unit):
+    try:
+        return arms.route(msg, client) is unit
+    except ValueError:
+        return False
+
+
+def handle_tcp_command(msg, client):
+    """Execute one decoded TCP command and return the reply dict.
+
+    Returns ``None`` for async moves, whose replies are pushed as events,
+    and a future for moves that run on the addressed arm's executor.
+    """
+    addr = client.addr
+    if "cancel" in msg:
+        name, result = arms.cancel(msg["cancel"])
+        add_debug(f"[TCP] Cancel {msg['cancel']} from {addr}: {result}")
+        return {"cancel": str(msg["cancel"]), "arm": name, "result": result}
+
+    elif "coalesce" in msg:
+        client.options["coalesce"] = bool(msg["coalesce"])
+        add_debug(f"[TCP] Coalescing {'on' if msg['coalesce'] else 'off'} for {addr}")
+        return {"coalesce": client.options["coalesce"],
+                "targets": {unit.name: unit.slot.stats() for unit in arms}}
+
+    elif msg.get("unsubscribe"):
+        return {"unsubscribed": any([unit.telemetry.unsubscribe(client) for unit in arms])}
+
+    try:
+        unit = arms.route(msg, client)
+    except ValueError as e:
+        return {"error": str(e), "arms": arms.names()}
+    arm = unit.name
+
+    if msg.get("select"):
+        client.options["arm"] = arm
+        return {"selected": arm}
+
+    elif msg.get("reset"):
+        add_debug(f"[TCP] Reset command for {arm} from {addr}")
+        tcp_server.flush_queued("reset", match=lambda queued, owner: addresses(queued, owner, unit))
+        return {"arm": arm, "status": reset_safe_position(arm)}
+
+    elif "trajectory" in msg:
+        try:
+            waypoints = validate_trajectory(msg["trajectory"], defaults=msg)
+        except ValueError as e:
+            return {"error": str(e)}
+        for index, waypoint in enumerate(waypoints):
+            rejection = reach_params(waypoint)
+            if rejection is not None:
+                return {**rejection, "waypoint": index}
+        planned = optimize_trajectory(waypoints) if msg.get("optimize") else None
+        if msg.get("async"):
+            try:
+                unit.queue.submit({"trajectory": waypoints}, client.push,
+                                  command_id=msg.get("id"), seq=msg["seq"])
+            except ValueError as e:
+                return {"error": str(e)}
+            return None
+        add_debug(f"[TCP] Trajectory of {len(waypoints)} waypoints for {arm} from {addr}")
+        if planned is not None:
+            return unit.submit(lambda: {"arm": arm, "status": safe_run_trajectory(waypoints, arm),
+                                        "planned": planned})
+        return unit.submit(lambda: {"arm": arm, "status": safe_run_trajectory(waypoints, arm)})
+
+    elif all(k in msg for k in ("x", "y", "z")):
+        params = move_params(msg)
+        rejection = reach_params(params)
+        if rejection is not None:
+            return rejection
+        if msg.get("async"):
+            try:
+                unit.queue.submit(params, client.push,
+                                  command_id=msg.get("id"), seq=msg["seq"])
+            except ValueError as e:
+                return {"error": str(e)}
+            return None  # "accepted" is pushed by the queue
+
+        suppressed = filter_move(params, addr, arm)
+        if suppressed is not None:
+            return {"status": "suppressed", "reason": suppressed}
+
+        if servo_active(arm):
+            stream_target(make_target(**params, source=addr, seq=msg["seq"], sent=sent_time(msg)), arm)
+            return {"status": "streamed"}
+
+        if client.options.get("coalesce", COALESCE_MOVES):
+            unit.slot.offer(make_target(**params, source=addr, seq=msg["seq"], sent=sent_time(msg)))
+            return {"status": "queued", "superseded": unit.slot.superseded}
+
+        add_debug(f"[TCP] Move command for {arm} from {addr}: {msg}")
+        return unit.submit(lambda: {"status": safe_set_position(**params, arm=arm)})
+
+    elif msg.get("status"):
+        reply = {"status": get_arm_status(arm), "arm": unit.describe(),
+                 "filter": move_filter.stats(addr_label(addr))}
+        if "arm" not in msg:
+            # The connection's (or default) arm, plus an overview of all of them
+            reply["arms"] = arms.status()
+        return reply
+
+    elif "servo" in msg:
+        return handle_servo_command(msg["servo"], addr, arm)
+
+    elif msg.get("subscribe"):
+        if not unit.connected:
+            return {"error": f"Arm {arm} is not connected"}
+        try:
+            subscription = unit.telemetry.subscribe(
+                client, lambda event: client.push({**event, "arm": arm}, droppable=True),
+                fields=msg.get("fields"), rate=msg.get("rate", 1.0),
+                on_change=msg.get("on_change", False)
+            )
+        except ValueError as e:
+            return {"error": str(e)}
+        add_debug(f"[TCP] {addr} subscribed to {arm} telemetry: {subscription}")
+        return {"subscribed": subscription, "arm": arm}
+
+    add_debug(f"[TCP] Unknown command from {addr}: {msg}", level="warning")
+    return {"error": "Unknown command"}
+
+
+def handle_servo_command(action, addr, arm=None):
+    """{"servo": "start" | "stop" | "stats"}"""
+    unit = arms.get(arm)
+    if unit.servo is None:
+        return {"error": f"Arm {unit.name} is not connected"}
+    if action == "start":
+        add_debug(f"[TCP] Servo streaming on {unit.name} requested by {addr}")
+        unit.slot.clear()
+        unit.queue.cancel_all()
+        try:
+            started = unit.servo.start()
+        except Exception as e:
+            return {"error": f"Could not enter servo mode: {e}"}
+        return {"servo": "started" if started else "already active"}
+    elif action == "stop":
+        stopped = unit.servo.stop()
+        unit.state.invalidate()
+        move_filter.reset(unit.name)
+        return {"servo": "stopped" if stopped else "not active", "stats": unit.servo.stats()}
+    elif action == "stats":
+        return {"servo": unit.servo.stats()}
+    return {"error": f"Unknown servo action: {action}"}
+
+
+def handle_tcp_pose(pose, client):
+    """Execute a binary pose record on the connection's arm.
+
+    Pose records carry no arm field; they go to the arm chosen with
+    {"select": true, "arm": name}, or the default arm.
+    """
+    unit = arms.route({}, client)
+    arm = unit.name
+    # The decoder reuses the record for the next pose; copy what we need
+    params = move_params(pose.as_command())
+    wants_ack = pose.wants_ack
+    sent = pose.timestamp or None
+    rejection = reach_params(params)
+    if rejection is not None:
+        return rejection
+    suppressed = filter_move(params, client.addr, arm)
+    if suppressed is not None:
+        return {"status": "suppressed", "reason": suppressed} if wants_ack else None
+
+    if servo_active(arm):
+        unit.target = tuple(params[k] for k in ("x", "y", "z", "roll", "pitch", "yaw"))
+        unit.servo.push(*unit.target, sent=sent, source=client.addr)
+        return {"status": "streamed"} if wants_ack else None
+
+    if client.options.get("coalesce", COALESCE_MOVES):
+        unit.slot.offer(make_target(**params, source=client.addr, seq=pose.seq, sent=sent))
+        if wants_ack:
+            return {"status": "queued", "superseded": unit.slot.superseded}
+        return None
+
+    def move():
+        result = safe_set_position(**params, arm=arm)
+        if wants_ack or not result.startswith("✅"):
+            return {"status": result}
+        return None
+
+    return unit.submit(move)
+
+
+def tcp_client_closed(client):
+    for unit in arms:
+        unit.telemetry.unsubscribe(client)
 
-    add_debug(f"[TCP] Connection from {addr} closed")
 
 settings_output_visibility = False
 
+tcp_server = CommandServer(handle_tcp_command, TCP_HOST, TCP_PORT,
+                           max_workers=TCP_MAX_WORKERS, log=add_debug,
+                           pose_handler=handle_tcp_pose,
+                           on_disconnect=tcp_client_closed,
+                           admission=AdmissionPolicy(
+                               rate=TCP_RATE_LIMIT, burst=TCP_BURST,
+                               queue_depth=TCP_QUEUE_DEPTH,
+                               weights=TCP_CLIENT_WEIGHTS,
+                               exempt=is_control_command, ordered=is_connection_setting),
+                           metrics=command_metrics)
+
+
 def start_tcp_server():
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server.bind((TCP_HOST, TCP_PORT))
-    server.listen()
-    server.settimeout(1)
-    add_debug(f"[TCP] Server listening on {TCP_HOST}:{TCP_PORT}")
-    while True:
-        try:
-            conn, addr = server.accept()
-            threading.Thread(target=tcp_client_handler, args=(conn, addr), daemon=True).start()
-        except socket.timeout:
-            continue
+    try:
+        tcp_server.run()
+    except OSError as e:
+        add_debug(f"[TCP] Server failed on {TCP_HOST}:{TCP_PORT}: {e}", level="error")
+
+
+# ---- UDP pose channel ----
+# Optional latest-wins target stream for teleoperation; reset/status stay on TCP.
+# Poses go to UDP_ARM (default arm if None).
+UDP_ENABLED = False
+UDP_PORT = 5006
+UDP_ARM = None
+
+def udp_target_filter(target):
+    """Reach check (maybe clamping) and deadband for a UDP target"""
+    (x, y, z), rejection = check_reach(target.x, target.y, target.z,
+                                       target.roll, target.pitch, target.yaw)
+    if rejection is not None:
+        return False
+    target = target._replace(x=x, y=y, z=z)
+    if filter_move(target._asdict(), target.source, arms.get(UDP_ARM).name) is not None:
+        return False
+    return target
+
+
+udp_listener = UdpPoseListener(
+    arms.get(UDP_ARM).slot, TCP_HOST, UDP_PORT, log=add_debug,
+    target_filter=udp_target_filter)
+
+
+def start_udp_listener():
+    try:
+        udp_listener.run()
+    except OSError as e:
+        add_debug(f"[UDP] Listener failed on {TCP_HOST}:{UDP_PORT}: {e}", level="error")
+
+
+def start_arm(unit):
+    """Connect one arm and start its follower and motion worker"""
+    setup_arm(unit)
+    init_robot(unit)
+    if RECORD_ENABLED:
+        unit.recorder = Recorder(
+            unit.state, RECORD_DIR, f"{unit.name}-{time.strftime('%Y%m%d-%H%M%S')}",
+            target=lambda: unit.target, rate_hz=RECORD_RATE_HZ, log=add_debug
+        )
+        unit.recorder.start()
+    threading.Thread(target=start_target_follower, args=(unit,), daemon=True).start()
+    threading.Thread(target=start_motion_worker, args=(unit,), daemon=True).start()
+
+
+# ---- Profiling ----
+# Started from the settings panel; samples only the stacks under these entry
+# points and costs nothing while idle.
+PROFILE_DIR = "profiles"
+PROFILE_DURATION = 30      # s
+
+profiler = SamplingProfiler(
+    [CommandServer._drain_frames, handle_tcp_command, handle_tcp_pose,
+     safe_set_position, safe_run_trajectory, reset_safe_position, get_arm_status],
+    directory=PROFILE_DIR, log=add_debug
+)
+
+
+def start_profile(duration):
+    duration = duration or PROFILE_DURATION
+    if not profiler.start(duration):
+        return f"Profiling already running ({profiler.status()['remaining']} s left)", None
+    return f"Profiling for {duration:g} s. Stop early or wait, then download the report.", None
+
+
+def stop_profile():
+    path = profiler.stop()
+    if path is None:
+        return "No profile has been taken yet", None
+    with open(path, encoding="utf-8") as f:
+        return f.read(), path
 
 
 # ---- Settings functions ----
@@ -279,9 +913,17 @@ with gr.Blocks(css=css, title="xArm Controller") as app:
                     settings_tcp_host = gr.Textbox(label="TCP Host", value=TCP_HOST)
                     settings_tcp_port = gr.Number(label="TCP Port", value=TCP_PORT)
                 with gr.Accordion("Arm Configuration",open=False):
-                    settings_arm_ip = gr.Textbox(label="Arm IP Address", value="192.168.1.188")
+                    settings_arm_ip = gr.Textbox(label="Arm IP Address", value=ARMS[arms.default])
                     settings_default_speed = gr.Number(label="Default Speed", value=50)
 
+                with gr.Accordion("Profiling", open=False):
+                    profile_duration = gr.Number(label="Window (s)", value=PROFILE_DURATION)
+                    with gr.Row():
+                        profile_start_btn = gr.Button("⏺ Start")
+                        profile_stop_btn = gr.Button("⏹ Stop / Report")
+                    profile_output = gr.Textbox(label="Profile", lines=8, interactive=False)
+                    profile_file = gr.File(label="Download report")
+
                 show_debug = gr.Checkbox(label="Show Debug Log", value=False)
 
                 gr.Markdown("---")
@@ -294,12 +936,15 @@ with gr.Blocks(css=css, title="xArm Controller") as app:
                 with gr.Column():
                     gr.Markdown("### Position Control")
 
+                    arm_select = gr.Dropdown(label="Arm", choices=arms.names(),
+                                             value=arms.default, visible=len(arms) > 1)
+
                     x = gr.Slider(label="X", minimum=50, maximum=400, step=1, value=200)
                     y = gr.Slider(label="Y", minimum=-300, maximum=300, step=1, value=0)
                     z = gr.Slider(label="Z", minimum=50, maximum=300, step=1, value=150)
-                    roll = gr.Slider(label="Roll", minimum=0, maximum=360, step=1, value=180)
+                    roll = gr.Slider(label="Roll", minimum=-180, maximum=180, step=1, value=180)
                     pitch = gr.Slider(label="Pitch", minimum=-90, maximum=90, step=1, value=0)
-                    yaw = gr.Slider(label="Yaw", minimum=0, maximum=360, step=1, value=0)
+                    yaw = gr.Slider(label="Yaw", minimum=-180, maximum=180, step=1, value=0)
 
                     speed = gr.Slider(label="Speed", minimum=1, maximum=100, step=1, value=50)
 
@@ -343,19 +988,33 @@ with gr.Blocks(css=css, title="xArm Controller") as app:
         outputs=[settings_output]
     )
 
+    profile_start_btn.click(
+        fn=start_profile,
+        inputs=[profile_duration],
+        outputs=[profile_output, profile_file]
+    )
+
+    profile_stop_btn.click(
+        fn=stop_profile,
+        inputs=None,
+        outputs=[profile_output, profile_file]
+    )
+
     move_btn.click(
-        fn=safe_set_position,
-        inputs=[x, y, z, roll, pitch, yaw, speed],
+        fn=move_from_ui,
+        inputs=[x, y, z, roll, pitch, yaw, speed, arm_select],
         outputs=output
     )
 
     reset_btn.click(
         fn=reset_safe_position,
+        inputs=[arm_select],
         outputs=output
     )
 
     status_btn.click(
         fn=get_arm_status,
+        inputs=[arm_select],
         outputs=output
     )
 
@@ -369,13 +1028,13 @@ with gr.Blocks(css=css, title="xArm Controller") as app:
     move_btn.click(fn=get_debug_log, inputs=None, outputs=debug_output)
     reset_btn.click(fn=get_debug_log, inputs=None, outputs=debug_output)
 
-# ---- Start TCP server in background ----
-threading.Thread(target=start_tcp_server, daemon=True).start()
-
 if __name__ == "__main__":
     multiprocessing.freeze_support()
 
-    setup_arm()
-    init_robot()
+    arms.connect(start_arm)
     threading.Thread(target=start_tcp_server, daemon=True).start()
+    if UDP_ENABLED:
+        threading.Thread(target=start_udp_listener, daemon=True).start()
+    if METRICS_ENABLED:
+        serve_metrics(command_metrics.registry, TCP_HOST, METRICS_PORT, log=add_debug)
     app.launch(server_name="0.0.0.0", server_port=9080)
\ No newline at end of file
@@ -1,8 +1,14 @@
 import os
+import sys
 import time
 import json
+import numpy as np
 from xarm.wrapper import XArmAPI
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from planner import plan_motion
+
 # -----------------------------
 # CONFIGURATION
 # -----------------------------
@@ -71,9 +77,14 @@ def move_to_coords(x, y, z):
     """Moves robot to given coordinates (in mm)."""
     try:
         print(f"Moving robot to: x={x}, y={y}, z={z}")
+        # Keep the tool orientation; only the position comes from the file
+        current = [float(v) for v in arm.position]
+        roll, pitch, yaw = current[3:6]
+        # Fastest speed/acceleration for this hop instead of a fixed speed=50, mvacc=500
+        hop = plan_motion(np.array([current, [x, y, z, roll, pitch, yaw]], dtype=float))
         # Mode 0 = absolute, is_radian=False
-        arm.set_position(x=x, y=y, z=z, roll=0, pitch=0, yaw=0,
-                                speed=50, mvacc=500, wait=False)
+        arm.set_position(x=x, y=y, z=z, roll=roll, pitch=pitch, yaw=yaw,
+                         speed=hop.speed[0], mvacc=hop.accel[0], wait=False)
 
         check_if_safe()
 
@@ -0,0 +1,57 @@
+# bench_haptic_scene.py
+# Per-tick cost of the haptic force field against the 1 ms Haply loop:
+#   python scripts/bench_haptic_scene.py --primitives 8 32 64
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from haptic_scene import HapticScene
+
+
+parser = argparse.ArgumentParser(description="Benchmark HapticScene.evaluate")
+parser.add_argument("--primitives", type=int, nargs="+", default=[6, 24, 60],
+                    help="total primitives, split evenly over the kinds")
+parser.add_argument("--ticks", type=int, default=20000)
+args = parser.parse_args()
+
+
+def build(total, rng):
+    """A scene of random primitives around the Inverse3 workspace (m)"""
+    scene = HapticScene(capacity=max(total, 1))
+    center = np.array([0.0, -0.14, 0.2])
+    builders = [
+        lambda c: scene.add_sphere(c, 0.03, 400),
+        lambda c: scene.add_sphere(c, 0.12, 400, inside=True),
+        lambda c: scene.add_box(c, (0.04, 0.04, 0.04), 300),
+        lambda c: scene.add_box(c, (0.2, 0.2, 0.2), 300, inside=True),
+        lambda c: scene.add_plane(c, rng.normal(size=3), 500),
+        lambda c: scene.add_damping(2.0, c, 0.05),
+    ]
+    for i in range(total):
+        builders[i % len(builders)](center + rng.uniform(-0.08, 0.08, 3))
+    return scene
+
+
+rng = np.random.default_rng(0)
+positions = np.array([0.0, -0.14, 0.2]) + rng.uniform(-0.1, 0.1, (args.ticks, 3))
+velocities = rng.uniform(-0.5, 0.5, (args.ticks, 3))
+position_list, velocity_list = positions.tolist(), velocities.tolist()
+
+for total in args.primitives:
+    scene = build(total, rng)
+    samples = np.empty(args.ticks)
+    for i in range(args.ticks):
+        start = time.perf_counter()
+        # Lists in, list out, like the device API
+        scene.evaluate(position_list[i], velocity_list[i]).tolist()
+        samples[i] = time.perf_counter() - start
+
+    us = samples * 1e6
+    print(f"{total:4d} primitives: mean {us.mean():6.1f} us  p50 {np.percentile(us, 50):6.1f}  "
+          f"p99 {np.percentile(us, 99):6.1f}  max {us.max():7.1f}  "
+          f"saturated {scene.saturated / args.ticks:.0%} of ticks")
@@ -0,0 +1,35 @@
+# build_reachability.py
+# Precompute the workspace reachability index the servers load at startup:
+#   python scripts/build_reachability.py --out workspace_xarm6.npz
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from reachability import DEFAULT_RESOLUTION, DEFAULT_SAMPLES, MODELS, build_index
+
+
+parser = argparse.ArgumentParser(description="Build a workspace reachability index")
+parser.add_argument("--model", default="xarm6", choices=sorted(MODELS))
+parser.add_argument("--out", default="workspace_xarm6.npz")
+parser.add_argument("--resolution", type=float, default=DEFAULT_RESOLUTION, help="mm per cell")
+parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES)
+parser.add_argument("--tcp-offset", type=float, default=0.0,
+                    help="TCP offset along the tool axis in mm, as set on the controller")
+parser.add_argument("--min-z", type=float, default=None,
+                    help="ignore poses below this height (table or floor) in mm")
+args = parser.parse_args()
+
+start = time.perf_counter()
+index = build_index(args.model, resolution=args.resolution, samples=args.samples,
+                    tcp_offset=args.tcp_offset, min_z=args.min_z)
+index.save(args.out)
+
+print(f"Built in {time.perf_counter() - start:.1f}s: {index.describe()}")
+print(f"Saved to {args.out}")
+
+# Spot checks around the reset pose the servers use
+for pose in [(250, 0, 150, 180, 0, 0), (207, 0, 112, 180, 0, 0), (900, 0, 150, 180, 0, 0)]:
+    print(pose, index.check(*pose) or "reachable")
@@ -1,16 +1,22 @@
 # coordinate_sender.py
-import socket
-import json
-import time
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from robot_client import RobotClient
 
 HOST = "10.3.36.6"  # IP of Script A (xArm server)
 PORT = 5005
 
+# One persistent connection for every point; replies are read, not discarded
+client = RobotClient(HOST, PORT)
+
+
 def send_coordinates(x, y, z):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((HOST, PORT))
-        message = json.dumps({"x": x, "y": y, "z": z})
-        s.sendall(message.encode())
+    """Queue a move without waiting; returns a future for the server's reply"""
+    return client.move(x, y, z)
+
 
 # Example usage
 coords_list = [
@@ -19,7 +25,16 @@ coords_list = [
     (300, 0, 120)
 ]
 
-for x, y, z in coords_list:
-    print(f"Sending: x={x}, y={y}, z={z}")
-    send_coordinates(x, y, z)
-    time.sleep(2)  # wait 2 seconds between commands
+if __name__ == "__main__":
+    client.connect()
+
+    # All points are pipelined on the one connection; the server runs them in order
+    pending = []
+    for x, y, z in coords_list:
+        print(f"Sending: x={x}, y={y}, z={z}")
+        pending.append(send_coordinates(x, y, z))
+
+    for (x, y, z), reply in zip(coords_list, pending):
+        print(f"Reply for x={x}, y={y}, z={z}: {reply.result()}")
+
+    client.close()
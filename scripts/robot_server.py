@@ -68,6 +68,9 @@ def safe_set_position(x, y, z, roll=180, pitch=0, yaw=0, speed=50):
 #             except Exception as e:
 #                 print("Invalid data received:", e)
 
+MIN_COMMAND_INTERVAL = 2.0  # seconds between accepted moves per client
+
+
 def client_handler(conn, addr, reset_flag):
     print(f"Connection from {addr}")
     last_processed_time = 0  # Track last processed timestamp
@@ -85,9 +88,14 @@ def client_handler(conn, addr, reset_flag):
 
 
             current_time = time.time()
-            if current_time - last_processed_time < 2:
-                print("Throttling: Skipping message to avoid overload")
-                continue  # Skip processing if within 2 seconds
+            wait = MIN_COMMAND_INTERVAL - (current_time - last_processed_time)
+            if wait > 0:
+                # Tell the sender instead of dropping the command silently
+                print(f"Throttling: rejecting message from {addr}")
+                reply = {"error": "Rate limit exceeded", "rejected": "rate",
+                         "retry_after": round(wait, 3)}
+                conn.sendall((json.dumps(reply) + "\n").encode())
+                continue
 
             try:
                 coords = json.loads(data.decode())
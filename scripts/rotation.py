@@ -1,6 +1,12 @@
 from xarm.wrapper import XArmAPI
+import os
+import sys
 import time
-import math
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import paths
+from trajectory import run_trajectory, shortest_rotations, validate_trajectory
 
 # Connect to the xArm
 arm = XArmAPI("192.168.1.188")
@@ -44,32 +50,27 @@ def reset_position():
     arm.set_position(x=x_safe, y=y_safe, z=z_safe,
                      roll=180, pitch=0, yaw=0, speed=50, wait=True)
 # Rotation function
-def rotate_axis(axis='roll', steps=36, delay=0.2):
+def rotate_axis(axis='roll', steps=36, speed=50):
     """
-    Rotate the end-effector 360° around a single axis.
+    Rotate the end-effector 360° around a single axis as one blended motion.
     axis: 'roll', 'pitch', or 'yaw'
     steps: number of increments (360/steps = degrees per step)
-    delay: seconds between movements
+    speed: sweep speed passed to every waypoint
     """
-    for i in range(steps + 1):
-        proceed_flag = check_if_safe()
-        if proceed_flag:
-            angle = i * (360 / steps)  # current rotation
-            roll, pitch, yaw = 180, 0, 0  # default orientation
-
-            if axis == 'roll':
-                roll = angle
-            elif axis == 'pitch':
-                pitch = angle
-            elif axis == 'yaw':
-                yaw = angle
-            else:
-                raise ValueError("Axis must be 'roll', 'pitch', or 'yaw'")
-
-            arm.set_position(x=x_safe, y=y_safe, z=z_safe,
-                             roll=roll, pitch=pitch, yaw=yaw,
-                             speed=50, wait=True)
-            time.sleep(delay)
+    if not check_if_safe():
+        return
+
+    path = paths.sweep((x_safe, y_safe, z_safe, 180, 0, 0), axis, 0, 360,
+                       angle_step=360 / steps)
+    waypoints = validate_trajectory(paths.to_waypoints(path, speed=speed))
+    # Keeps each 360/steps degree step short even where the angle wraps past 180
+    shortest_rotations(waypoints, arm.position[3:])
+
+    code, index, elapsed = run_trajectory(arm, waypoints)
+    if code != 0:
+        print(f"Sweep stopped at waypoint {index} with code {code}")
+    else:
+        print(f"Sweep around {axis} took {elapsed:.1f}s")
 
 # Rotate around roll
 # print("Rotating around roll...")
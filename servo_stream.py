@@ -0,0 +1,303 @@
+"""Cartesian servo streaming for haptic teleoperation.
+
+Network clients push pose samples into a small :class:`JitterBuffer`. A
+dedicated loop running at a fixed rate replays the buffer a few tens of
+milliseconds behind real time, interpolates between samples, clamps the step
+per tick and sends the result with ``set_servo_cartesian`` (servo mode 1).
+Position mode 0 with ``wait=True`` is far too coarse for this.
+
+Samples are placed on the timeline by the time the client *sent* them when
+it says so (binary pose timestamp or a ``"t"`` field), mapped to the local
+clock by :class:`SenderClock`. The playout delay then absorbs network
+jitter instead of replaying it. Samples without a send time fall back to
+their arrival time.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+
+from orientation import nearest_euler
+
+
+DEFAULT_RATE_HZ = 100
+DEFAULT_DELAY = 0.03        # s of buffering used to ride out network jitter
+DEFAULT_MAX_STEP_MM = 2.0   # per tick, i.e. 200 mm/s at 100 Hz
+DEFAULT_MAX_STEP_DEG = 1.0  # per tick
+MAX_CONSECUTIVE_ERRORS = 50
+CLOCK_WINDOW = 500          # samples the sender clock offset is estimated over
+CLOCK_MAX_JUMP = 1.0        # s; a larger offset rise means the sender clock was reset
+
+
+def wrap_degrees(angle):
+    """Map an angle difference to [-180, 180)"""
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+class SenderClock:
+    """Map one sender's timestamps onto the local monotonic clock.
+
+    ``arrival - sent`` is the clock offset plus the network delay of that
+    sample. Its minimum over the last ``window`` samples is the offset plus
+    the smallest delay, so ``sent + minimum`` is when the sample would have
+    arrived without jitter. The sender's clock can be anything monotonic
+    enough (wall time, its own monotonic clock).
+    """
+
+    def __init__(self, window=CLOCK_WINDOW, max_jump=CLOCK_MAX_JUMP):
+        self.window = window
+        self.max_jump = max_jump
+        self.resets = 0
+        self._count = 0
+        self._offsets = deque()  # (sample number, offset), increasing offsets
+
+    def to_local(self, sent, arrival):
+        offset = arrival - sent
+        offsets = self._offsets
+        if offsets and offset - offsets[0][1] > self.max_jump:
+            offsets.clear()  # sender clock went backwards, e.g. it restarted
+            self.resets += 1
+        self._count += 1
+        # Sliding-window minimum: drop offsets that can never be the minimum again
+        while offsets and offsets[-1][1] >= offset:
+            offsets.pop()
+        offsets.append((self._count, offset))
+        if offsets[0][0] <= self._count - self.window:
+            offsets.popleft()
+        return sent + offsets[0][1]
+
+
+class JitterBuffer:
+    """Timestamped pose samples rendered at a fixed delay behind real time"""
+
+    def __init__(self, delay=DEFAULT_DELAY, maxlen=64, idle_after=0.5):
+        self.delay = delay
+        self.idle_after = idle_after  # s without samples before holding is not an underrun
+        self._samples = deque(maxlen=maxlen)  # (t, x, y, z, roll, pitch, yaw)
+        self._lock = threading.Lock()
+        self._clocks = {}  # source -> SenderClock
+        self.pushed = 0
+        self.late = 0
+        self.underruns = 0
+
+    def push(self, pose, t=None, sent=None, source=None, arrival=None):
+        """Add a sample at local time ``t``.
+
+        Without ``t``, a sample with a sender timestamp ``sent`` is placed
+        by its send time on the ``source``'s clock, otherwise at
+        ``arrival`` (monotonic, default now).
+        """
+        arrival = time.monotonic() if arrival is None else arrival
+        with self._lock:
+            if t is None:
+                if sent:
+                    clock = self._clocks.get(source)
+                    if clock is None:
+                        clock = self._clocks[source] = SenderClock()
+                    t = clock.to_local(sent, arrival)
+                else:
+                    t = arrival
+            if self._samples and t <= self._samples[-1][0]:
+                self.late += 1
+                return
+            if self._samples:
+                # Same spelling as the previous sample so interpolation turns the
+                # short way; normalizing the reference keeps angles bounded
+                reference = [wrap_degrees(a) for a in self._samples[-1][4:7]]
+                pose = (*pose[:3], *nearest_euler(pose[3:6], reference).tolist())
+            self._samples.append((t, *pose))
+            self.pushed += 1
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._clocks.clear()
+
+    def depth(self):
+        with self._lock:
+            return len(self._samples)
+
+    def sample(self, now=None):
+        """Interpolated pose at ``now - delay``, or ``None`` if empty"""
+        now = time.monotonic() if now is None else now
+        render_at = now - self.delay
+        with self._lock:
+            samples = self._samples
+            if not samples:
+                return None
+            # Drop samples that are entirely in the past, keeping one before
+            # the render time to interpolate from
+            while len(samples) > 1 and samples[1][0] <= render_at:
+                samples.popleft()
+            first = samples[0]
+            if render_at <= first[0]:
+                return first[1:]
+            if len(samples) == 1:
+                # Nothing newer arrived in time; hold the last pose
+                if render_at - first[0] < self.idle_after:
+                    self.underruns += 1
+                return first[1:]
+            second = samples[1]
+
+        alpha = (render_at - first[0]) / (second[0] - first[0])
+        position = [a + (b - a) * alpha for a, b in zip(first[1:4], second[1:4])]
+        angles = [a + wrap_degrees(b - a) * alpha for a, b in zip(first[4:7], second[4:7])]
+        return tuple(position + angles)
+
+
+def clamp_step(current, target, max_step_mm, max_step_deg):
+    """Limit the move from ``current`` toward ``target`` for one tick"""
+    delta = [t - c for c, t in zip(current[:3], target[:3])]
+    distance = math.sqrt(sum(d * d for d in delta))
+    if distance > max_step_mm:
+        scale = max_step_mm / distance
+        delta = [d * scale for d in delta]
+    position = [c + d for c, d in zip(current[:3], delta)]
+
+    angles = []
+    for c, t in zip(current[3:], target[3:]):
+        step = wrap_degrees(t - c)
+        step = max(-max_step_deg, min(max_step_deg, step))
+        angles.append(c + step)
+    return tuple(position + angles), distance > max_step_mm
+
+
+class ServoStreamer:
+    """Fixed-rate servo loop between a :class:`JitterBuffer` and the arm"""
+
+    def __init__(self, arm, rate_hz=DEFAULT_RATE_HZ, delay=DEFAULT_DELAY,
+                 max_step_mm=DEFAULT_MAX_STEP_MM, max_step_deg=DEFAULT_MAX_STEP_DEG,
+                 log=print):
+        self.arm = arm
+        self.rate_hz = rate_hz
+        self.max_step_mm = max_step_mm
+        self.max_step_deg = max_step_deg
+        self.log = log
+        self.buffer = JitterBuffer(delay=delay)
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    @property
+    def active(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _reset_stats(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped_ticks = 0
+        self.clamped = 0
+        self.errors = 0
+        self.max_late = 0.0
+        self.max_tick_time = 0.0
+        self._tick_time_total = 0.0
+
+    def push(self, x, y, z, roll, pitch, yaw, sent=None, source=None, arrival=None):
+        """Queue a pose; ``sent`` is the sender's timestamp, if it gave one"""
+        self.buffer.push((float(x), float(y), float(z),
+                          float(roll), float(pitch), float(yaw)),
+                         sent=sent, source=source, arrival=arrival)
+
+    def start(self):
+        """Switch the arm into servo mode and start the loop"""
+        with self._lock:
+            if self.active:
+                return False
+            code, pose = self.arm.get_position(is_radian=False)
+            if code != 0:
+                raise RuntimeError(f"Could not read arm position (code {code})")
+            self.arm.set_mode(1)
+            self.arm.set_state(0)
+            time.sleep(0.1)  # let the controller settle into the new mode
+
+            self.buffer.clear()
+            self._reset_stats()
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(tuple(pose),), name="servo-stream", daemon=True)
+            self._thread.start()
+        self.log(f"[SERVO] Streaming at {self.rate_hz} Hz")
+        return True
+
+    def stop(self):
+        """Stop the loop and return the arm to position mode"""
+        with self._lock:
+            if self._thread is None:
+                return False
+            self._stop.set()
+            if self._thread is not threading.current_thread():
+                self._thread.join(timeout=2)
+            self._thread = None
+            self.arm.set_mode(0)
+            self.arm.set_state(0)
+        self.log(f"[SERVO] Stopped: {self.stats()}")
+        return True
+
+    def _run(self, current):
+        period = 1.0 / self.rate_hz
+        deadline = time.perf_counter()
+        consecutive_errors = 0
+
+        while not self._stop.is_set():
+            deadline += period
+            now = time.perf_counter()
+            late = now - (deadline - period)
+            if late > self.max_late:
+                self.max_late = late
+
+            target = self.buffer.sample()
+            if target is not None:
+                command, clamped = clamp_step(current, target,
+                                              self.max_step_mm, self.max_step_deg)
+                if clamped:
+                    self.clamped += 1
+                # Holding still needs no command
+                code = 0 if command == current else self.arm.set_servo_cartesian(list(command))
+                if code == 0:
+                    current = command
+                    consecutive_errors = 0
+                else:
+                    self.errors += 1
+                    consecutive_errors += 1
+                    if consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
+                        self.log(f"[SERVO] {consecutive_errors} failed ticks "
+                                 f"(last code {code}); leaving servo mode")
+                        threading.Thread(target=self.stop, daemon=True).start()
+                        return
+
+            self.ticks += 1
+            tick_time = time.perf_counter() - now
+            self._tick_time_total += tick_time
+            if tick_time > self.max_tick_time:
+                self.max_tick_time = tick_time
+
+            remaining = deadline - time.perf_counter()
+            if remaining > 0:
+                self._stop.wait(remaining)
+            else:
+                self.overruns += 1
+                # Too far behind to catch up: resynchronise instead of bursting
+                missed = int(-remaining // period)
+                if missed:
+                    self.skipped_ticks += missed
+                    deadline += missed * period
+
+    def stats(self):
+        ticks = self.ticks
+        return {
+            "active": self.active,
+            "rate_hz": self.rate_hz,
+            "ticks": ticks,
+            "overruns": self.overruns,
+            "skipped_ticks": self.skipped_ticks,
+            "underruns": self.buffer.underruns,
+            "late_samples": self.buffer.late,
+            "clamped": self.clamped,
+            "errors": self.errors,
+            "buffer_depth": self.buffer.depth(),
+            "max_late_ms": round(self.max_late * 1000, 3),
+            "max_tick_ms": round(self.max_tick_time * 1000, 3),
+            "mean_tick_ms": round(self._tick_time_total / ticks * 1000, 3) if ticks else 0.0,
+        }
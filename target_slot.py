@@ -0,0 +1,84 @@
+"""Latest-wins target slot between network receivers and the motion code.
+
+Streaming clients only care about the newest target: a pose that arrives
+while an older one is still waiting replaces it instead of queueing behind
+it. The motion side takes whatever is newest once the previous move is done.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+
+Target = namedtuple(
+    "Target",
+    ["x", "y", "z", "roll", "pitch", "yaw", "speed", "source", "seq", "received", "sent"],
+    defaults=[None],  # sent: the sender's timestamp, if it gave one
+)
+
+
+def make_target(x, y, z, roll=180, pitch=0, yaw=0, speed=100, source=None, seq=None, sent=None):
+    return Target(float(x), float(y), float(z),
+                  float(roll), float(pitch), float(yaw), float(speed),
+                  source, seq, time.monotonic(), sent)
+
+
+class TargetSlot:
+    """Single-entry, thread-safe mailbox holding the newest pending target"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._target = None
+        self.offered = 0
+        self.superseded = 0
+        self.taken = 0
+
+    def offer(self, target):
+        """Store ``target``, replacing (and counting) any pending one"""
+        with self._cond:
+            if self._target is not None:
+                self.superseded += 1
+            self._target = target
+            self.offered += 1
+            self._cond.notify()
+
+    def take(self, timeout=None):
+        """Wait for a pending target and remove it; ``None`` on timeout"""
+        with self._cond:
+            if self._target is None:
+                self._cond.wait(timeout)
+            target, self._target = self._target, None
+            if target is not None:
+                self.taken += 1
+            return target
+
+    def clear(self):
+        """Discard the pending target, e.g. when the arm is being reset"""
+        with self._cond:
+            dropped, self._target = self._target, None
+            return dropped
+
+    def stats(self):
+        with self._cond:
+            return {
+                "offered": self.offered,
+                "superseded": self.superseded,
+                "taken": self.taken,
+                "pending": self._target is not None,
+            }
+
+
+def follow_targets(slot, move, stop_event=None, log=print, poll=0.5):
+    """Move toward the newest target in ``slot`` until ``stop_event`` is set.
+
+    ``move(target)`` is expected to block until the arm has finished (or
+    given up on) that target; anything offered in the meantime coalesces.
+    """
+    while stop_event is None or not stop_event.is_set():
+        target = slot.take(timeout=poll)
+        if target is None:
+            continue
+        try:
+            move(target)
+        except Exception as e:
+            log(f"[MOTION] Move to {target.x}, {target.y}, {target.z} failed: {e}")
@@ -0,0 +1,409 @@
+"""asyncio TCP command server shared by ``robot_server_app.py`` and ``main.py``.
+
+Connections are served by a single event loop instead of one thread per
+socket. Commands are decoded with :mod:`framing` and handed to a blocking
+``handler(msg, client)`` that runs on a bounded thread pool, so slow
+``XArmAPI`` calls never stall the loop and the number of OS threads stays
+fixed no matter how many clients are connected.
+
+With an :class:`admission.AdmissionPolicy`, JSON commands are rate limited
+and queued per client and dispatched fairly across clients instead of in
+arrival order; see :mod:`admission`.
+
+With a :class:`metrics.CommandMetrics`, every command is timed through its
+stages (receive, parse, admission, worker, handler, send) into latency
+histograms.
+"""
+
+import asyncio
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from admission import FairScheduler
+from framing import FrameDecoder, FramingError, encode_frame, switch_framing
+from pose_codec import PoseRecord
+
+
+READ_SIZE = 4096
+# Droppable pushes (telemetry) are skipped while a client has this much unsent
+MAX_PUSH_BACKLOG = 256 * 1024
+# Returned by _command when the command waits for admission
+_QUEUED = object()
+
+
+class ClientConnection:
+    """Per-connection state handed to the command handler"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.addr = writer.get_extra_info("peername")
+        self.decoder = FrameDecoder()
+        self.next_seq = 0
+        self.options = {}  # per-connection settings owned by the handler
+        self.dropped = 0
+        self.lane = None  # admission state, when the server has a policy
+        self.received_at = 0.0  # perf_counter() of the last read, for metrics
+        self.loop = asyncio.get_running_loop()
+
+    async def send(self, reply, mode=None):
+        self.writer.write(encode_frame(reply, mode or self.decoder.mode))
+        await self.writer.drain()
+
+    def push_reply(self, reply, mode):
+        """Write a reply from the event loop without waiting for it to drain"""
+        if not self.writer.is_closing():
+            self.writer.write(encode_frame(reply, mode))
+
+    def push(self, event, droppable=False):
+        """Queue an unsolicited frame (e.g. a motion event) from any thread.
+
+        ``droppable`` frames are discarded instead of buffered when the
+        client is not keeping up, so a slow reader cannot grow memory.
+        """
+        try:
+            self.loop.call_soon_threadsafe(self._write_event, event, droppable)
+        except RuntimeError:
+            pass  # event loop already closed
+
+    def _write_event(self, event, droppable):
+        if self.writer.is_closing():
+            return
+        if droppable and self.writer.transport.get_write_buffer_size() > MAX_PUSH_BACKLOG:
+            self.dropped += 1
+            return
+        self.writer.write(encode_frame(event, self.decoder.mode))
+
+
+class CommandServer:
+    """Serve framed JSON commands on ``host:port``.
+
+    ``handler`` is called as ``handler(msg, client)`` on a worker thread and
+    returns the reply dict, or ``None`` if it answers through
+    :meth:`ClientConnection.push` instead. It may also return a
+    ``concurrent.futures.Future`` of either (e.g. a move handed to a per-arm
+    executor); the reply is sent when it resolves without holding a worker.
+    ``msg["seq"]`` is always set. ``max_workers`` bounds how many handler
+    calls (and therefore concurrent controller calls) run at once.
+
+    Binary pose records go to ``pose_handler(pose, client)`` instead, which
+    returns a reply dict or ``None`` to stay silent. Without a pose handler
+    the pose is converted to a JSON move command and only failures (or
+    poses flagged for acknowledgement) are answered.
+
+    ``on_disconnect(client)`` runs on the event loop when a connection ends.
+
+    ``admission`` (an :class:`admission.AdmissionPolicy`) turns on per-client
+    rate limits, queues and fair dispatch for JSON commands. Scheduled
+    commands use at most ``max_workers - 1`` workers so that exempt
+    commands such as reset always find one free.
+
+    ``metrics`` (a :class:`metrics.CommandMetrics`) records per-stage
+    latencies and counts completed, failed and rejected commands.
+
+    Other transports (see :mod:`ws_server`) share the admission policy and
+    metrics: they register their clients with :meth:`attach` and hand
+    commands to :meth:`submit`. Their clients need ``addr``, ``options``,
+    ``push(event, droppable=False)`` and ``push_reply(reply, mode)``.
+    """
+
+    def __init__(self, handler, host, port, max_workers=4, log=print,
+                 pose_handler=None, on_disconnect=None, admission=None, metrics=None):
+        self.handler = handler
+        self.pose_handler = pose_handler
+        self.on_disconnect = on_disconnect
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.log = log
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="tcp-cmd")
+        self.clients = set()
+        self.loop = None
+        self._server = None
+        self.scheduler = FairScheduler(admission) if admission is not None else None
+        self._slots = max(1, max_workers - 1)
+        self._inflight = 0
+        self._idle_waiters = {}  # lane -> future set once it has nothing queued or running
+
+    def run(self):
+        """Blocking entry point, meant to be a thread target"""
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port)
+        self.loop = asyncio.get_running_loop()
+        self.log(f"[TCP] Server listening on {self.host}:{self.port}")
+        async with self._server:
+            await self._server.serve_forever()
+
+    def stop(self):
+        """Close the listening socket; safe to call from any thread"""
+        if self.loop and self._server:
+            self.loop.call_soon_threadsafe(self._server.close)
+
+    def flush_queued(self, reason, match=None):
+        """Reject commands still waiting for admission, e.g. on reset.
+
+        ``match(msg, client)`` limits the flush to some commands. Safe to
+        call from any thread; commands already running finish.
+        """
+        if self.loop and self.scheduler is not None:
+            self.loop.call_soon_threadsafe(self._flush_queued, reason, match)
+
+    def admission_stats(self):
+        if self.scheduler is None:
+            return None
+        return {**self.scheduler.stats(), "inflight": self._inflight}
+
+    def _flush_queued(self, reason, match):
+        keep = None
+        if match is not None:
+            keep = lambda lane, item: not match(item[0], lane.client)
+        for lane, (msg, mode, trace) in self.scheduler.flush(keep):
+            if self.metrics is not None:
+                self.metrics.rejected(lane.client, "flushed")
+            lane.client.push_reply({"error": f"Dropped: {reason}", "rejected": "flushed",
+                                    "seq": msg["seq"]}, mode)
+        self._wake_idle()
+
+    async def _handle_connection(self, reader, writer):
+        client = ClientConnection(reader, writer)
+        self.clients.add(client)
+        if self.scheduler is not None:
+            host = client.addr[0] if isinstance(client.addr, tuple) else client.addr
+            client.lane = self.scheduler.add(client, host)
+        self.log(f"[TCP] Connection from {client.addr}")
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break  # peer closed the connection
+                client.received_at = time.perf_counter()
+                client.decoder.feed(data)
+                if not await self._drain_frames(client):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            self.log(f"[TCP] Connection error from {client.addr}: {e}")
+        except Exception as e:
+            self.log(f"[TCP] Exception in client {client.addr}: {e}")
+        finally:
+            self.clients.discard(client)
+            if self.scheduler is not None:
+                self._detach(client)
+            if self.on_disconnect is not None:
+                try:
+                    self.on_disconnect(client)
+                except Exception as e:
+                    self.log(f"[TCP] Disconnect hook failed for {client.addr}: {e}")
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+            self.log(f"[TCP] Connection from {client.addr} closed")
+
+    async def _drain_frames(self, client):
+        """Handle every complete buffered frame; False means close the socket"""
+        while True:
+            mode = client.decoder.mode
+            parse_start = time.perf_counter()
+            try:
+                msg = client.decoder.next_message()
+            except FramingError as e:
+                self.log(f"[TCP] Bad frame from {client.addr}: {e}")
+                await client.send({"error": str(e)}, mode)
+                if e.fatal:
+                    return False
+                continue
+            if msg is None:
+                return True
+
+            client.next_seq += 1
+            trace = None
+            if self.metrics is not None:
+                trace = self.metrics.start(msg, client, client.received_at, parse_start)
+            if isinstance(msg, PoseRecord):
+                reply = await self._handle_pose(msg, client, trace)
+                if reply is not None:
+                    reply["seq"] = msg.seq
+                    await client.send(reply, mode)
+                self._finish(trace, reply)
+                continue
+
+            seq = msg.setdefault("seq", client.next_seq)
+            if "framing" in msg:
+                reply = switch_framing(client.decoder, msg)
+            else:
+                reply, trace = await self._command(msg, client, mode, trace)
+                if reply is _QUEUED:
+                    continue
+            if reply is not None:
+                reply["seq"] = seq
+                await client.send(reply, mode)
+            self._finish(trace, reply)
+
+    async def _command(self, msg, client, mode, trace):
+        """Admit and run one JSON command.
+
+        Returns ``(reply, trace)``, or ``(_QUEUED, None)`` when the command
+        waits for admission and its reply will be pushed when it has run.
+        """
+        policy = self.scheduler.policy if client.lane is not None else None
+        if policy is not None and policy.is_ordered(msg):
+            # A connection setting applies after the commands sent before it
+            # and before anything read after it
+            await self._lane_idle(client.lane)
+        elif policy is not None and not policy.is_exempt(msg):
+            reply = self.scheduler.admit(client, (msg, mode, trace))
+            if reply is None:
+                self._dispatch()
+                return _QUEUED, None
+            self.log(f"[TCP] Rejected command from {client.addr}: {reply['rejected']}")
+            if self.metrics is not None:
+                self.metrics.rejected(client, reply["rejected"])
+            return reply, None  # counted as a rejection, not a command
+        try:
+            reply = await self._call(self.handler, msg, client, trace=trace)
+        except Exception as e:
+            self.log(f"[TCP] Command from {client.addr} failed: {e}")
+            reply = {"error": str(e)}
+        return reply, trace
+
+    # ---- other transports ----
+    def attach(self, client, host):
+        """Give a client of another transport its admission lane; any thread"""
+        if self.loop is not None and self.scheduler is not None:
+            self.loop.call_soon_threadsafe(self._attach, client, host)
+
+    def _attach(self, client, host):
+        client.lane = self.scheduler.add(client, host)
+
+    def detach(self, client):
+        """Drop the client's lane and anything it still has queued; any thread"""
+        if self.loop is not None and self.scheduler is not None:
+            self.loop.call_soon_threadsafe(self._detach, client)
+
+    def _detach(self, client):
+        self.scheduler.remove(client)
+        self._wake_idle()
+
+    def submit(self, msg, client, received=None, pose=False):
+        """Run a command (or pose record, with ``pose=True``) from another
+        transport like one read from a socket: admitted, timed and counted.
+
+        Safe to call from any thread; returns a ``concurrent.futures.Future``
+        of the reply. It resolves to ``None`` when there is nothing to send
+        now, e.g. a command waiting for admission, whose reply arrives
+        through ``client.push_reply``. Pose records must not be reused
+        before the future resolves.
+        """
+        if self.loop is None:
+            raise RuntimeError("The command server is not running")
+        return asyncio.run_coroutine_threadsafe(self._submit(msg, client, received, pose), self.loop)
+
+    async def _submit(self, msg, client, received, pose):
+        parse_start = time.perf_counter()
+        trace = None
+        if self.metrics is not None:
+            trace = self.metrics.start(msg, client, received or parse_start, parse_start)
+        if pose:
+            reply = await self._handle_pose(msg, client, trace)
+        else:
+            reply, trace = await self._command(msg, client, None, trace)
+            if reply is _QUEUED:
+                return None
+        self._finish(trace, reply)
+        return reply
+
+    async def _lane_idle(self, lane):
+        while (lane.busy or lane.queue) and not lane.closed:
+            waiter = self._idle_waiters.get(lane)
+            if waiter is None:
+                waiter = self._idle_waiters[lane] = asyncio.get_running_loop().create_future()
+            await waiter
+
+    def _wake_idle(self):
+        for lane, waiter in list(self._idle_waiters.items()):
+            if lane.closed or not (lane.busy or lane.queue):
+                del self._idle_waiters[lane]
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    async def _call(self, fn, *args, trace=None, returned=None):
+        """Run a handler on the worker pool, then await a returned future.
+
+        ``returned()``, if given, runs as soon as the handler itself is done,
+        before waiting for the future (e.g. a move on the arm's worker).
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            if trace is None:
+                reply = await loop.run_in_executor(self.executor, fn, *args)
+            else:
+                reply = await loop.run_in_executor(self.executor, trace.call, fn, *args)
+        finally:
+            if returned is not None:
+                returned()
+        if isinstance(reply, Future):
+            reply = await asyncio.wrap_future(reply)
+        if trace is not None:
+            trace.lap("handler")
+        return reply
+
+    def _finish(self, trace, reply):
+        if trace is not None:
+            if reply is not None:
+                trace.lap("send")
+            self.metrics.finish(trace, reply)
+
+    def _dispatch(self):
+        """Start queued commands while scheduler slots are free"""
+        while self._inflight < self._slots:
+            picked = self.scheduler.next()
+            if picked is None:
+                return
+            self._inflight += 1
+            lane, (msg, mode, trace) = picked
+            asyncio.ensure_future(self._run_scheduled(lane, msg, mode, trace))
+
+    async def _run_scheduled(self, lane, msg, mode, trace):
+        client = lane.client
+        start = time.perf_counter()
+        if trace is not None:
+            trace.lap("admission", start)
+
+        # A slot covers the handler, not the arm's work it hands back as a
+        # future: a long move on one arm must not hold up commands for
+        # another. The lane stays busy (one command per client) until the
+        # whole command is done, and is charged for all of it.
+        def release():
+            self._inflight -= 1
+            self._dispatch()
+
+        try:
+            reply = await self._call(self.handler, msg, client, trace=trace, returned=release)
+        except Exception as e:
+            self.log(f"[TCP] Command from {client.addr} failed: {e}")
+            reply = {"error": str(e)}
+        finally:
+            self.scheduler.done(lane, time.perf_counter() - start)
+            self._dispatch()
+            self._wake_idle()
+        if reply is not None and not lane.closed:
+            reply["seq"] = msg["seq"]
+            client.push_reply(reply, mode)
+        self._finish(trace, reply)
+
+    async def _handle_pose(self, pose, client, trace=None):
+        try:
+            if self.pose_handler is not None:
+                return await self._call(self.pose_handler, pose, client, trace=trace)
+            reply = await self._call(self.handler, pose.as_command(), client, trace=trace)
+        except Exception as e:
+            self.log(f"[TCP] Pose from {client.addr} failed: {e}")
+            return {"error": str(e)}
+        if reply is not None and (pose.wants_ack or "error" in reply):
+            return reply
+        return None
@@ -0,0 +1,151 @@
+"""Shared telemetry sampler with per-client push subscriptions.
+
+One sampler thread reads the arm at the highest rate any subscriber asked
+for and fans the result out, so N dashboards cost the controller the same
+as one. Each subscriber picks its fields and rate, and may ask to be sent
+an update only when something changed.
+"""
+
+import threading
+import time
+
+
+FIELDS = ("state", "error", "warn", "pose", "joints", "command")
+DEFAULT_FIELDS = ("state", "error", "warn")
+MAX_RATE_HZ = 50.0
+MIN_RATE_HZ = 0.1
+
+
+class Subscription:
+    __slots__ = ("key", "push", "fields", "interval", "on_change", "next_due", "last")
+
+    def __init__(self, key, push, fields, rate, on_change):
+        self.key = key
+        self.push = push
+        self.fields = fields
+        self.interval = 1.0 / rate
+        self.on_change = on_change
+        self.next_due = 0.0
+        self.last = None
+
+    def describe(self):
+        return {
+            "fields": list(self.fields),
+            "rate": round(1.0 / self.interval, 3),
+            "on_change": self.on_change,
+        }
+
+
+class TelemetrySampler:
+    """Sample the arm for all subscribers from a single thread.
+
+    ``sample(fields)`` returns a dict with (at least) the requested fields;
+    it is only asked for fields some subscriber wants.
+    """
+
+    def __init__(self, sample, max_rate=MAX_RATE_HZ, log=print):
+        self.sample = sample
+        self.max_rate = max_rate
+        self.log = log
+        self.samples = 0
+        self.pushed = 0
+        self._subs = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._latest = None
+
+    def subscribe(self, key, push, fields=None, rate=1.0, on_change=False):
+        """Register (or replace) the subscription for ``key``.
+
+        Raises ``ValueError`` for unknown fields or a bad rate.
+        """
+        fields = tuple(fields) if fields else DEFAULT_FIELDS
+        unknown = [f for f in fields if f not in FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown telemetry fields: {', '.join(map(str, unknown))}")
+        try:
+            rate = float(rate)
+        except (TypeError, ValueError):
+            raise ValueError("rate must be a number")
+        if not MIN_RATE_HZ <= rate <= self.max_rate:
+            raise ValueError(f"rate must be between {MIN_RATE_HZ} and {self.max_rate} Hz")
+
+        sub = Subscription(key, push, fields, rate, bool(on_change))
+        with self._cond:
+            self._subs[key] = sub
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="telemetry", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return sub.describe()
+
+    def unsubscribe(self, key):
+        with self._cond:
+            return self._subs.pop(key, None) is not None
+
+    def subscriber_count(self):
+        with self._cond:
+            return len(self._subs)
+
+    def latest(self):
+        """Most recent sample, shared with anything else that wants it"""
+        return self._latest
+
+    def _run(self):
+        failing = False
+        next_tick = time.monotonic()
+        while True:
+            with self._cond:
+                while not self._subs:
+                    self._cond.wait()
+                    next_tick = time.monotonic()
+                subs = list(self._subs.values())
+
+            # Tick at the fastest subscriber's rate; slower subscribers are
+            # served from the same samples, so cost doesn't grow with clients
+            tick = min(s.interval for s in subs)
+            now = time.monotonic()
+            due = [s for s in subs if s.next_due <= now + tick * 0.9]
+            if due:
+                fields = set()
+                for sub in due:
+                    fields.update(sub.fields)
+                try:
+                    sample = self.sample(fields)
+                    failing = False
+                except Exception as e:
+                    if not failing:
+                        self.log(f"[TELEMETRY] Sampling failed: {e}")
+                    failing = True
+                    sample = None
+
+                if sample is not None:
+                    self.samples += 1
+                    self._latest = sample
+                    for sub in due:
+                        self._deliver(sub, sample, now)
+                else:
+                    for sub in due:
+                        sub.next_due = now + sub.interval
+
+            next_tick += tick
+            if next_tick < now:
+                next_tick = now + tick
+            with self._cond:
+                # Wake early if a new subscriber arrives
+                self._cond.wait(max(0.0, next_tick - time.monotonic()))
+
+    def _deliver(self, sub, sample, now):
+        sub.next_due += sub.interval
+        if sub.next_due <= now - sub.interval:
+            sub.next_due = now + sub.interval  # fell behind; don't burst
+        values = {f: sample.get(f) for f in sub.fields}
+        if sub.on_change and values == sub.last:
+            return
+        sub.last = values
+        try:
+            sub.push({"event": "telemetry", "t": sample.get("t"), **values})
+            self.pushed += 1
+        except Exception as e:
+            self.log(f"[TELEMETRY] Push to {sub.key} failed: {e}")
@@ -0,0 +1,117 @@
+"""Batch trajectories streamed to the controller as one blended path.
+
+A trajectory is a list of poses with optional per-waypoint ``speed``,
+``mvacc`` and blend ``radius``. Top-level values in the command act as
+defaults::
+
+    {"trajectory": [{"x": 250, "y": 0, "z": 150},
+                    {"x": 300, "y": 0, "z": 150, "radius": 10}],
+     "speed": 100, "radius": 5}
+
+The whole list is validated before anything moves. Every waypoint except
+the last is queued with ``wait=False`` and a blend radius (``DEFAULT_RADIUS``
+unless given), so the controller joins the segments with arcs (MoveArcLine)
+instead of stopping at each corner. The final waypoint waits for the motion
+to finish. :func:`shortest_rotations` re-spells the orientations first, so
+that no segment turns the long way round.
+"""
+
+import math
+import time
+
+from orientation import continuous_euler
+
+
+MAX_WAYPOINTS = 1000
+MAX_SPEED = 1000       # mm/s
+MAX_MVACC = 50000      # mm/s^2
+MAX_RADIUS = 500       # mm
+DEFAULT_RADIUS = 5     # mm, used when a waypoint gives no radius
+
+POSE_DEFAULTS = {"roll": 180, "pitch": 0, "yaw": 0}
+SEGMENT_KEYS = ("speed", "mvacc", "radius")
+
+
+def _number(value, name, index):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Waypoint {index}: {name} must be a number")
+    if not math.isfinite(value):
+        raise ValueError(f"Waypoint {index}: {name} must be finite")
+    return value
+
+
+def validate_trajectory(points, defaults=None, max_waypoints=MAX_WAYPOINTS):
+    """Normalise and check a trajectory command.
+
+    Returns a list of waypoint dicts with every pose field filled in.
+    Raises ``ValueError`` naming the first bad waypoint.
+    """
+    if not isinstance(points, list) or not points:
+        raise ValueError("Trajectory must be a non-empty list of waypoints")
+    if len(points) > max_waypoints:
+        raise ValueError(f"Trajectory has {len(points)} waypoints, limit is {max_waypoints}")
+
+    defaults = defaults or {}
+    waypoints = []
+    for i, point in enumerate(points):
+        if not isinstance(point, dict):
+            raise ValueError(f"Waypoint {i}: expected an object")
+        missing = [k for k in ("x", "y", "z") if k not in point]
+        if missing:
+            raise ValueError(f"Waypoint {i}: missing {', '.join(missing)}")
+
+        waypoint = {}
+        for key in ("x", "y", "z", "roll", "pitch", "yaw"):
+            value = point.get(key, defaults.get(key, POSE_DEFAULTS.get(key)))
+            waypoint[key] = _number(value, key, i)
+        for key in SEGMENT_KEYS:
+            value = point.get(key, defaults.get(key))
+            waypoint[key] = None if value is None else _number(value, key, i)
+
+        if waypoint["speed"] is not None and not 0 < waypoint["speed"] <= MAX_SPEED:
+            raise ValueError(f"Waypoint {i}: speed must be in (0, {MAX_SPEED}]")
+        if waypoint["mvacc"] is not None and not 0 < waypoint["mvacc"] <= MAX_MVACC:
+            raise ValueError(f"Waypoint {i}: mvacc must be in (0, {MAX_MVACC}]")
+        if waypoint["radius"] is not None and not 0 <= waypoint["radius"] <= MAX_RADIUS:
+            raise ValueError(f"Waypoint {i}: radius must be in [0, {MAX_RADIUS}]")
+        waypoints.append(waypoint)
+
+    return waypoints
+
+
+def shortest_rotations(waypoints, reference=None):
+    """Re-spell waypoint roll/pitch/yaw in place so that every step, from
+    ``reference`` (e.g. the arm's orientation) and then waypoint to waypoint,
+    is the shortest rotation. Returns ``waypoints``."""
+    if not waypoints:
+        return waypoints
+    angles = continuous_euler([[wp["roll"], wp["pitch"], wp["yaw"]] for wp in waypoints], reference)
+    for wp, (roll, pitch, yaw) in zip(waypoints, angles.tolist()):
+        wp["roll"], wp["pitch"], wp["yaw"] = roll, pitch, yaw
+    return waypoints
+
+
+def run_trajectory(arm, waypoints, timeout=None):
+    """Queue ``waypoints`` on the controller and wait for the path to finish.
+
+    Returns ``(code, index, elapsed)``: the first non-zero ``set_position``
+    code (0 on success), the waypoint it came from, and the wall time spent.
+    """
+    start = time.perf_counter()
+    last = len(waypoints) - 1
+    for i, wp in enumerate(waypoints):
+        kwargs = {k: wp[k] for k in ("x", "y", "z", "roll", "pitch", "yaw")}
+        for key in ("speed", "mvacc"):
+            if wp[key] is not None:
+                kwargs[key] = wp[key]
+        if i < last:
+            # A radius >= 0 makes the controller blend into the next segment
+            kwargs["radius"] = wp["radius"] if wp["radius"] is not None else DEFAULT_RADIUS
+            code = arm.set_position(**kwargs, wait=False)
+        else:
+            code = arm.set_position(**kwargs, wait=True, timeout=timeout)
+        if code != 0:
+            return code, i, time.perf_counter() - start
+    return 0, last, time.perf_counter() - start
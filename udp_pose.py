@@ -0,0 +1,114 @@
+"""UDP pose channel for teleoperation targets.
+
+Datagrams carry exactly one absolute ``P`` record from :mod:`pose_codec`.
+Late or duplicate datagrams (by per-sender sequence number) are dropped and
+accepted poses go into a :class:`target_slot.TargetSlot`, so a lost packet
+never delays the ones behind it. Control commands stay on TCP.
+"""
+
+import socket
+import time
+
+from pose_codec import POSE_STRUCT, RECORD_POSE, PoseDecoder, RecordError
+from target_slot import make_target
+
+
+SEQ_MODULUS = 1 << 32
+# A sender that has been quiet this long may restart its sequence numbers
+SENDER_TIMEOUT = 2.0
+
+
+def seq_is_newer(seq, last):
+    """Serial-number comparison (RFC 1982) for wrapping uint32 sequences"""
+    diff = (seq - last) % SEQ_MODULUS
+    return 0 < diff < SEQ_MODULUS // 2
+
+
+class UdpPoseListener:
+    """Receive pose datagrams on ``host:port`` and offer them to ``slot``.
+
+    ``target_filter(target)``, if given, can turn a valid pose away by
+    returning ``False`` (counted as ``filtered``), e.g. a deadband filter,
+    or return a replacement target, e.g. one clamped into reach.
+    """
+
+    def __init__(self, slot, host, port, log=print, sender_timeout=SENDER_TIMEOUT,
+                 target_filter=None):
+        self.slot = slot
+        self.target_filter = target_filter
+        self.host = host
+        self.port = port
+        self.log = log
+        self.sender_timeout = sender_timeout
+        self.received = 0
+        self.accepted = 0
+        self.stale = 0
+        self.invalid = 0
+        self.filtered = 0
+        self._senders = {}  # addr -> (last seq, monotonic time of last packet)
+        self._decoder = PoseDecoder()
+        self._running = False
+
+    def accept(self, data, addr, now=None):
+        """Validate one datagram; returns True if it became the new target"""
+        now = time.monotonic() if now is None else now
+        self.received += 1
+        if len(data) != POSE_STRUCT.size or data[0] != RECORD_POSE:
+            self.invalid += 1
+            return False
+        try:
+            pose, _ = self._decoder.decode(data)
+        except RecordError:
+            self.invalid += 1
+            return False
+
+        last = self._senders.get(addr)
+        if last is not None and now - last[1] < self.sender_timeout \
+                and not seq_is_newer(pose.seq, last[0]):
+            self.stale += 1
+            return False
+        self._senders[addr] = (pose.seq, now)
+
+        target = make_target(pose.x, pose.y, pose.z, pose.roll, pose.pitch, pose.yaw, pose.speed,
+                             source=addr, seq=pose.seq, sent=pose.timestamp or None)
+        if self.target_filter is not None:
+            checked = self.target_filter(target)
+            if not checked:
+                self.filtered += 1
+                return False
+            if checked is not True:
+                target = checked
+        self.accepted += 1
+        self.slot.offer(target)
+        return True
+
+    def run(self):
+        """Blocking receive loop, meant to be a thread target"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.settimeout(1)
+        self._running = True
+        self.log(f"[UDP] Pose listener on {self.host}:{self.port}")
+        with sock:
+            while self._running:
+                try:
+                    data, addr = sock.recvfrom(512)
+                except socket.timeout:
+                    continue
+                except OSError as e:
+                    self.log(f"[UDP] Receive error: {e}")
+                    continue
+                self.accept(data, addr)
+
+    def stop(self):
+        self._running = False
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "accepted": self.accepted,
+            "stale": self.stale,
+            "invalid": self.invalid,
+            "filtered": self.filtered,
+        }
@@ -0,0 +1,202 @@
+"""WebSocket sessions that speak the TCP command protocol.
+
+:func:`serve_websocket` runs one ASGI WebSocket (e.g. FastAPI's) against
+the same ``handler(msg, client)`` the TCP server uses. Text frames carry one
+JSON command each. Binary frames carry packed pose records
+(:mod:`pose_codec`). Replies and pushed events go back as JSON text
+frames.
+
+Every session has a single writer task. Replies and command events queue
+without limit, since they are bounded by what the client sent. Telemetry
+(``droppable`` pushes) is kept in a short buffer that only holds the newest
+frames: a browser tab that can't keep up sees fewer, fresher samples
+instead of growing server memory or falling further behind.
+
+Given the TCP server (``server=``), commands and poses go through its
+admission policy and metrics like TCP traffic, so a browser session is
+rate limited, scheduled fairly and timed alongside the TCP clients.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from pose_codec import PoseDecoder, PoseRecord, RecordError
+
+
+MAX_TELEMETRY_BACKLOG = 4  # newest droppable frames kept per client
+
+
+class WebSocketClient:
+    """Per-session state, with the interface handlers expect from a client"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, websocket, max_backlog=MAX_TELEMETRY_BACKLOG):
+        self.websocket = websocket
+        peer = getattr(websocket, "client", None)
+        self.addr = ("ws", f"{peer.host}:{peer.port}" if peer else next(self._ids))
+        self.host = peer.host if peer else "ws"  # admission groups lanes by host
+        self.options = {}
+        self.next_seq = 0
+        self.lane = None  # admission state, when served through the TCP server
+        self.dropped = 0
+        self.sent = 0
+        self.loop = asyncio.get_running_loop()
+        self._replies = deque()
+        self._telemetry = deque(maxlen=max_backlog)
+        self._wake = asyncio.Event()
+        self._closed = False
+
+    def push(self, event, droppable=False):
+        """Queue a frame from any thread; ``droppable`` ones may be superseded"""
+        try:
+            self.loop.call_soon_threadsafe(self._enqueue, event, droppable)
+        except RuntimeError:
+            pass  # event loop already closed
+
+    def push_reply(self, reply, mode=None):
+        """Send the reply of a command that waited for admission"""
+        self.push(reply)
+
+    def _enqueue(self, event, droppable):
+        if self._closed:
+            return
+        if droppable:
+            if len(self._telemetry) == self._telemetry.maxlen:
+                self.dropped += 1  # the oldest frame falls off the deque
+            self._telemetry.append(event)
+        else:
+            self._replies.append(event)
+        self._wake.set()
+
+    async def run_writer(self):
+        """Send queued frames until the session closes; replies go first"""
+        while not self._closed:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._replies or self._telemetry:
+                queue = self._replies if self._replies else self._telemetry
+                frame = queue.popleft()
+                await self.websocket.send_text(json.dumps(frame, separators=(",", ":")))
+                self.sent += 1
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+
+
+async def serve_websocket(websocket, handler, executor, pose_handler=None,
+                          on_connect=None, on_disconnect=None, log=print, server=None):
+    """Accept ``websocket`` and serve commands until the peer goes away.
+
+    ``handler`` and ``pose_handler`` are the same callables given to
+    :class:`tcp_server.CommandServer`; they run on ``executor`` and may
+    return a ``concurrent.futures.Future``. With ``server`` (a running
+    ``CommandServer``) they run through :meth:`CommandServer.submit`
+    instead, admitted and timed like TCP commands. ``on_connect(client)``
+    runs once the session is open, ``on_disconnect(client)`` when it ends.
+    """
+    await websocket.accept()
+    client = WebSocketClient(websocket)
+    loop = asyncio.get_running_loop()
+    poses = PoseDecoder()
+    writer = asyncio.ensure_future(client.run_writer())
+    log(f"[WS] Connection from {client.addr}")
+
+    async def call(fn, *args):
+        if server is not None:
+            pose = fn is pose_handler
+            return await asyncio.wrap_future(server.submit(*args, received=received, pose=pose))
+        reply = await loop.run_in_executor(executor, fn, *args)
+        if isinstance(reply, Future):
+            reply = await asyncio.wrap_future(reply)
+        return reply
+
+    if server is not None:
+        server.attach(client, client.host)
+    try:
+        if on_connect is not None:
+            on_connect(client)
+        while True:
+            message = await websocket.receive()
+            received = time.perf_counter()
+            if message["type"] == "websocket.disconnect":
+                break
+            if writer.done():
+                break  # sending failed, the socket is gone
+
+            if message.get("bytes") is not None:
+                await _handle_poses(client, message["bytes"], poses, pose_handler, call, log)
+                continue
+
+            client.next_seq += 1
+            try:
+                msg = json.loads(message.get("text") or "")
+                if not isinstance(msg, dict):
+                    raise ValueError("expected a JSON object")
+            except ValueError as e:
+                client.push({"error": f"Invalid command: {e}", "seq": client.next_seq})
+                continue
+
+            seq = msg.setdefault("seq", client.next_seq)
+            if "framing" in msg:
+                reply = {"error": "WebSocket messages are already framed"}
+            else:
+                try:
+                    reply = await call(handler, msg, client)
+                except Exception as e:
+                    log(f"[WS] Command from {client.addr} failed: {e}")
+                    reply = {"error": str(e)}
+            if reply is not None:
+                reply["seq"] = seq
+                client.push(reply)
+    except Exception as e:
+        log(f"[WS] Exception in client {client.addr}: {e}")
+    finally:
+        client.close()
+        writer.cancel()
+        if server is not None:
+            server.detach(client)
+        if on_disconnect is not None:
+            try:
+                on_disconnect(client)
+            except Exception as e:
+                log(f"[WS] Disconnect hook failed for {client.addr}: {e}")
+        log(f"[WS] Connection from {client.addr} closed "
+            f"({client.sent} frames sent, {client.dropped} telemetry dropped)")
+
+
+async def _handle_poses(client, data, poses, pose_handler, call, log):
+    """Run every pose record in one binary frame"""
+    pos = 0
+    while pos < len(data):
+        try:
+            record, size = poses.decode(data, pos)
+        except RecordError as e:
+            client.push({"error": str(e)})
+            if not e.size:
+                return
+            pos += e.size
+            continue
+        if record is None:
+            client.push({"error": "Truncated pose record"})
+            return
+        pos += size
+        if not isinstance(record, PoseRecord):
+            client.push({"error": "Send JSON commands as text frames"})
+            continue
+        if pose_handler is None:
+            client.push({"error": "Binary poses are not supported"})
+            continue
+        try:
+            reply = await call(pose_handler, record, client)
+        except Exception as e:
+            log(f"[WS] Pose from {client.addr} failed: {e}")
+            reply = {"error": str(e)}
+        if reply is not None:
+            reply["seq"] = record.seq
+            client.push(reply)